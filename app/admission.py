@@ -0,0 +1,262 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+
+from .config_agent import agent_settings
+from .metrics import registry
+
+ADMISSION_REJECTIONS = registry.counter(
+    "rag_admission_rejected_total",
+    "Pedidos recusados pelo controlo de admissão (rate_limit_client, "
+    "rate_limit_session, queue_full, queue_timeout).",
+    ["reason"],
+)
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "rag_admission_wait_seconds", "Tempo de espera na fila até o pedido ser admitido."
+)
+
+
+class Rejected(Exception):
+    """Pedido recusado: 429 (limite de pedidos) ou 503 (serviço saturado), com Retry-After."""
+
+    def __init__(self, reason: str, status_code: int, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """`rate` pedidos por segundo, com rajadas até `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Gasta um pedido; devolve 0 se havia, senão os segundos até haver."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Ticket:
+    """Vaga ocupada por um pedido admitido; `release` pode ser chamado mais de uma vez."""
+
+    __slots__ = ("_controller", "_start", "_released")
+
+    def __init__(self, controller: "AdmissionController") -> None:
+        self._controller = controller
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(time.monotonic() - self._start)
+
+
+class AdmissionController:
+    """
+    Controlo de admissão dos endpoints de chat (por processo / worker).
+
+    - no máximo `max_in_flight` pedidos em curso;
+    - os seguintes esperam numa fila FIFO de até `queue_size` pedidos, cada um
+      com um prazo de `queue_timeout_ms`; fila cheia ou prazo esgotado = 503;
+    - limites de pedidos por sessão e por cliente (token bucket); excedidos = 429;
+    - as respostas recusadas levam `Retry-After`, estimado pela duração média
+      dos pedidos e pela fila atual.
+
+    Assim os pedidos admitidos não ficam atrás de uma fila sem fim: a latência
+    é limitada pelo prazo da fila mais o tempo de serviço.
+    Todo o estado é usado só a partir do event loop (sem locks).
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        queue_size: int = 64,
+        queue_timeout_ms: float = 2000,
+        session_per_min: float = 20,
+        session_burst: int = 5,
+        client_per_min: float = 120,
+        client_burst: int = 20,
+        max_tracked: int = 10000,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout_ms / 1000.0
+        self.session_rate = (session_per_min / 60.0, session_burst)
+        self.client_rate = (client_per_min / 60.0, client_burst)
+        self.max_tracked = max_tracked
+
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._sessions: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # Média móvel da duração dos pedidos (para o Retry-After)
+        self._service_time = 1.0
+        self.admitted = 0
+
+    # ------------------------------------------------------------------
+    # Limites de pedidos
+    # ------------------------------------------------------------------
+    def _take(self, table: OrderedDict, key: str, rate: tuple) -> float:
+        per_second, burst = rate
+        if per_second <= 0:
+            return 0.0
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = TokenBucket(per_second, max(burst, 1))
+            while len(table) > self.max_tracked:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return bucket.take()
+
+    def _check_rates(self, session_id: Optional[str], client: Optional[str]) -> None:
+        if client:
+            wait = self._take(self._clients, client, self.client_rate)
+            if wait:
+                ADMISSION_REJECTIONS.inc(reason="rate_limit_client")
+                raise Rejected("rate_limit_client", 429, wait)
+        if session_id:
+            wait = self._take(self._sessions, session_id, self.session_rate)
+            if wait:
+                ADMISSION_REJECTIONS.inc(reason="rate_limit_session")
+                raise Rejected("rate_limit_session", 429, wait)
+
+    # ------------------------------------------------------------------
+    # Vagas e fila
+    # ------------------------------------------------------------------
+    def retry_after(self) -> float:
+        """Segundos estimados até a fila atual ser escoada."""
+        pending = len(self._waiters) + 1
+        return self._service_time * pending / max(self.max_in_flight, 1)
+
+    async def acquire(self, session_id: Optional[str] = None, client: Optional[str] = None) -> Ticket:
+        """Ocupa uma vaga (esperando na fila, se preciso) ou levanta `Rejected`."""
+        free = self.in_flight < self.max_in_flight and not self._waiters
+        # Fila cheia: recusa antes de gastar o limite de pedidos do cliente
+        if not free and len(self._waiters) >= self.queue_size:
+            ADMISSION_REJECTIONS.inc(reason="queue_full")
+            raise Rejected("queue_full", 503, self.retry_after())
+
+        self._check_rates(session_id, client)
+
+        if free:
+            self.in_flight += 1
+            self.admitted += 1
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            return Ticket(self)
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Cliente desistiu: se a vaga já lhe tinha sido passada, devolvê-la
+            if waiter.done() and not waiter.cancelled():
+                self._release(None)
+            else:
+                waiter.cancel()
+                self._discard(waiter)
+            raise
+        if not waiter.done():
+            waiter.cancel()
+            self._discard(waiter)
+            ADMISSION_REJECTIONS.inc(reason="queue_timeout")
+            raise Rejected("queue_timeout", 503, self.retry_after())
+
+        # A vaga foi passada diretamente por quem a libertou (in_flight já a conta)
+        self.admitted += 1
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+        return Ticket(self)
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self, held: Optional[float]) -> None:
+        if held is not None:
+            self._service_time = 0.9 * self._service_time + 0.1 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def admit(self, session_id: Optional[str] = None, client: Optional[str] = None):
+        ticket = await self.acquire(session_id, client)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": len(self._waiters),
+            "queue_size": self.queue_size,
+            "queue_timeout_ms": round(self.queue_timeout * 1000),
+            "avg_service_seconds": round(self._service_time, 3),
+            "admitted": self.admitted,
+            "rejected": {
+                reason: ADMISSION_REJECTIONS.value(reason=reason)
+                for reason in ("rate_limit_client", "rate_limit_session", "queue_full", "queue_timeout")
+            },
+        }
+
+
+def client_id(request) -> str:
+    """Identifica o cliente: 1.º endereço do X-Forwarded-For (atrás de um proxy de confiança) ou o IP."""
+    if agent_settings.ADMISSION_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else ""
+
+
+def _build_admission_controller() -> Optional[AdmissionController]:
+    if not agent_settings.ADMISSION_ENABLED:
+        return None
+    return AdmissionController(
+        max_in_flight=agent_settings.ADMISSION_MAX_IN_FLIGHT,
+        queue_size=agent_settings.ADMISSION_QUEUE_SIZE,
+        queue_timeout_ms=agent_settings.ADMISSION_QUEUE_TIMEOUT_MS,
+        session_per_min=agent_settings.RATE_LIMIT_SESSION_PER_MIN,
+        session_burst=agent_settings.RATE_LIMIT_SESSION_BURST,
+        client_per_min=agent_settings.RATE_LIMIT_CLIENT_PER_MIN,
+        client_burst=agent_settings.RATE_LIMIT_CLIENT_BURST,
+    )
+
+
+# Instância única por processo (None se o controlo de admissão estiver desligado)
+admission_controller = _build_admission_controller()
+
+registry.gauge(
+    "rag_admission_in_flight", "Pedidos de chat em curso.",
+    function=lambda: admission_controller.in_flight if admission_controller else 0,
+)
+registry.gauge(
+    "rag_admission_queue_depth", "Pedidos de chat à espera de vaga.",
+    function=lambda: len(admission_controller._waiters) if admission_controller else 0,
+)
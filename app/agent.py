@@ -1,59 +1,84 @@
-from typing import Dict, List
-
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_openai import ChatOpenAI
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
 
+from .answer_cache import answer_cache
 from .config_agent import agent_settings
+from .context import count_tokens, pack_context, pack_history
+from .faq import FAQ_LOOKUPS, faq_table
+from .llm import llm_client
+from .memory import session_store
+from .metrics import record_context_tokens, record_retrieval, stage
+from .rerank import reranker
+from .retrieval import chunk_id, retrieval_engine
+from .startup import startup_report
+from .summary import history_summarizer
+
 
-# Histórico simples em memória: session_id -> lista de linhas de texto
-_sessions_history: Dict[str, List[str]] = {}
+def _format_turns(turns) -> List[str]:
+    lines = []
+    for question, answer in turns:
+        lines.append(f"Utilizador: {question}")
+        lines.append(f"Assistente: {answer}")
+    return lines
 
 
 def get_history(session_id: str) -> List[str]:
-    """Devolve (ou cria) o histórico de conversa para uma sessão."""
-    if session_id not in _sessions_history:
-        _sessions_history[session_id] = []
-    return _sessions_history[session_id]
+    """Devolve o histórico de conversa de uma sessão (linhas de texto)."""
+    return _format_turns(session_store.all_turns(session_id))
 
 
 def update_history(session_id: str, user_question: str, answer: str) -> None:
     """Atualiza o histórico de uma sessão com a nova pergunta e resposta."""
-    history = get_history(session_id)
-    history.append(f"Utilizador: {user_question}")
-    history.append(f"Assistente: {answer}")
+    with stage("memory"):
+        session_store.add_turn(session_id, user_question, answer)
+    if history_summarizer is not None:
+        # O resumo é atualizado numa thread, depois da resposta
+        history_summarizer.schedule(session_id)
 
 
 def get_retriever():
     """
-    Carrega a base vetorial Chroma do disco e devolve um retriever.
-    Usa o MESMO modelo de embeddings que foi usado na ingestão (Hugging Face).
+    Devolve um retriever sobre a base vetorial Chroma.
+    O modelo de embeddings e a coleção são carregados uma única vez por
+    processo pelo `retrieval_engine` (o MESMO modelo usado na ingestão).
     """
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-
-    vectordb = Chroma(
-        persist_directory=agent_settings.CHROMA_DB_DIR,
-        embedding_function=embeddings,
-        collection_name=agent_settings.COLLECTION_NAME,
-    )
-
-    return vectordb.as_retriever(search_kwargs={"k": 4})
+    return retrieval_engine.get_retriever()
 
 
 def build_prompt(session_id: str, question: str, docs) -> str:
     """Constrói o prompt manual para o LLM (contexto + histórico + pergunta)."""
-    history_lines = get_history(session_id)
-    last_history = "\n".join(history_lines[-8:]) if history_lines else "Sem histórico prévio."
-
-    context_parts = []
-    for i, doc in enumerate(docs[:4]):
-        text = doc.page_content
-        if len(text) > 800:
-            text = text[:800] + "..."
-        context_parts.append(f"[Trecho {i+1}]\n{text}")
+    with stage("prompt"):
+        return _build_prompt(session_id, question, docs)
+
+
+def _history(session_id: str) -> str:
+    """
+    Histórico para o prompt. Só as últimas interações são lidas do store (não
+    o histórico todo), e só entram as que cabem no orçamento de tokens. Com
+    HISTORY_MODE=summary, as interações já resumidas ficam só no resumo.
+    """
+    summary = ""
+    if history_summarizer is not None:
+        summary, turns = history_summarizer.prompt_history(session_id)
+        turns = turns[-agent_settings.HISTORY_PROMPT_TURNS:]
+    else:
+        turns = session_store.recent_turns(session_id, agent_settings.HISTORY_PROMPT_TURNS)
+    history_lines = _format_turns(pack_history(turns, agent_settings.HISTORY_TOKEN_BUDGET))
+    if summary:
+        history_lines.insert(0, f"Resumo da conversa anterior: {summary}")
+    return "\n".join(history_lines) if history_lines else "Sem histórico prévio."
+
+
+def _build_prompt(session_id: str, question: str, docs) -> str:
+    last_history = _history(session_id)
+
+    # Trechos sobrepostos da mesma página fundidos, por relevância, até ao orçamento
+    blocks = pack_context(docs, agent_settings.CONTEXT_TOKEN_BUDGET)
+    context_parts = [
+        f"[Trecho {i+1}] ({block.citation()})\n{block.text}" for i, block in enumerate(blocks)
+    ]
     context = "\n\n".join(context_parts) if context_parts else "Nenhum trecho encontrado."
+    record_context_tokens(count_tokens(context), count_tokens(last_history))
 
     prompt = f"""
 Tu és um assistente de auditoria especializado em normas ISSAI / auditoria de desempenho.
@@ -71,32 +96,253 @@ Instruções:
 - Responde em português claro.
 - Usa apenas os trechos recuperados como base factual.
 - Refere a norma (ex.: ISSAI 300) quando fizer sentido.
+- Cita as fontes no formato indicado em cada trecho (ficheiro, p. N).
 """
     return prompt
 
 
+def describe_sources(docs) -> List[dict]:
+    """
+    Proveniência dos trechos recuperados, para o cliente citar as fontes:
+    ficheiro, página (0-based e rótulo impresso) e deslocamento na página.
+    """
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "page_label": doc.metadata.get("page_label"),
+            "char_offset": doc.metadata.get("start_index"),
+        }
+        for doc in docs
+    ]
+
+
+def check_api_key() -> None:
+    if not llm_client.configured():
+        raise ValueError("OPENAI_API_KEY não definido. Verifica o .env.")
+
+
+def rerank_candidates() -> Optional[int]:
+    """Candidatos a pedir à pesquisa: mais do que k quando há reordenação."""
+    return agent_settings.RERANK_CANDIDATES if reranker is not None else None
+
+
+def rerank(question: str, docs: list) -> list:
+    """Reordena os candidatos com o cross-encoder (se ativo) e fica com os k melhores."""
+    if reranker is None:
+        return docs
+    return reranker.rerank(question, docs, agent_settings.RETRIEVER_K)
+
+
+def lookup_faq(question: str) -> Optional[dict]:
+    """Resultado pré-calculado da pergunta (tabela de perguntas frequentes), se existir."""
+    if faq_table is None:
+        return None
+    with stage("faq"):
+        return faq_table.lookup(question)
+
+
+def _faq_answer(session_id: str, entry: Optional[dict]) -> Optional[str]:
+    """
+    Resposta pré-calculada. Como foi gerada sem histórico, só serve sessões
+    sem histórico (a mesma regra da cache de respostas).
+    """
+    if entry is None or not entry.get("answer") or session_store.has_history(session_id):
+        return None
+    FAQ_LOOKUPS.inc(result="answer")
+    return entry["answer"]
+
+
+def _faq_docs(entry: dict) -> Optional[list]:
+    """Trechos pré-calculados, lidos pelos ids (None se algum já não existir)."""
+    with stage("search"):
+        by_id = retrieval_engine.get_documents(entry["chunk_ids"])
+    if len(by_id) != len(entry["chunk_ids"]):
+        return None
+    FAQ_LOOKUPS.inc(result="retrieval")
+    return [by_id[id_] for id_ in entry["chunk_ids"]]
+
+
+def _retrieve(
+    question: str, entry: Optional[dict] = None, embedding: Optional[List[float]] = None
+) -> Tuple[List[float], list]:
+    """
+    Embedding da pergunta + pesquisa (+ reordenação opcional).
+    O embedding é reutilizado pela cache de respostas. Para as perguntas
+    frequentes (`entry`) a pesquisa e a reordenação já estão feitas.
+    """
+    if embedding is None:
+        with stage("embed"):
+            embedding = retrieval_engine.embed_query(question)
+
+    docs = _faq_docs(entry) if entry is not None else None
+    if docs is None:
+        with stage("search"):
+            hits = retrieval_engine.search(question, embedding, rerank_candidates())
+        docs = rerank(question, [doc for doc, _ in hits])
+    record_retrieval(len(docs))
+    return embedding, docs
+
+
+async def _aretrieve(question: str, entry: Optional[dict] = None) -> Tuple[List[float], list]:
+    """
+    Versão assíncrona de `_retrieve`: o embedding espera pelo lote do
+    micro-batcher sem ocupar uma thread; a pesquisa (CPU) corre numa thread.
+    """
+    with stage("embed"):
+        embedding = await retrieval_engine.aembed_query(question)
+    return await asyncio.to_thread(_retrieve, question, entry, embedding)
+
+
+def _lookup_cache(
+    session_id: str, question: str, embedding: List[float], docs
+) -> Optional[str]:
+    """
+    As respostas em cache foram geradas sem histórico, por isso só servem
+    sessões sem histórico (uma pergunta de seguimento depende da conversa).
+    """
+    if not agent_settings.ANSWER_CACHE_ENABLED or session_store.has_history(session_id):
+        return None
+    with stage("cache"):
+        return answer_cache.lookup(question, embedding, [chunk_id(d) for d in docs])
+
+
+def _store_cache(
+    session_id: str, question: str, embedding: List[float], docs, answer: str
+) -> None:
+    """
+    Só guardamos respostas geradas sem histórico: nesse caso a resposta depende
+    apenas da pergunta e dos trechos recuperados, e pode servir outras sessões.
+    """
+    if not agent_settings.ANSWER_CACHE_ENABLED or session_store.has_history(session_id):
+        return
+    answer_cache.store(question, embedding, [chunk_id(d) for d in docs], answer)
+
+
 def ask_agent(session_id: str, question: str) -> str:
     """RAG + memória + chamada ao LLM."""
-    if not agent_settings.OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY não definido. Verifica o .env.")
+    check_api_key()
+
+    # 0) Pergunta frequente com resposta pré-calculada
+    entry = lookup_faq(question)
+    answer = _faq_answer(session_id, entry)
+    if answer is not None:
+        update_history(session_id, question, answer)
+        startup_report.mark("first_answer")
+        return answer
 
     # 1) Recuperar trechos relevantes
-    retriever = get_retriever()
-    docs = retriever.invoke(question)
+    embedding, docs = _retrieve(question, entry)
 
-    # 2) Construir prompt
-    prompt = build_prompt(session_id, question, docs)
+    # 2) Cache de respostas (pergunta igual ou quase igual, mesmos trechos)
+    answer = _lookup_cache(session_id, question, embedding, docs)
+    if answer is None:
+        # 3) Construir prompt
+        prompt = build_prompt(session_id, question, docs)
 
-    # 3) Chamar LLM
-    llm = ChatOpenAI(
-        api_key=agent_settings.OPENAI_API_KEY,
-        model=agent_settings.OPENAI_MODEL,
-        temperature=0.2,
-    )
-    response = llm.invoke(prompt)
-    answer = response.content
+        # 4) Chamar LLM (cliente partilhado, com pool de ligações)
+        answer = llm_client.invoke(prompt, session_id=session_id).content
+        _store_cache(session_id, question, embedding, docs, answer)
 
-    # 4) Atualizar memória
+    # 5) Atualizar memória
     update_history(session_id, question, answer)
+    startup_report.mark("first_answer")
 
     return answer
+
+
+async def aanswer_with_docs(
+    session_id: str,
+    question: str,
+    embedding: List[float],
+    docs,
+    remember: bool = True,
+) -> str:
+    """
+    Gera a resposta a partir de trechos já recuperados (cache + prompt + LLM).
+    Com `remember=False` o histórico da sessão não é atualizado.
+    """
+    answer = _lookup_cache(session_id, question, embedding, docs)
+    if answer is None:
+        prompt = build_prompt(session_id, question, docs)
+        response = await llm_client.ainvoke(prompt, session_id=session_id or None)
+        answer = response.content
+        _store_cache(session_id, question, embedding, docs, answer)
+
+    if remember:
+        update_history(session_id, question, answer)
+    startup_report.mark("first_answer")
+    return answer
+
+
+async def aask_agent(session_id: str, question: str) -> str:
+    """
+    Versão assíncrona de `ask_agent`.
+    O embedding passa pelo micro-batcher, a pesquisa (CPU) corre numa thread
+    e a chamada ao LLM é I/O assíncrono,
+    por isso não ocupa uma thread do threadpool enquanto espera pela OpenAI.
+    """
+    check_api_key()
+
+    entry = lookup_faq(question)
+    answer = _faq_answer(session_id, entry)
+    if answer is not None:
+        update_history(session_id, question, answer)
+        startup_report.mark("first_answer")
+        return answer
+
+    embedding, docs = await _aretrieve(question, entry)
+    return await aanswer_with_docs(session_id, question, embedding, docs)
+
+
+async def astream_agent(session_id: str, question: str) -> AsyncIterator[dict]:
+    """
+    Versão em streaming de `ask_agent`.
+
+    Produz eventos (dicts):
+    - {"type": "metadata", "sources": [...], "cached": bool}  logo após a recuperação
+    - {"type": "token", "content": "..."}     à medida que o LLM gera texto
+    - {"type": "done"}                        no fim da resposta
+
+    A memória só é atualizada se a resposta chegar ao fim.
+    """
+    check_api_key()
+
+    entry = lookup_faq(question)
+    answer = _faq_answer(session_id, entry)
+    if answer is not None:
+        yield {"type": "metadata", "sources": entry["sources"], "cached": True}
+        yield {"type": "token", "content": answer}
+        update_history(session_id, question, answer)
+        startup_report.mark("first_answer")
+        yield {"type": "done"}
+        return
+
+    embedding, docs = await _aretrieve(question, entry)
+    cached = _lookup_cache(session_id, question, embedding, docs)
+    yield {
+        "type": "metadata",
+        "sources": describe_sources(docs),
+        "cached": cached is not None,
+    }
+
+    if cached is not None:
+        yield {"type": "token", "content": cached}
+        update_history(session_id, question, cached)
+        startup_report.mark("first_answer")
+        yield {"type": "done"}
+        return
+
+    prompt = build_prompt(session_id, question, docs)
+
+    parts: List[str] = []
+    async for piece in llm_client.astream(prompt, session_id=session_id):
+        if piece.content:
+            parts.append(piece.content)
+            yield {"type": "token", "content": piece.content}
+
+    answer = "".join(parts)
+    _store_cache(session_id, question, embedding, docs, answer)
+    update_history(session_id, question, answer)
+    startup_report.mark("first_answer")
+    yield {"type": "done"}
@@ -0,0 +1,375 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .config_agent import agent_settings
+from .metrics import registry
+
+ANSWER_CACHE_HITS = registry.counter(
+    "answer_cache_hits_total", "Respostas servidas pela cache (exact, similar).", ["kind"]
+)
+ANSWER_CACHE_MISSES = registry.counter(
+    "answer_cache_misses_total", "Perguntas sem resposta em cache."
+)
+
+
+def normalize_question(text: str) -> str:
+    """Normaliza uma pergunta: Unicode NFKC, minúsculas, espaços e pontuação final."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.;:")
+
+
+def question_key(text: str) -> str:
+    """Chave estável (sha1) da pergunta normalizada."""
+    return hashlib.sha1(normalize_question(text).encode("utf-8")).hexdigest()
+
+
+class CacheEntry:
+    """Resposta guardada em cache, com o contexto que a validou."""
+
+    __slots__ = ("key", "question", "embedding", "chunk_ids", "answer", "created_at")
+
+    def __init__(
+        self,
+        key: str,
+        question: str,
+        embedding: np.ndarray,
+        chunk_ids: frozenset,
+        answer: str,
+        created_at: float,
+    ) -> None:
+        self.key = key
+        self.question = question
+        self.embedding = embedding
+        self.chunk_ids = chunk_ids
+        self.answer = answer
+        self.created_at = created_at
+
+    @property
+    def size_bytes(self) -> int:
+        """Estimativa (por baixo) da memória ocupada pela entrada."""
+        return (
+            len(self.answer.encode("utf-8"))
+            + len(self.question.encode("utf-8"))
+            + self.embedding.nbytes
+            + sum(len(c) for c in self.chunk_ids)
+            + 200
+        )
+
+
+class AnswerCacheBackend:
+    """Interface para persistir as entradas da cache fora do processo."""
+
+    def load(self, limit: int) -> Iterable[CacheEntry]:
+        raise NotImplementedError
+
+    def save(self, entry: CacheEntry) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class SQLiteAnswerCacheBackend(AnswerCacheBackend):
+    """Backend em SQLite: a cache sobrevive a reinícios do processo."""
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                chunk_ids TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Ligação nova depois de um fork (gunicorn --preload): não se partilha entre processos
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def load(self, limit: int) -> Iterable[CacheEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, question, embedding, chunk_ids, answer, created_at "
+                "FROM answers ORDER BY created_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        # Mais antigas primeiro, para a ordem LRU ficar correta
+        for key, question, embedding, chunk_ids, answer, created_at in reversed(rows):
+            yield CacheEntry(
+                key=key,
+                question=question,
+                embedding=np.frombuffer(embedding, dtype=np.float32),
+                chunk_ids=frozenset(json.loads(chunk_ids)),
+                answer=answer,
+                created_at=created_at,
+            )
+
+    def save(self, entry: CacheEntry) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    entry.key,
+                    entry.question,
+                    entry.embedding.astype(np.float32).tobytes(),
+                    json.dumps(sorted(entry.chunk_ids)),
+                    entry.answer,
+                    entry.created_at,
+                ),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+
+class AnswerCache:
+    """
+    Cache semântica de respostas do LLM.
+
+    - procura exata pela pergunta normalizada;
+    - procura aproximada por similaridade de cosseno do embedding da pergunta;
+    - uma entrada só é válida se os trechos que a originaram continuarem a ser
+      devolvidos pelo retriever (uma nova ingestão muda os ids e invalida-a);
+    - despejo LRU + TTL, limitado em número de entradas e em bytes;
+    - backend opcional (ex.: SQLite) para persistir entre reinícios.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 24 * 3600,
+        similarity_threshold: float = 0.95,
+        min_chunk_overlap: float = 1.0,
+        backend: Optional[AnswerCacheBackend] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.min_chunk_overlap = min_chunk_overlap
+        self.backend = backend
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        # Matriz (n x dim) dos embeddings, reconstruída só quando a cache muda
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+
+        self.hits_exact = 0
+        self.hits_similar = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+        if backend is not None:
+            for entry in backend.load(max_entries):
+                if not self._expired(entry, time.time()):
+                    self._insert(entry)
+            self._evict()
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def lookup(
+        self, question: str, embedding: Sequence[float], chunk_ids: Iterable[str]
+    ) -> Optional[str]:
+        """Devolve a resposta em cache para a pergunta, ou None."""
+        key = question_key(question)
+        current = frozenset(chunk_ids)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry, now) or not self._valid(entry, current):
+                    # O índice mudou (ou expirou): esta entrada já não serve
+                    self._remove(key, persist=True)
+                    self.invalidations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits_exact += 1
+                    ANSWER_CACHE_HITS.inc(kind="exact")
+                    return entry.answer
+
+            # Candidatas acima do limiar, da mais semelhante para a menos
+            for entry in self._nearest(np.asarray(embedding, dtype=np.float32)):
+                if self._expired(entry, now):
+                    self._remove(entry.key, persist=True)
+                    self.evictions += 1
+                    continue
+                if not self._valid(entry, current):
+                    # É de outra pergunta, com outros trechos: não serve, mas continua válida
+                    continue
+                self._entries.move_to_end(entry.key)
+                self.hits_similar += 1
+                ANSWER_CACHE_HITS.inc(kind="similar")
+                return entry.answer
+
+            self.misses += 1
+            ANSWER_CACHE_MISSES.inc()
+            return None
+
+    def store(
+        self,
+        question: str,
+        embedding: Sequence[float],
+        chunk_ids: Iterable[str],
+        answer: str,
+    ) -> None:
+        """Guarda uma resposta, associada aos trechos usados para a gerar."""
+        entry = CacheEntry(
+            key=question_key(question),
+            question=question,
+            embedding=np.asarray(embedding, dtype=np.float32),
+            chunk_ids=frozenset(chunk_ids),
+            answer=answer,
+            created_at=time.time(),
+        )
+        with self._lock:
+            if entry.key in self._entries:
+                self._remove(entry.key, persist=False)
+            self._insert(entry)
+            self._evict()
+        if self.backend is not None:
+            self.backend.save(entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix = None
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits_exact + self.hits_similar + self.misses
+        hits = self.hits_exact + self.hits_similar
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits_exact": self.hits_exact,
+            "hits_similar": self.hits_similar,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+    # ------------------------------------------------------------------
+    # Internos (chamados com o lock adquirido)
+    # ------------------------------------------------------------------
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _valid(self, entry: CacheEntry, current: frozenset) -> bool:
+        if not entry.chunk_ids:
+            return not current
+        overlap = len(entry.chunk_ids & current) / len(entry.chunk_ids)
+        return overlap >= self.min_chunk_overlap
+
+    def _nearest(self, embedding: np.ndarray) -> List[CacheEntry]:
+        if not self._entries or self.similarity_threshold > 1.0:
+            return []
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            matrix = np.stack([self._entries[k].embedding for k in self._matrix_keys])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.maximum(norms, 1e-12)
+
+        norm = np.linalg.norm(embedding)
+        if norm == 0 or embedding.shape[0] != self._matrix.shape[1]:
+            return []
+        scores = self._matrix @ (embedding / norm)
+        above = np.flatnonzero(scores >= self.similarity_threshold)
+        keys = [self._matrix_keys[i] for i in above[np.argsort(-scores[above])]]
+        return [self._entries[k] for k in keys if k in self._entries]
+
+    def _insert(self, entry: CacheEntry) -> None:
+        self._entries[entry.key] = entry
+        self._bytes += entry.size_bytes
+        self._matrix = None
+
+    def _remove(self, key: str, persist: bool) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size_bytes
+        self._matrix = None
+        if persist and self.backend is not None:
+            self.backend.delete(key)
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if self._expired(e, now)]:
+            self._remove(key, persist=True)
+            self.evictions += 1
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key = next(iter(self._entries))
+            self._remove(key, persist=True)
+            self.evictions += 1
+
+
+def _build_answer_cache() -> AnswerCache:
+    backend: Optional[AnswerCacheBackend] = None
+    if agent_settings.ANSWER_CACHE_BACKEND == "sqlite":
+        backend = SQLiteAnswerCacheBackend(agent_settings.ANSWER_CACHE_PATH)
+    return AnswerCache(
+        max_entries=agent_settings.ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes=agent_settings.ANSWER_CACHE_MAX_MB * 1024 * 1024,
+        ttl_seconds=agent_settings.ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold=agent_settings.ANSWER_CACHE_SIMILARITY,
+        min_chunk_overlap=agent_settings.ANSWER_CACHE_MIN_CHUNK_OVERLAP,
+        backend=backend,
+    )
+
+
+# Instância única por processo
+answer_cache = _build_answer_cache()
+
+registry.gauge(
+    "answer_cache_entries", "Entradas na cache de respostas.",
+    function=lambda: len(answer_cache._entries),
+)
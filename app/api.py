@@ -1,9 +1,29 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from .startup import startup_report  # primeiro: referência dos tempos de arranque
+
+import hmac
+import json
+import time
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
 from .schemas import ChatRequest, ChatResponse
-from .agent import ask_agent
+from .admission import Rejected, admission_controller, client_id
+from .agent import aask_agent, astream_agent
+from .answer_cache import answer_cache
+from .batch import aask_batch, parse_jsonl
+from .embedding_cache import query_embedding_cache
+from .faq import faq_table
+from .index_reload import index_status, index_watcher, reload_index
+from .llm import llm_client
+from .memory import session_store
+from .metrics import REQUEST_SECONDS, registry, start_trace
+from .rerank import reranker
+from .summary import history_summarizer
 from .config_agent import agent_settings
+from .retrieval import retrieval_engine
 
 app = FastAPI(
     title="Assistente de Auditoria",
@@ -20,6 +40,88 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
 )
+startup_report.mark("imports")
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """
+    Mede cada pedido (histograma por rota) e, se ativo, devolve o cabeçalho
+    `Server-Timing` com a duração das etapas do pipeline RAG (embed, search, ...).
+    """
+    trace = start_trace()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    path = getattr(route, "path", "other")
+    REQUEST_SECONDS.observe(elapsed, path=path, status=response.status_code)
+
+    if agent_settings.SERVER_TIMING_ENABLED and trace.spans:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+@app.exception_handler(Rejected)
+async def rejected_handler(request: Request, exc: Rejected):
+    """Pedido recusado pelo controlo de admissão: 429 / 503 com `Retry-After`."""
+    if exc.status_code == 429:
+        detail = "Demasiados pedidos. Tenta novamente dentro de alguns segundos."
+    else:
+        detail = "Serviço sobrecarregado. Tenta novamente dentro de alguns segundos."
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": detail, "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+async def _admit(request: Request, session_id: str = None):
+    """Vaga no controlo de admissão (None se estiver desligado); levanta `Rejected`."""
+    if admission_controller is None:
+        return None
+    return await admission_controller.acquire(session_id, client_id(request))
+
+
+async def _release(ticket) -> None:
+    """
+    Liberta a vaga. É uma corrotina para correr sempre no event loop (a
+    BackgroundTask corre funções síncronas numa thread, e o estado do
+    controlo de admissão só é usado a partir do event loop).
+    """
+    if ticket is not None:
+        ticket.release()
+
+
+@app.on_event("startup")
+def warm_up_retrieval():
+    """Carrega o modelo de embeddings e a coleção Chroma antes do 1.º pedido."""
+    if agent_settings.WARM_UP_ON_STARTUP:
+        try:
+            retrieval_engine.warm_up()
+            if reranker is not None:
+                reranker.warm_up()
+        except Exception as e:
+            # A API continua a arrancar; o /health mostra o erro.
+            print(f"⚠️ [api] Falha ao carregar o motor de recuperação: {e}")
+    if not llm_client.configured():
+        print("⚠️ [api] OPENAI_API_KEY não está definida. Verifica o .env.")
+    if index_watcher is not None:
+        # Em cada worker: troca para um build novo do índice sem reiniciar
+        index_watcher.start()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    """Fecha o pool de ligações HTTP do cliente de LLM e grava a cache de embeddings."""
+    await llm_client.aclose()
+    if index_watcher is not None:
+        index_watcher.stop()
+    if query_embedding_cache is not None:
+        query_embedding_cache.persist()
+    if history_summarizer is not None:
+        history_summarizer.close()
 
 
 @app.get("/", response_class=HTMLResponse, tags=["UI"])
@@ -192,6 +294,7 @@ def landing_page():
               <div class="section-title">Navegação rápida</div>
               <ul class="links">
                 <li><b>Estado da API:</b> <a href="/health">/health</a></li>
+                <li><b>Métricas (Prometheus):</b> <a href="/metrics">/metrics</a></li>
                 <li><b>Documentação interativa (Swagger):</b> <a href="/docs">/docs</a></li>
                 <li><b>Documentação alternativa (ReDoc):</b> <a href="/redoc">/redoc</a></li>
               </ul>
@@ -226,24 +329,83 @@ curl -X POST "http://localhost:8000/chat" \\
 @app.get("/health", tags=["Sistema"])
 def health_check():
     """Verifica se a API está operacional e devolve algumas informações básicas."""
+    retrieval = retrieval_engine.status()
+    if retrieval["ready"]:
+        status = "ok"
+    else:
+        status = "degraded" if retrieval["error"] else "starting"
     return {
-        "status": "ok",
+        "status": status,
         "model": agent_settings.OPENAI_MODEL,
         "chromadb_dir": agent_settings.CHROMA_DB_DIR,
         "collection": agent_settings.COLLECTION_NAME,
+        "retrieval": retrieval,
+        "answer_cache": answer_cache.stats(),
+        "query_embedding_cache": (
+            query_embedding_cache.stats() if query_embedding_cache is not None else None
+        ),
+        "sessions": session_store.stats(),
+        "history_summary": history_summarizer.stats() if history_summarizer is not None else None,
+        "llm": llm_client.stats(),
+        "rerank": reranker.stats() if reranker is not None else None,
+        "index": index_status(),
+        "faq": faq_table.stats() if faq_table is not None else None,
+        "admission": admission_controller.stats() if admission_controller is not None else None,
+        "startup": startup_report.report(),
     }
 
 
+def _reload_in_background() -> None:
+    try:
+        reload_index()
+    except Exception as e:
+        # Continua no build anterior; o /health mostra o erro
+        print(f"⚠️ [api] Falha ao trocar de índice: {e}")
+
+
+@app.post("/admin/reload-index", status_code=202, tags=["Sistema"])
+def reload_index_endpoint(request: Request):
+    """
+    Carrega em segundo plano o build ativo do índice (CHROMA_DB_DIR/CURRENT)
+    neste worker; os pedidos em curso terminam no build anterior. Requer o
+    cabeçalho `X-Admin-Token` igual a ADMIN_TOKEN (sem token, o endpoint não existe).
+    """
+    if not agent_settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(token.encode("utf-8"), agent_settings.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Token de administração inválido.")
+    return JSONResponse(
+        status_code=202,
+        content={"status": "reloading", "index": index_status()},
+        background=BackgroundTask(_reload_in_background),
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Sistema"])
+def metrics_endpoint():
+    """Métricas no formato Prometheus (latência por etapa, tokens, trechos, caches)."""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.post("/chat", response_model=ChatResponse, tags=["Chat"])
-def chat_endpoint(payload: ChatRequest):
+async def chat_endpoint(payload: ChatRequest, request: Request):
     """
     Endpoint principal de chat com o assistente de auditoria.
 
     - Usa RAG (Chroma + embeddings Hugging Face)
     - Mantém memória por `session_id`
     - Responde em português com base nas normas carregadas
+    - Com o serviço saturado responde 503 (ou 429 acima do limite de pedidos),
+      com o cabeçalho `Retry-After`
     """
-    answer = ask_agent(session_id=payload.session_id, question=payload.question)
+    ticket = await _admit(request, payload.session_id)
+    try:
+        answer = await aask_agent(session_id=payload.session_id, question=payload.question)
+    finally:
+        await _release(ticket)
     return ChatResponse(
         session_id=payload.session_id,
         question=payload.question,
@@ -251,9 +413,89 @@ def chat_endpoint(payload: ChatRequest):
         model=agent_settings.OPENAI_MODEL,
     )
 
+
+@app.post("/chat/stream", tags=["Chat"])
+async def chat_stream_endpoint(payload: ChatRequest, request: Request):
+    """
+    Variante em streaming do /chat (NDJSON: um objeto JSON por linha).
+
+    1. `{"type": "metadata", "sources": [...], "model": ...}` com os trechos recuperados
+    2. `{"type": "token", "content": "..."}` à medida que o LLM gera a resposta
+    3. `{"type": "done"}` no fim (ou `{"type": "error", "detail": ...}`)
+
+    A vaga do controlo de admissão fica ocupada até ao fim do stream.
+    """
+    ticket = await _admit(request, payload.session_id)
+
+    async def event_stream():
+        try:
+            async for event in astream_agent(payload.session_id, payload.question):
+                if event["type"] == "metadata":
+                    event["model"] = agent_settings.OPENAI_MODEL
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            await _release(ticket)
+
+    # A background task liberta a vaga se o cliente desligar antes do 1.º evento
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(_release, ticket),
+    )
+
+
+@app.post("/chat/batch", tags=["Chat"])
+async def chat_batch_endpoint(
+    request: Request,
+    concurrency: Optional[int] = Query(None, ge=1, le=agent_settings.BATCH_CONCURRENCY),
+):
+    """
+    Responde a um lote de perguntas enviado como JSONL no corpo do pedido
+    (uma linha por pergunta: `{"id": ..., "question": ..., "session_id": ...}`).
+
+    As perguntas são embebidas num único lote, as pesquisas vetoriais são
+    agrupadas e as chamadas ao LLM correm em paralelo (limite `concurrency`).
+    A resposta é JSONL, pela mesma ordem das perguntas.
+    Um lote ocupa uma vaga do controlo de admissão até ao fim.
+    """
+    ticket = await _admit(request)
+    try:
+        body = (await request.body()).decode("utf-8")
+        try:
+            items = parse_jsonl(body.splitlines())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if len(items) > agent_settings.BATCH_MAX_QUESTIONS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Máximo de {agent_settings.BATCH_MAX_QUESTIONS} perguntas por lote.",
+            )
+    except BaseException:
+        await _release(ticket)
+        raise
+
+    async def result_stream():
+        try:
+            async for result in aask_batch(items, concurrency=concurrency):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            await _release(ticket)
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(_release, ticket),
+    )
+
+
 @app.get("/playground", response_class=HTMLResponse, tags=["UI"])
 def chat_playground():
-    """Interface simples de chat no browser que consome o endpoint /chat."""
+    """Interface simples de chat no browser que consome o endpoint /chat/stream."""
     html = """
     <!DOCTYPE html>
     <html lang="pt">
@@ -347,6 +589,7 @@ def chat_playground():
             border-bottom-right-radius: 4px;
           }
           .msg.bot {
+            white-space: pre-wrap;
             margin-right: auto;
             background: white;
             border-bottom-left-radius: 4px;
@@ -468,6 +711,16 @@ def chat_playground():
             div.innerHTML = text + '<small>' + (sender === "user" ? "Tu" : "Assistente") + "</small>";
             chatEl.appendChild(div);
             chatEl.scrollTop = chatEl.scrollHeight;
+            return div;
+          }
+
+          function startBotMessage() {
+            // Mensagem do assistente que vai sendo preenchida token a token
+            const div = addMessage("", "bot");
+            const body = document.createElement("span");
+            body.textContent = "…";
+            div.insertBefore(body, div.firstChild);
+            return body;
           }
 
           async function sendQuestion() {
@@ -479,7 +732,7 @@ def chat_playground():
             sendBtn.disabled = true;
 
             try {
-              const resp = await fetch("/chat", {
+              const resp = await fetch("/chat/stream", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -491,9 +744,32 @@ def chat_playground():
               if (!resp.ok) {
                 const errText = await resp.text();
                 addMessage("Ocorreu um erro na API: " + errText, "bot");
-              } else {
-                const data = await resp.json();
-                addMessage(data.answer, "bot");
+                return;
+              }
+
+              const body = startBotMessage();
+              const reader = resp.body.getReader();
+              const decoder = new TextDecoder();
+              let buffer = "";
+              let answer = "";
+
+              while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split("\\n");
+                buffer = lines.pop();
+                for (const line of lines) {
+                  if (!line.trim()) continue;
+                  const event = JSON.parse(line);
+                  if (event.type === "token") {
+                    answer += event.content;
+                    body.textContent = answer;
+                  } else if (event.type === "error") {
+                    body.textContent = answer + "\\n[Erro: " + event.detail + "]";
+                  }
+                  chatEl.scrollTop = chatEl.scrollHeight;
+                }
               }
             } catch (e) {
               addMessage("Erro de rede ao contactar o servidor.", "bot");
@@ -0,0 +1,110 @@
+import asyncio
+import json
+from typing import AsyncIterator, Iterable, List, Optional
+
+from pydantic import ValidationError
+
+from .agent import (
+    aanswer_with_docs,
+    check_api_key,
+    describe_sources,
+    rerank,
+    rerank_candidates,
+)
+from .config_agent import agent_settings
+from .metrics import record_retrieval, stage
+from .retrieval import retrieval_engine
+from .schemas import BatchQuestion
+
+
+def parse_jsonl(lines: Iterable[str], field: str = "question") -> List[BatchQuestion]:
+    """
+    Lê perguntas em JSONL (um objeto por linha). A pergunta vem do campo
+    `field`; `id` e `session_id` são opcionais. Linhas vazias são ignoradas.
+    """
+    items = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            raw = json.loads(line)
+            if not isinstance(raw, dict):
+                raise ValueError("esperado um objeto JSON")
+            if field != "question":
+                raw["question"] = raw.get(field)
+            if raw.get("id") is None:
+                raw["id"] = raw.get("request_id", len(items))
+            raw["id"] = str(raw["id"])
+            items.append(BatchQuestion(**raw))
+        except (ValueError, TypeError, ValidationError) as e:
+            raise ValueError(f"Linha {number} inválida: {e}") from e
+    return items
+
+
+def _retrieve_batch(questions: List[str]):
+    """Todas as perguntas num só forward pass do modelo + pesquisas agrupadas."""
+    with stage("embed"):
+        embeddings = retrieval_engine.embed_queries(questions)
+    with stage("search"):
+        results = retrieval_engine.search_many(questions, embeddings, rerank_candidates())
+    docs_per_item = [
+        rerank(question, [doc for doc, _ in hits]) for question, hits in zip(questions, results)
+    ]
+    for docs in docs_per_item:
+        record_retrieval(len(docs))
+    return embeddings, docs_per_item
+
+
+async def aask_batch(
+    items: List[BatchQuestion], concurrency: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """
+    Responde a uma lista de perguntas:
+    1. embeddings de todas as perguntas num único lote;
+    2. pesquisas vetoriais numa única chamada ao Chroma;
+    3. chamadas ao LLM em paralelo, no máximo `concurrency` de cada vez
+       (com backoff em 429 / 5xx).
+
+    Os resultados são produzidos pela ordem de entrada, à medida que ficam prontos.
+    Uma pergunta que falhe dá um resultado com `error`, sem parar o lote.
+    """
+    check_api_key()
+    if not items:
+        return
+
+    embeddings, docs_per_item = await asyncio.to_thread(
+        _retrieve_batch, [item.question for item in items]
+    )
+    semaphore = asyncio.Semaphore(concurrency or agent_settings.BATCH_CONCURRENCY)
+
+    async def answer(item: BatchQuestion, embedding, docs) -> dict:
+        result = {
+            "id": item.id,
+            "session_id": item.session_id,
+            "question": item.question,
+            "sources": describe_sources(docs),
+        }
+        async with semaphore:
+            try:
+                result["answer"] = await aanswer_with_docs(
+                    item.session_id or "",
+                    item.question,
+                    embedding,
+                    docs,
+                    remember=item.session_id is not None,
+                )
+            except Exception as e:
+                result["error"] = str(e)
+        return result
+
+    tasks = [
+        asyncio.create_task(answer(item, embedding, docs))
+        for item, embedding, docs in zip(items, embeddings, docs_per_item)
+    ]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,7 +1,42 @@
+import os
+
+
 class Settings:
     # Diretório onde o Chroma vai guardar a base vetorial
     CHROMA_DB_DIR: str = "vectordb"
     # Nome da coleção (podes mudar se quiseres separar projetos)
     COLLECTION_NAME: str = "normas_auditoria"
 
+    # Pasta com os PDFs das normas
+    DATA_DIR: str = "data/normas"
+    # Modelo de embeddings (tem de ser o mesmo usado pelo agente)
+    EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # Divisão em chunks
+    CHUNK_SIZE: int = 1000
+    CHUNK_OVERLAP: int = 200
+    # Processos para ler PDFs em paralelo (0 = número de CPUs)
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "0"))
+    # Chunks por lote de embeddings / upsert no Chroma
+    EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+    # Elementos em espera entre etapas do pipeline de ingestão (PDFs lidos / lotes);
+    # limita a memória, que deixa de crescer com o número de PDFs
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+    # Cache das páginas extraídas dos PDFs, pela hash do ficheiro ("" = desligada)
+    PARSE_CACHE_PATH: str = os.getenv("PARSE_CACHE_PATH", "cache/parse_cache.sqlite")
+    # Cada ingestão publica um build novo em CHROMA_DB_DIR/builds/ (ponteiro CURRENT);
+    # ficam os N mais recentes, para os processos que ainda estejam a ler um anterior
+    INDEX_KEEP_BUILDS: int = int(os.getenv("INDEX_KEEP_BUILDS", "3"))
+    # Manifesto com o hash de cada PDF e os ids dos seus chunks
+    MANIFEST_FILE: str = "ingest_manifest.json"
+    # Índice lexical (BM25), guardado em cada build do índice
+    LEXICAL_INDEX_DIR: str = "lexical"
+    # Índice vetorial compacto (alternativa ao HNSW do Chroma), também em cada build
+    VECTOR_INDEX_DIR: str = "vectors"
+    # Tabela das perguntas frequentes (gerada por app.faq; não é copiada entre builds)
+    FAQ_DIR: str = os.getenv("FAQ_DIR", "faq")
+    # float16 | int8 (quantização escalar: metade do tamanho, pesquisa mais rápida) | float32
+    VECTOR_INDEX_DTYPE: str = os.getenv("VECTOR_INDEX_DTYPE", "float16")
+    # Listas IVF (k-means); 0 = só pesquisa exata (adequado até algumas centenas de milhares)
+    VECTOR_INDEX_LISTS: int = int(os.getenv("VECTOR_INDEX_LISTS", "0"))
+
 settings = Settings()
@@ -13,16 +13,164 @@ class AgentSettings:
     # OpenAI (LLM)
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.2"))
+
+    # Cliente de LLM partilhado (pool de ligações, concorrência, repetições)
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "openai")  # openai | fake
+    # Latência simulada do backend "fake" (benchmarks sem rede)
+    LLM_FAKE_LATENCY_MS: float = float(os.getenv("LLM_FAKE_LATENCY_MS", "200"))
+    # Servidor compatível com a API da OpenAI (ex.: http://localhost:8080/v1)
+    LLM_BASE_URL: str = os.getenv("LLM_BASE_URL", "")
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE: int = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+    LLM_KEEPALIVE_SECONDS: float = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+    LLM_MAX_CONCURRENCY_PER_SESSION: int = int(
+        os.getenv("LLM_MAX_CONCURRENCY_PER_SESSION", "2")
+    )
+    # Repetições em 429 / 5xx (backoff exponencial a partir de LLM_BACKOFF_SECONDS)
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "5"))
+    LLM_BACKOFF_SECONDS: float = float(os.getenv("LLM_BACKOFF_SECONDS", "1.0"))
+    # Espera máxima pedida pelo servidor (Retry-After) antes de repetir
+    LLM_RETRY_AFTER_MAX_SECONDS: float = float(os.getenv("LLM_RETRY_AFTER_MAX_SECONDS", "30"))
+
+    # Controlo de admissão dos endpoints de chat (valores por processo / worker)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+    ADMISSION_QUEUE_SIZE: int = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+    # Prazo máximo de espera na fila; depois disso responde 503
+    ADMISSION_QUEUE_TIMEOUT_MS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+    # Limites de pedidos (por minuto, com rajada); 0 = sem limite
+    RATE_LIMIT_SESSION_PER_MIN: float = float(os.getenv("RATE_LIMIT_SESSION_PER_MIN", "20"))
+    RATE_LIMIT_SESSION_BURST: int = int(os.getenv("RATE_LIMIT_SESSION_BURST", "5"))
+    RATE_LIMIT_CLIENT_PER_MIN: float = float(os.getenv("RATE_LIMIT_CLIENT_PER_MIN", "120"))
+    RATE_LIMIT_CLIENT_BURST: int = int(os.getenv("RATE_LIMIT_CLIENT_BURST", "20"))
+    # Usar o X-Forwarded-For para identificar o cliente (só atrás de um proxy de confiança)
+    ADMISSION_TRUST_FORWARDED: bool = (
+        os.getenv("ADMISSION_TRUST_FORWARDED", "false").lower() == "true"
+    )
+
+    # Processamento em lote (/chat/batch e batch_cli.py)
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    BATCH_MAX_QUESTIONS: int = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
 
     # Chroma (base vetorial já criada na Fase 1)
     CHROMA_DB_DIR: str = os.getenv("CHROMA_DB_DIR", "vectordb")
     COLLECTION_NAME: str = os.getenv("COLLECTION_NAME", "normas_auditoria")
+    # Manifesto da ingestão (o campo "version" identifica o conteúdo do índice)
+    MANIFEST_FILE: str = os.getenv("MANIFEST_FILE", "ingest_manifest.json")
+    # Troca para um build novo do índice (CHROMA_DB_DIR/CURRENT) sem reiniciar a API
+    INDEX_WATCH_ENABLED: bool = os.getenv("INDEX_WATCH_ENABLED", "true").lower() == "true"
+    INDEX_WATCH_INTERVAL_S: float = float(os.getenv("INDEX_WATCH_INTERVAL_S", "5"))
+    # Token do endpoint POST /admin/reload-index (cabeçalho X-Admin-Token); "" = desligado
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
 
+    # Perguntas frequentes pré-calculadas (python -m app.faq build), por versão do índice
+    FAQ_ENABLED: bool = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+    FAQ_QUESTIONS_PATH: str = os.getenv("FAQ_QUESTIONS_PATH", "data/faq.json")
+    # Tabela gerada, dentro do build do índice
+    FAQ_DIR: str = os.getenv("FAQ_DIR", "faq")
 
-agent_settings = AgentSettings()
+    # Embeddings / recuperação (tem de ser o mesmo modelo usado na ingestão)
+    EMBEDDING_MODEL: str = os.getenv(
+        "EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+    )
+    # Artefacto local do modelo (python -m app.embeddings export), ao lado de vectordb/
+    EMBEDDING_MODEL_DIR: str = os.getenv("EMBEDDING_MODEL_DIR", "models")
+    # torch (sentence-transformers) | onnx (ONNX Runtime; python -m app.embeddings export-onnx)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch")
+    EMBEDDING_ONNX_VARIANT: str = os.getenv("EMBEDDING_ONNX_VARIANT", "int8")  # fp32 | int8
+    # Threads do ONNX Runtime por sessão (0 = automático)
+    EMBEDDING_THREADS: int = int(os.getenv("EMBEDDING_THREADS", "0"))
+    # Cache LRU dos embeddings das perguntas (opcionalmente persistida em disco)
+    EMBEDDING_CACHE_ENABLED: bool = (
+        os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    )
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    # Pasta para persistir a cache ("" = só em memória)
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "cache/query_embeddings")
+    EMBEDDING_CACHE_PERSIST_EVERY: int = int(os.getenv("EMBEDDING_CACHE_PERSIST_EVERY", "500"))
+    # Micro-batching das perguntas de pedidos concorrentes (um forward pass por lote)
+    EMBED_MICROBATCH_ENABLED: bool = (
+        os.getenv("EMBED_MICROBATCH_ENABLED", "true").lower() == "true"
+    )
+    # Espera máxima para juntar perguntas ao lote, e tamanho máximo do lote
+    EMBED_MICROBATCH_MAX_WAIT_MS: float = float(os.getenv("EMBED_MICROBATCH_MAX_WAIT_MS", "2"))
+    EMBED_MICROBATCH_MAX_SIZE: int = int(os.getenv("EMBED_MICROBATCH_MAX_SIZE", "32"))
+    RETRIEVER_K: int = int(os.getenv("RETRIEVER_K", "4"))
+    # vector | hybrid (BM25 + vetorial; só se o índice lexical existir)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "hybrid")
+    LEXICAL_INDEX_DIR: str = os.getenv("LEXICAL_INDEX_DIR", "lexical")
+    # chroma | compact (float16 em memory-map, construído pela ingestão em VECTOR_INDEX_DIR)
+    VECTOR_STORE: str = os.getenv("VECTOR_STORE", "chroma")
+    VECTOR_INDEX_DIR: str = os.getenv("VECTOR_INDEX_DIR", "vectors")
+    # Listas IVF visitadas por pesquisa (só se o índice tiver listas)
+    VECTOR_INDEX_NPROBE: int = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+    # Candidatos de cada ranking antes da fusão, e constante do RRF
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    # Pesquisa só na língua da pergunta + línguas de recurso (metadado "language")
+    LANGUAGE_ROUTING: bool = os.getenv("LANGUAGE_ROUTING", "true").lower() == "true"
+    FALLBACK_LANGUAGES: list = [
+        lang.strip() for lang in os.getenv("FALLBACK_LANGUAGES", "en").split(",") if lang.strip()
+    ]
+    # Traduções do mesmo parágrafo (mesma norma, posição relativa próxima) contam uma vez
+    TRANSLATION_DEDUP: bool = os.getenv("TRANSLATION_DEDUP", "true").lower() == "true"
+    TRANSLATION_DEDUP_WINDOW: float = float(os.getenv("TRANSLATION_DEDUP_WINDOW", "0.02"))
+    # Reordenação dos candidatos com um cross-encoder local (CPU)
+    RERANK_ENABLED: bool = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL: str = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+    # Candidatos pedidos à pesquisa; só os RETRIEVER_K melhores vão para o prompt
+    RERANK_CANDIDATES: int = int(os.getenv("RERANK_CANDIDATES", "12"))
+    # Orçamento de latência: acima disto fica a ordem da pesquisa
+    RERANK_TIMEOUT_MS: float = float(os.getenv("RERANK_TIMEOUT_MS", "300"))
+    RERANK_MAX_LENGTH: int = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+    RERANK_CACHE_SIZE: int = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+    RERANK_WORKERS: int = int(os.getenv("RERANK_WORKERS", "1"))
+    # Carregar modelo + índice no arranque da API (em vez de no 1.º pedido)
+    WARM_UP_ON_STARTUP: bool = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
+
+    # Observabilidade: cabeçalho Server-Timing com a duração de cada etapa
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
+    # Histórico de conversa (memória por sessão)
+    SESSION_STORE: str = os.getenv("SESSION_STORE", "memory")  # memory | sqlite
+    SESSION_DB_PATH: str = os.getenv("SESSION_DB_PATH", "cache/sessions.sqlite")
+    SESSION_MAX_TURNS: int = int(os.getenv("SESSION_MAX_TURNS", "20"))
+    SESSION_TTL_SECONDS: float = float(os.getenv("SESSION_TTL_SECONDS", "21600"))
+    SESSION_MEMORY_BUDGET_MB: int = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "64"))
+    # Interações (pergunta + resposta) incluídas no prompt
+    HISTORY_PROMPT_TURNS: int = int(os.getenv("HISTORY_PROMPT_TURNS", "4"))
 
-# Debug opcional (não mostra a chave)
-if not agent_settings.OPENAI_API_KEY:
-    print("⚠️ [config_agent] OPENAI_API_KEY não foi carregada. Verifica o .env.")
-else:
-    print("✅ [config_agent] OPENAI_API_KEY carregada (valor escondido).")
+    # Orçamentos de tokens do prompt (contados com o tokenizer do OPENAI_MODEL)
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+    HISTORY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "400"))
+
+    # Histórico no prompt: "window" (últimas interações) ou "summary"
+    # (resumo das interações antigas + só as mais recentes na íntegra)
+    HISTORY_MODE: str = os.getenv("HISTORY_MODE", "window")
+    # Interações mais recentes que ficam sempre fora do resumo
+    HISTORY_SUMMARY_KEEP_TURNS: int = int(os.getenv("HISTORY_SUMMARY_KEEP_TURNS", "2"))
+    # O resumo é refeito quando há pelo menos N interações novas para juntar
+    HISTORY_SUMMARY_REFRESH_TURNS: int = int(os.getenv("HISTORY_SUMMARY_REFRESH_TURNS", "2"))
+    HISTORY_SUMMARY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_SUMMARY_TOKEN_BUDGET", "250"))
+    # Threads que geram os resumos (fora do caminho do pedido)
+    HISTORY_SUMMARY_WORKERS: int = int(os.getenv("HISTORY_SUMMARY_WORKERS", "2"))
+
+    # Cache semântica de respostas do LLM
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_BACKEND: str = os.getenv("ANSWER_CACHE_BACKEND", "memory")  # memory | sqlite
+    ANSWER_CACHE_PATH: str = os.getenv("ANSWER_CACHE_PATH", "cache/answer_cache.sqlite")
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+    ANSWER_CACHE_MAX_MB: int = int(os.getenv("ANSWER_CACHE_MAX_MB", "32"))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+    # Similaridade de cosseno mínima para aceitar uma pergunta "quase igual"
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+    # Fração dos trechos da entrada que têm de voltar a ser recuperados
+    ANSWER_CACHE_MIN_CHUNK_OVERLAP: float = float(
+        os.getenv("ANSWER_CACHE_MIN_CHUNK_OVERLAP", "1.0")
+    )
+
+
+agent_settings = AgentSettings()
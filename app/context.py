@@ -0,0 +1,189 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .config_agent import agent_settings
+
+# Fim de frase / parágrafo: onde é aceitável cortar um trecho
+_SENTENCE_END = re.compile(r"[.!?;:](?=\s)|\n")
+# Marca acrescentada a um texto cortado (conta para o orçamento)
+_TRIM_MARKER = " [...]"
+
+
+@lru_cache(maxsize=1)
+def _encoder() -> Optional[Callable[[str], list]]:
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        encoding = tiktoken.encoding_for_model(agent_settings.OPENAI_MODEL)
+    except KeyError:
+        # Modelos sem mapeamento (ex.: servidores locais): tokenizer dos GPT-4o
+        encoding = tiktoken.get_encoding("o200k_base")
+    return encoding.encode
+
+
+def count_tokens(text: str) -> int:
+    """Número de tokens do texto para o modelo configurado (estimativa se não houver tiktoken)."""
+    encode = _encoder()
+    if encode is None:
+        return (len(text) + 3) // 4
+    return len(encode(text))
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Corta o texto para caber em `max_tokens` (incluindo a marca de corte),
+    de preferência no fim de uma frase (nunca a meio de uma palavra).
+    Devolve "" se não couber nada útil.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens - count_tokens(_TRIM_MARKER)
+    if budget <= 0:
+        return ""
+    # Estimativa inicial pela proporção de caracteres, ajustada até caber
+    cut = int(len(text) * budget / max(count_tokens(text), 1))
+    while cut > 0 and count_tokens(text[:cut]) > budget:
+        cut = int(cut * 0.9)
+    head = text[:cut]
+    ends = [m.end() for m in _SENTENCE_END.finditer(head)]
+    if ends and ends[-1] > len(head) // 2:
+        return head[:ends[-1]].rstrip() + _TRIM_MARKER
+    space = head.rfind(" ")
+    if space <= 0:
+        return ""
+    return head[:space].rstrip() + _TRIM_MARKER
+
+
+class ContextBlock:
+    """Texto contínuo de uma página (um ou mais trechos fundidos)."""
+
+    __slots__ = ("source", "page", "start", "end", "text", "rank", "docs")
+
+    def __init__(self, doc, rank: int) -> None:
+        self.source = doc.metadata.get("source")
+        self.page = doc.metadata.get("page")
+        self.start = doc.metadata.get("start_index")
+        self.text = doc.page_content
+        self.end = self.start + len(self.text) if self.start is not None else None
+        self.rank = rank
+        self.docs = [doc]
+
+    def try_merge(self, doc, rank: int) -> bool:
+        """
+        Junta um trecho da mesma página que se sobrepõe ou encosta a este bloco
+        (os chunks têm CHUNK_OVERLAP caracteres em comum). O texto repetido só
+        entra uma vez.
+        """
+        start = doc.metadata.get("start_index")
+        if (
+            start is None
+            or self.start is None
+            or doc.metadata.get("source") != self.source
+            or doc.metadata.get("page") != self.page
+        ):
+            return False
+        text = doc.page_content
+        end = start + len(text)
+        if start > self.end or end < self.start:
+            return False
+        if start < self.start:
+            # Bloco novo começa antes: prefixo do novo + o que já temos
+            self.text = text[: self.start - start] + self.text
+            self.start = start
+        if end > self.end:
+            self.text = self.text + text[len(text) - (end - self.end):]
+            self.end = end
+        self.rank = min(self.rank, rank)
+        self.docs.append(doc)
+        return True
+
+    def citation(self) -> str:
+        """Referência do bloco para o prompt: ficheiro e página impressa (ex.: "ISSAI-300.pdf, p. 8")."""
+        meta = self.docs[0].metadata
+        name = meta.get("file") or os.path.basename(str(self.source or "")) or "?"
+        page = meta.get("page_label")
+        if page is None:
+            page = self.page + 1 if isinstance(self.page, int) else "?"
+        return f"{name}, p. {page}"
+
+
+def merge_chunks(docs: Sequence) -> List[ContextBlock]:
+    """
+    Funde trechos sobrepostos / adjacentes da mesma página (por `start_index`)
+    e elimina duplicados. `docs` vem por ordem de relevância; cada bloco fica
+    com a melhor posição dos trechos que o compõem.
+    """
+    blocks: List[ContextBlock] = []
+    seen = set()
+    # Ordem do texto na página, para que trechos encadeados se fundam todos
+    ordered = sorted(
+        enumerate(docs),
+        key=lambda item: (
+            str(item[1].metadata.get("source")),
+            str(item[1].metadata.get("page")),
+            item[1].metadata.get("start_index") or 0,
+        ),
+    )
+    for rank, doc in ordered:
+        digest = hashlib.sha1(doc.page_content.strip().encode("utf-8")).hexdigest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        if blocks and blocks[-1].try_merge(doc, rank):
+            continue
+        # Sem start_index (índices antigos): descartar trechos contidos noutro
+        if any(doc.page_content in b.text for b in blocks if b.source == doc.metadata.get("source")):
+            continue
+        blocks.append(ContextBlock(doc, rank))
+    blocks.sort(key=lambda b: b.rank)
+    return blocks
+
+
+def pack_context(docs: Sequence, budget: int) -> List[ContextBlock]:
+    """
+    Preenche o orçamento de tokens com os blocos mais relevantes primeiro.
+    Um bloco que não cabe inteiro é cortado no fim de uma frase, se ainda
+    houver espaço útil; os seguintes são ignorados.
+    """
+    packed = []
+    remaining = budget
+    for block in merge_chunks(docs):
+        tokens = count_tokens(block.text)
+        if tokens > remaining:
+            if remaining < 50:
+                break
+            block.text = trim_to_tokens(block.text, remaining)
+            if not block.text:
+                break
+            tokens = count_tokens(block.text)
+        packed.append(block)
+        remaining -= tokens
+    return packed
+
+
+def pack_history(turns: Sequence[Tuple[str, str]], budget: int) -> List[Tuple[str, str]]:
+    """
+    As interações mais recentes que cabem no orçamento (pela ordem original).
+    A mais antiga das incluídas pode ficar com a resposta cortada.
+    """
+    packed = []
+    remaining = budget
+    for question, answer in reversed(turns):
+        q_tokens = count_tokens(question)
+        a_tokens = count_tokens(answer)
+        if q_tokens + a_tokens <= remaining:
+            packed.append((question, answer))
+            remaining -= q_tokens + a_tokens
+            continue
+        if remaining - q_tokens >= 50:
+            trimmed = trim_to_tokens(answer, remaining - q_tokens)
+            if trimmed:
+                packed.append((question, trimmed))
+        break
+    packed.reverse()
+    return packed
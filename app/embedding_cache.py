@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from .answer_cache import normalize_question
+from .config_agent import agent_settings
+from .metrics import registry
+
+QUERY_EMBEDDING_CACHE_HITS = registry.counter(
+    "query_embedding_cache_hits_total", "Embeddings de perguntas servidos pela cache."
+)
+QUERY_EMBEDDING_CACHE_MISSES = registry.counter(
+    "query_embedding_cache_misses_total", "Embeddings de perguntas calculados pelo modelo."
+)
+
+# Dentro de EMBEDDING_CACHE_PATH: uma pasta por gravação e o ponteiro CURRENT
+_CURRENT_FILE = "CURRENT"
+# Gravações mantidas (a anterior pode ainda estar a ser lida por outro worker)
+_KEEP_VERSIONS = 2
+
+
+def embedding_model_id() -> str:
+    """Identifica os vetores: modelo + backend (o int8 dá vetores ligeiramente diferentes)."""
+    model_id = f"{agent_settings.EMBEDDING_MODEL}|{agent_settings.EMBEDDING_BACKEND}"
+    if agent_settings.EMBEDDING_BACKEND == "onnx":
+        model_id += f"|{agent_settings.EMBEDDING_ONNX_VARIANT}"
+    return model_id
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU dos embeddings das perguntas, à frente do modelo.
+
+    - chave: sha1 do id do modelo + pergunta normalizada;
+    - em memória, limitada a `max_entries` vetores float32;
+    - opcionalmente persistida em disco (`path`): keys.json + vectors.npy,
+      carregado em memory-map no arranque, para que um pod novo comece com
+      a cache quente sem copiar os vetores para a RAM. Cada gravação fica
+      numa pasta nova e o ficheiro CURRENT aponta para a última.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        max_entries: int = 10000,
+        path: str = "",
+        persist_every: int = 500,
+    ) -> None:
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.path = path
+        self.persist_every = persist_every
+
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._dirty = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+
+        if path:
+            self.load()
+
+    def key(self, text: str) -> str:
+        raw = f"{self.model_id}\n{normalize_question(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                QUERY_EMBEDDING_CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            QUERY_EMBEDDING_CACHE_HITS.inc()
+            return vector
+
+    def put(self, text: str, vector: Sequence[float]) -> None:
+        key = self.key(text)
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty += 1
+            persist = bool(self.path) and self._dirty >= self.persist_every
+            if persist:
+                self._dirty = 0
+        if persist:
+            threading.Thread(target=self.persist, daemon=True).start()
+
+    def embed_query(self, text: str, embed: Callable[[str], List[float]]) -> List[float]:
+        """Embedding da pergunta: da cache, ou calculado com `embed` e guardado."""
+        vector = self.get(text)
+        if vector is None:
+            vector = embed(text)
+            self.put(text, vector)
+            return vector
+        return vector.tolist()
+
+    def embed_queries(
+        self, texts: List[str], embed_many: Callable[[List[str]], List[List[float]]]
+    ) -> List[List[float]]:
+        """Como `embed_query`, para várias perguntas; as que faltam são calculadas num só lote."""
+        vectors: List[Optional[List[float]]] = []
+        missing = []
+        for i, text in enumerate(texts):
+            vector = self.get(text)
+            if vector is None:
+                missing.append(i)
+                vectors.append(None)
+            else:
+                vectors.append(vector.tolist())
+        if missing:
+            computed = embed_many([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                self.put(texts[i], vector)
+                vectors[i] = vector
+        return vectors
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "loaded_from_disk": self.loaded,
+            "path": self.path or None,
+        }
+
+    # ------------------------------------------------------------------
+    # Persistência
+    # ------------------------------------------------------------------
+    def _current_dir(self) -> str:
+        """Pasta da última gravação (CURRENT) ou, no layout antigo, a própria `path`."""
+        try:
+            with open(os.path.join(self.path, _CURRENT_FILE), encoding="utf-8") as f:
+                version = f.read().strip()
+        except OSError:
+            return self.path
+        return os.path.join(self.path, version) if version else self.path
+
+    def load(self) -> None:
+        """Carrega a cache do disco (vetores em memory-map), se for do mesmo modelo."""
+        directory = self._current_dir()
+        try:
+            with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model_id") != self.model_id:
+                return
+            with open(os.path.join(directory, "keys.json"), encoding="utf-8") as f:
+                keys = json.load(f)
+            vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        if self.max_entries <= 0:
+            return
+        keys = keys[-self.max_entries:]
+        vectors = vectors[len(vectors) - len(keys):]
+        with self._lock:
+            # Mais antigas primeiro (ordem LRU); as entradas já em memória ganham
+            for key, vector in zip(keys, vectors):
+                self._entries.setdefault(key, vector)
+            self.loaded = len(keys)
+
+    def persist(self) -> None:
+        """
+        Grava a cache (da mais antiga para a mais recente) numa pasta nova e
+        troca o ponteiro CURRENT (ficheiro temporário + rename: troca atómica).
+        Quem lê vê sempre uma gravação completa, mesmo com vários workers a
+        gravar ao mesmo tempo. As falhas são registadas e não interrompem o pedido.
+        """
+        if not self.path:
+            return
+        with self._persist_lock:
+            with self._lock:
+                items = list(self._entries.items())
+            if not items:
+                return
+            try:
+                self._write(items)
+            except OSError as e:
+                print(f"⚠️ [embedding_cache] Falha ao gravar a cache em {self.path}: {e}")
+
+    def _write(self, items) -> None:
+        keys = [key for key, _ in items]
+        vectors = np.stack([vector for _, vector in items]).astype(np.float32)
+
+        # Nome ordenável e único por processo: vários workers podem gravar ao mesmo tempo
+        version = f"{time.time_ns()}-{os.getpid()}"
+        tmp_dir = os.path.join(self.path, f".tmp-{version}")
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+        with open(os.path.join(tmp_dir, "keys.json"), "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"model_id": self.model_id, "entries": len(keys)}, f)
+        os.replace(tmp_dir, os.path.join(self.path, version))
+
+        pointer = os.path.join(self.path, _CURRENT_FILE)
+        tmp_pointer = f"{pointer}.tmp{os.getpid()}"
+        with open(tmp_pointer, "w", encoding="utf-8") as f:
+            f.write(version + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_pointer, pointer)
+
+        # Apaga as gravações antigas (e as do layout antigo, diretamente em `path`)
+        versions = sorted(
+            name for name in os.listdir(self.path)
+            if not name.startswith(".") and os.path.isdir(os.path.join(self.path, name))
+        )
+        current = os.path.basename(self._current_dir())
+        for name in versions[:-_KEEP_VERSIONS]:
+            if name == current:
+                continue
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        for name in ("vectors.npy", "keys.json", "meta.json"):
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+
+def _build_query_embedding_cache() -> Optional[QueryEmbeddingCache]:
+    if not agent_settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    return QueryEmbeddingCache(
+        model_id=embedding_model_id(),
+        max_entries=agent_settings.EMBEDDING_CACHE_SIZE,
+        path=agent_settings.EMBEDDING_CACHE_PATH,
+        persist_every=agent_settings.EMBEDDING_CACHE_PERSIST_EVERY,
+    )
+
+
+# Instância única por processo
+query_embedding_cache = _build_query_embedding_cache()
+
+registry.gauge(
+    "query_embedding_cache_entries", "Entradas na cache de embeddings de perguntas.",
+    function=lambda: len(query_embedding_cache._entries) if query_embedding_cache else 0,
+)
@@ -0,0 +1,429 @@
+"""
+Modelo de embeddings: backends e artefactos locais (pasta `models/`, ao lado
+de `vectordb/`), para que o arranque a frio não dependa do hub da Hugging Face.
+
+    python -m app.embeddings export [--fp16]     # artefacto PyTorch (sentence-transformers)
+    python -m app.embeddings export-onnx         # artefacto ONNX (fp32 + int8)
+    python -m app.embeddings parity              # compara ONNX com PyTorch
+
+Backends (EMBEDDING_BACKEND):
+- torch: HuggingFaceEmbeddings / sentence-transformers (o de sempre);
+- onnx:  o mesmo modelo no ONNX Runtime, opcionalmente quantizado em int8.
+  Produz os mesmos vetores (dentro da tolerância verificada por `parity`),
+  por isso o índice em `vectordb/` continua válido.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config_agent import agent_settings
+from .index_builds import active_dir
+
+ARTIFACT_FILE = "artifact.json"
+ONNX_FILES = {"fp32": "model.onnx", "int8": "model-int8.onnx"}
+
+
+def local_model_path(model_name: Optional[str] = None) -> str:
+    """Pasta do artefacto local para um modelo (ex.: models/all-MiniLM-L6-v2)."""
+    model_name = model_name or agent_settings.EMBEDDING_MODEL
+    return os.path.join(agent_settings.EMBEDDING_MODEL_DIR, model_name.rstrip("/").split("/")[-1])
+
+
+def onnx_model_path(model_name: Optional[str] = None) -> str:
+    """Pasta do artefacto ONNX (ex.: models/all-MiniLM-L6-v2-onnx)."""
+    return local_model_path(model_name) + "-onnx"
+
+
+def _read_artifact(path: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(path, ARTIFACT_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def resolve_model(model_name: Optional[str] = None) -> str:
+    """Caminho do artefacto local, se existir e for do mesmo modelo; senão, o nome no hub."""
+    model_name = model_name or agent_settings.EMBEDDING_MODEL
+    path = local_model_path(model_name)
+    artifact = _read_artifact(path)
+    return path if artifact and artifact.get("model") == model_name else model_name
+
+
+# ----------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------
+def torch_embeddings(model_name: str, batch_size: int = 32):
+    """
+    HuggingFaceEmbeddings a partir do artefacto local (sem rede) ou, na falta
+    dele, do hub. Os imports pesados (torch, transformers) só acontecem aqui.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    path = resolve_model(model_name)
+    local = path != model_name
+    if local:
+        # Evita pedidos ao hub (verificação de versões) durante o arranque
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    return HuggingFaceEmbeddings(
+        model_name=path,
+        model_kwargs={"local_files_only": local},
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+
+class OnnxEmbeddings:
+    """
+    Embeddings com ONNX Runtime (CPU), compatível com a interface do LangChain
+    (`embed_documents` / `embed_query`).
+
+    - tokenização com `tokenizers` (Rust), sem transformers nem torch;
+    - lotes dinâmicos: os textos são ordenados pelo número de tokens e cada
+      lote só é preenchido (padding) até ao texto mais longo desse lote;
+    - mean pooling + normalização L2, como o sentence-transformers.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        variant: str = "fp32",
+        threads: int = 0,
+        batch_size: int = 32,
+    ) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        artifact = _read_artifact(path)
+        if artifact is None:
+            raise FileNotFoundError(
+                f"Artefacto ONNX não encontrado em {path} "
+                "(corre `python -m app.embeddings export-onnx`)."
+            )
+        self.artifact = artifact
+        self.variant = variant
+        self.batch_size = batch_size
+        self.normalize = artifact.get("normalize", True)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(
+            os.path.join(path, ONNX_FILES[variant]),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=artifact["max_seq_length"])
+        self._tokenizer.no_padding()
+
+    def _run(self, encodings) -> np.ndarray:
+        length = max(len(e.ids) for e in encodings)
+        input_ids = np.zeros((len(encodings), length), dtype=np.int64)
+        attention_mask = np.zeros_like(input_ids)
+        token_type_ids = np.zeros_like(input_ids)
+        for row, encoding in enumerate(encodings):
+            n = len(encoding.ids)
+            input_ids[row, :n] = encoding.ids
+            attention_mask[row, :n] = 1
+            token_type_ids[row, :n] = encoding.type_ids
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = token_type_ids
+        hidden = self._session.run(None, feeds)[0]
+
+        mask = attention_mask[..., None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Matriz (n x dim) float32 com os embeddings dos textos."""
+        out = np.empty((len(texts), self.artifact["dimension"]), dtype=np.float32)
+        if not texts:
+            return out
+        encodings = self._tokenizer.encode_batch(list(texts))
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            out[idx] = self._run([encodings[i] for i in idx])
+        return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def onnx_embeddings(model_name: str, batch_size: int = 32) -> OnnxEmbeddings:
+    return OnnxEmbeddings(
+        onnx_model_path(model_name),
+        variant=agent_settings.EMBEDDING_ONNX_VARIANT,
+        threads=agent_settings.EMBEDDING_THREADS,
+        batch_size=batch_size,
+    )
+
+
+# Backends disponíveis (EMBEDDING_BACKEND); outros podem ser registados em runtime
+_BACKENDS: Dict[str, Callable] = {
+    "torch": torch_embeddings,
+    "onnx": onnx_embeddings,
+}
+
+
+def register_backend(name: str, factory: Callable) -> None:
+    _BACKENDS[name] = factory
+
+
+def build_embeddings(
+    model_name: Optional[str] = None, batch_size: int = 32, backend: Optional[str] = None
+):
+    """Modelo de embeddings do backend configurado (usado pelo agente e pela ingestão)."""
+    model_name = model_name or agent_settings.EMBEDDING_MODEL
+    backend = backend or agent_settings.EMBEDDING_BACKEND
+    return _BACKENDS[backend](model_name, batch_size=batch_size)
+
+
+# ----------------------------------------------------------------------
+# Exportação dos artefactos
+# ----------------------------------------------------------------------
+def _dir_size_mb(path: str) -> float:
+    size = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+    return round(size / 1024 / 1024, 1)
+
+
+def _swap_dir(tmp_dir: str, out_dir: str) -> None:
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+
+
+def export_model(
+    model_name: Optional[str] = None, out_dir: Optional[str] = None, fp16: bool = False
+) -> dict:
+    """
+    Descarrega o modelo e grava-o como artefacto local (escrita atómica).
+    Com `fp16` os pesos ficam em float16 (metade do tamanho); ao carregar são
+    convertidos para float32.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model_name = model_name or agent_settings.EMBEDDING_MODEL
+    out_dir = out_dir or local_model_path(model_name)
+
+    start = time.perf_counter()
+    model = SentenceTransformer(model_name, device="cpu")
+    if fp16:
+        model.half()
+
+    tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    model.save(tmp_dir)
+    artifact = {
+        "model": model_name,
+        "backend": "torch",
+        "dtype": "float16" if fp16 else "float32",
+        "dimension": model.get_sentence_embedding_dimension(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(tmp_dir, ARTIFACT_FILE), "w", encoding="utf-8") as f:
+        json.dump(artifact, f, indent=2)
+    _swap_dir(tmp_dir, out_dir)
+
+    artifact["path"] = out_dir
+    artifact["size_mb"] = _dir_size_mb(out_dir)
+    artifact["seconds"] = round(time.perf_counter() - start, 1)
+    return artifact
+
+
+def export_onnx(
+    model_name: Optional[str] = None, out_dir: Optional[str] = None, opset: int = 14
+) -> dict:
+    """
+    Exporta o transformer do modelo para ONNX (model.onnx) e cria também a
+    versão quantizada em int8 (model-int8.onnx, quantização dinâmica dos pesos).
+    O pooling e a normalização são feitos em NumPy por `OnnxEmbeddings`.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    model_name = model_name or agent_settings.EMBEDDING_MODEL
+    out_dir = out_dir or onnx_model_path(model_name)
+
+    start = time.perf_counter()
+    st = SentenceTransformer(model_name, device="cpu")
+    pooling = next(m for m in st.modules() if isinstance(m, Pooling))
+    if not pooling.pooling_mode_mean_tokens:
+        raise ValueError(f"{model_name}: só é suportado mean pooling.")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+
+    tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    sample = tokenizer(["exemplo de frase", "outro exemplo"], padding=True, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(tmp_dir, ONNX_FILES["fp32"])
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    quantize_dynamic(
+        fp32_path, os.path.join(tmp_dir, ONNX_FILES["int8"]), weight_type=QuantType.QInt8
+    )
+    # Só precisamos do tokenizer.json (tokenizers), mas gravamos o resto para referência
+    tokenizer.save_pretrained(tmp_dir)
+
+    artifact = {
+        "model": model_name,
+        "backend": "onnx",
+        "dimension": st.get_sentence_embedding_dimension(),
+        "max_seq_length": st.max_seq_length,
+        "normalize": any(isinstance(m, Normalize) for m in st.modules()),
+        "opset": opset,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(tmp_dir, ARTIFACT_FILE), "w", encoding="utf-8") as f:
+        json.dump(artifact, f, indent=2)
+    _swap_dir(tmp_dir, out_dir)
+
+    artifact["path"] = out_dir
+    artifact["size_mb"] = {
+        variant: round(os.path.getsize(os.path.join(out_dir, name)) / 1024 / 1024, 1)
+        for variant, name in ONNX_FILES.items()
+    }
+    artifact["seconds"] = round(time.perf_counter() - start, 1)
+    return artifact
+
+
+# ----------------------------------------------------------------------
+# Verificação de paridade ONNX vs. PyTorch
+# ----------------------------------------------------------------------
+def _parity_texts(n_chunks: int) -> Tuple[List[str], int]:
+    """Perguntas dos benchmarks + uma amostra de trechos do índice (e n.º de perguntas)."""
+    texts = []
+    questions = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "benchmarks", "questions.jsonl"
+    )
+    if os.path.exists(questions):
+        with open(questions, encoding="utf-8") as f:
+            texts.extend(json.loads(line)["question"] for line in f if line.strip())
+    n_questions = len(texts)
+    try:
+        import chromadb
+
+        client = chromadb.PersistentClient(path=active_dir(agent_settings.CHROMA_DB_DIR))
+        collection = client.get_collection(agent_settings.COLLECTION_NAME)
+        texts.extend(collection.get(limit=n_chunks, include=["documents"])["documents"])
+    except Exception as e:
+        print(f"⚠️ Sem trechos do índice para comparar: {e}", file=sys.stderr)
+    return texts, n_questions
+
+
+def _neighbours(embeddings: np.ndarray, k: int) -> Optional[List[set]]:
+    """Ids dos k trechos mais próximos no índice atual, para cada embedding."""
+    try:
+        import chromadb
+
+        client = chromadb.PersistentClient(path=active_dir(agent_settings.CHROMA_DB_DIR))
+        collection = client.get_collection(agent_settings.COLLECTION_NAME)
+    except Exception:
+        return None
+    result = collection.query(query_embeddings=embeddings.tolist(), n_results=k, include=[])
+    return [set(ids) for ids in result["ids"]]
+
+
+def parity_check(
+    variant: str = "int8", min_cosine: float = 0.99, n_chunks: int = 200, k: int = 4
+) -> dict:
+    """
+    Compara os vetores do ONNX com os do PyTorch (mesmos textos). Passa se a
+    similaridade de cosseno mínima for >= `min_cosine`. Também mede se as
+    perguntas recuperam os mesmos k trechos do índice existente.
+    """
+    model_name = agent_settings.EMBEDDING_MODEL
+    texts, n_questions = _parity_texts(n_chunks)
+
+    reference = np.asarray(torch_embeddings(model_name).embed_documents(texts), dtype=np.float32)
+    onnx = OnnxEmbeddings(
+        onnx_model_path(model_name), variant=variant, threads=agent_settings.EMBEDDING_THREADS
+    )
+    start = time.perf_counter()
+    candidate = onnx.encode(texts)
+    onnx_seconds = time.perf_counter() - start
+
+    cosine = (reference * candidate).sum(axis=1) / np.maximum(
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1), 1e-12
+    )
+    result = {
+        "model": model_name,
+        "variant": variant,
+        "texts": len(texts),
+        "cosine_min": round(float(cosine.min()), 6),
+        "cosine_mean": round(float(cosine.mean()), 6),
+        "max_abs_diff": round(float(np.abs(reference - candidate).max()), 6),
+        "onnx_texts_per_s": round(len(texts) / onnx_seconds, 1) if onnx_seconds else None,
+        "min_cosine": min_cosine,
+    }
+
+    if n_questions:
+        ref_hits = _neighbours(reference[:n_questions], k)
+        new_hits = _neighbours(candidate[:n_questions], k)
+        if ref_hits is not None:
+            overlaps = [len(a & b) / max(len(a), 1) for a, b in zip(ref_hits, new_hits)]
+            result[f"top{k}_overlap"] = round(float(np.mean(overlaps)), 4)
+
+    result["ok"] = result["cosine_min"] >= min_cosine
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Artefactos e backends do modelo de embeddings.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Grava o modelo (PyTorch) em EMBEDDING_MODEL_DIR.")
+    export.add_argument("--model", help="Nome no hub (por omissão, EMBEDDING_MODEL).")
+    export.add_argument("--out", help="Pasta de destino.")
+    export.add_argument("--fp16", action="store_true", help="Guardar os pesos em float16.")
+    export_onnx_cmd = sub.add_parser("export-onnx", help="Exporta para ONNX (fp32 + int8).")
+    export_onnx_cmd.add_argument("--model", help="Nome no hub (por omissão, EMBEDDING_MODEL).")
+    export_onnx_cmd.add_argument("--out", help="Pasta de destino.")
+    parity = sub.add_parser("parity", help="Compara os vetores ONNX com os do PyTorch.")
+    parity.add_argument("--variant", choices=sorted(ONNX_FILES), default="int8")
+    parity.add_argument("--min-cosine", type=float, default=0.99)
+    parity.add_argument("--chunks", type=int, default=200, help="Trechos do índice a comparar.")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(json.dumps(export_model(args.model, args.out, args.fp16), indent=2))
+    elif args.command == "export-onnx":
+        print(json.dumps(export_onnx(args.model, args.out), indent=2))
+    else:
+        report = parity_check(args.variant, args.min_cosine, args.chunks)
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report["ok"] else 1)
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from .answer_cache import normalize_question, question_key
+from .config_agent import agent_settings
+from .index_builds import active_dir
+from .metrics import registry
+
+FAQ_LOOKUPS = registry.counter(
+    "rag_faq_lookups_total",
+    "Consultas à tabela de perguntas frequentes (answer, retrieval, miss).",
+    ["result"],
+)
+
+
+def index_version() -> str:
+    """Versão do índice ativo (campo "version" do manifesto da ingestão); "" se não houver."""
+    path = os.path.join(active_dir(agent_settings.CHROMA_DB_DIR), agent_settings.MANIFEST_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("version", "")
+    except (OSError, ValueError):
+        return ""
+
+
+def retrieval_params() -> dict:
+    """Configuração da recuperação que decide os trechos (e as respostas) da tabela."""
+    return {
+        "embedding_model": agent_settings.EMBEDDING_MODEL,
+        "retrieval_mode": agent_settings.RETRIEVAL_MODE,
+        "retriever_k": agent_settings.RETRIEVER_K,
+        "rerank_model": agent_settings.RERANK_MODEL if agent_settings.RERANK_ENABLED else None,
+    }
+
+
+def faq_path() -> str:
+    """Tabela do build ativo (cada build tem a sua)."""
+    return os.path.join(active_dir(agent_settings.CHROMA_DB_DIR), agent_settings.FAQ_DIR)
+
+
+def _key(question: str) -> int:
+    return int(question_key(question)[:16], 16)
+
+
+def load_questions(path: str) -> List[str]:
+    """Lista de perguntas (JSON: lista de strings ou de objetos com "question")."""
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    return [item["question"] if isinstance(item, dict) else item for item in raw]
+
+
+class FaqTable:
+    """
+    Resultados pré-calculados das perguntas frequentes, só de leitura.
+
+    Ficheiros (em FAQ_DIR, dentro do build ativo do índice):
+    - keys.npy: hashes (uint64) das perguntas normalizadas, ordenados;
+    - offsets.npy: início de cada registo em records.bin (+ fim do último);
+    - records.bin: um JSON por pergunta (ids dos trechos, fontes, resposta);
+    - meta.json: versão do índice e configuração da recuperação para que foi gerada.
+
+    Tudo é aberto em memory-map: uma consulta é uma pesquisa binária nos
+    hashes e a leitura de um registo. A tabela só é usada se a versão for a
+    do índice atual e a recuperação estiver configurada da mesma forma
+    (modo, k, reordenação); caso contrário fica ignorada até ser refeita.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        # None = segue o build ativo do índice (a pasta é resolvida em cada reload)
+        self._path = path
+        self.path = path or faq_path()
+        self._lock = threading.Lock()
+        self._loaded = False
+        # (keys, offsets, records, meta): trocado de uma vez, para uma consulta
+        # nunca misturar duas versões da tabela
+        self._table: Optional[tuple] = None
+        self.meta: dict = {}
+        self.stale = False
+
+    def _load(self) -> None:
+        path = self._path or faq_path()
+        table, meta, stale = None, {}, False
+        try:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            keys = np.load(os.path.join(path, "keys.npy"), mmap_mode="r")
+            offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+            records = np.memmap(os.path.join(path, "records.bin"), dtype=np.uint8, mode="r")
+        except (OSError, ValueError):
+            meta = {}
+        else:
+            params = retrieval_params()
+            if meta.get("index_version") != index_version() or any(
+                meta.get(name) != value for name, value in params.items()
+            ):
+                stale = True
+            else:
+                table = (keys, offsets, records, meta)
+        self._table, self.meta, self.stale, self.path = table, meta, stale, path
+
+    def reload(self) -> None:
+        """
+        Volta a abrir a tabela (ex.: depois de uma ingestão, de uma troca de
+        build ou de `python -m app.faq build`).
+        """
+        with self._lock:
+            self._load()
+            self._loaded = True
+
+    def lookup(self, question: str) -> Optional[dict]:
+        """Registo da pergunta (None se não for uma pergunta frequente)."""
+        if not self._loaded:
+            self.reload()
+        table = self._table
+        if table is None or not len(table[0]):
+            FAQ_LOOKUPS.inc(result="miss")
+            return None
+        keys, offsets, records, meta = table
+        key = np.uint64(_key(question))
+        i = int(np.searchsorted(keys, key))
+        if i >= len(keys) or keys[i] != key:
+            FAQ_LOOKUPS.inc(result="miss")
+            return None
+        start, end = int(offsets[i]), int(offsets[i + 1])
+        record = json.loads(records[start:end].tobytes().decode("utf-8"))
+        if record["key"] != normalize_question(question):
+            FAQ_LOOKUPS.inc(result="miss")
+            return None
+        if meta.get("llm_model") != agent_settings.OPENAI_MODEL:
+            # Respostas geradas por outro modelo: só os trechos continuam válidos
+            record["answer"] = None
+        return record
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "entries": len(self._table[0]) if self._table is not None else 0,
+            "index_version": self.meta.get("index_version"),
+            "with_answers": self.meta.get("with_answers", False),
+            "built_at": self.meta.get("built_at"),
+            "stale": self.stale,
+            "lookups": {
+                result: FAQ_LOOKUPS.value(result=result)
+                for result in ("answer", "retrieval", "miss")
+            },
+        }
+
+
+def write_table(path: str, records: List[dict], meta: dict) -> None:
+    """Grava a tabela (pasta temporária + troca atómica)."""
+    records = sorted(records, key=lambda r: _key(r["key"]))
+    keys = np.array([_key(r["key"]) for r in records], dtype=np.uint64)
+    blobs = [json.dumps(r, ensure_ascii=False).encode("utf-8") for r in records]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+
+    tmp_dir = path.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "keys.npy"), keys)
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    with open(os.path.join(tmp_dir, "records.bin"), "wb") as f:
+        for blob in blobs:
+            f.write(blob)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(meta, entries=len(records)), f, ensure_ascii=False, indent=2)
+
+    old_dir = path.rstrip("/\\") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_dir)
+    os.replace(tmp_dir, path)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def build_faq(questions: List[str], with_answers: bool = False) -> dict:
+    """
+    Corre as perguntas pela recuperação (embeddings em lote, pesquisa e
+    reordenação, como no /chat/batch) e, com `with_answers`, também pelo LLM
+    (sem histórico). Grava a tabela para a versão atual do índice.
+    """
+    from .agent import build_prompt, describe_sources, rerank, rerank_candidates
+    from .llm import llm_client
+    from .retrieval import chunk_id, retrieval_engine
+
+    questions = list(dict.fromkeys(q for q in questions if normalize_question(q)))
+    embeddings = retrieval_engine.embed_queries(questions)
+    results = retrieval_engine.search_many(questions, embeddings, rerank_candidates())
+
+    records = {}
+    for question, hits in zip(questions, results):
+        docs = rerank(question, [doc for doc, _ in hits])
+        answer = None
+        if with_answers:
+            answer = llm_client.invoke(build_prompt("", question, docs)).content
+        records[normalize_question(question)] = {
+            "key": normalize_question(question),
+            "question": question,
+            "chunk_ids": [chunk_id(doc) for doc in docs],
+            "sources": describe_sources(docs),
+            "answer": answer,
+        }
+        print(f"  {question} -> {len(docs)} trechos{' + resposta' if answer else ''}")
+
+    meta = {
+        "index_version": index_version(),
+        **retrieval_params(),
+        "with_answers": with_answers,
+        "llm_model": agent_settings.OPENAI_MODEL if with_answers else None,
+        "built_at": time.time(),
+    }
+    write_table(faq_path(), list(records.values()), meta)
+    if faq_table is not None:
+        faq_table.reload()
+    print(f"Tabela de perguntas frequentes: {len(records)} perguntas em {faq_path()}.")
+    return meta
+
+
+def _build_faq_table() -> Optional[FaqTable]:
+    if not agent_settings.FAQ_ENABLED:
+        return None
+    return FaqTable()
+
+
+# Instância única por processo (None se a tabela estiver desligada)
+faq_table = _build_faq_table()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pré-cálculo das perguntas frequentes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Gera a tabela para a versão atual do índice.")
+    build.add_argument("--questions", default=agent_settings.FAQ_QUESTIONS_PATH)
+    build.add_argument(
+        "--answers", action="store_true", help="Gera também as respostas (chama o LLM)."
+    )
+    args = parser.parse_args()
+
+    build_faq(load_questions(args.questions), with_answers=args.answers)
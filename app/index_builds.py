@@ -0,0 +1,166 @@
+import os
+import shutil
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+# Dentro de CHROMA_DB_DIR: builds/<build>/ (Chroma, manifesto, índices) e o ponteiro CURRENT
+BUILDS_DIR = "builds"
+CURRENT_FILE = "CURRENT"
+# Prefixo das pastas de builds ainda em construção
+STAGING_PREFIX = ".staging-"
+
+
+def builds_root(base: str) -> str:
+    return os.path.join(base, BUILDS_DIR)
+
+
+def build_path(base: str, build: str) -> str:
+    return os.path.join(builds_root(base), build)
+
+
+def current_build(base: str) -> Optional[str]:
+    """Nome do build ativo (conteúdo de CURRENT), ou None no layout antigo (sem builds)."""
+    try:
+        with open(os.path.join(base, CURRENT_FILE), encoding="utf-8") as f:
+            build = f.read().strip()
+    except OSError:
+        return None
+    return build or None
+
+
+def active_dir(base: str) -> str:
+    """
+    Pasta do índice em uso: o build apontado por CURRENT ou, se ainda não
+    houver builds (ingestão antiga), a própria `base`.
+    """
+    build = current_build(base)
+    return build_path(base, build) if build else base
+
+
+def new_build_name(version: str) -> str:
+    """Nome de um build novo: data/hora (ordenável) + versão do conteúdo."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{version[:8]}"
+
+
+def staging_path(base: str) -> str:
+    """Build em construção (fica no disco depois de uma falha, para ser retomado)."""
+    return os.path.join(builds_root(base), f"{STAGING_PREFIX}ingest")
+
+
+def publish_build(base: str, build: str) -> None:
+    """Aponta CURRENT para o build (ficheiro temporário + rename: troca atómica)."""
+    path = os.path.join(base, CURRENT_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(build + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def list_builds(base: str) -> List[str]:
+    """Builds completos, do mais antigo para o mais recente."""
+    root = builds_root(base)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(root)
+        if not name.startswith(".") and os.path.isdir(os.path.join(root, name))
+    )
+
+
+def prune_builds(base: str, keep: int, previous: Optional[str] = None) -> List[str]:
+    """
+    Apaga os builds antigos, ficando com os `keep` mais recentes e sempre com
+    o ativo e o `previous` (o ativo antes da última publicação) ou mais
+    recentes. Os workers que ainda não trocaram continuam a servir o build
+    anterior, e o Chroma abre ligações SQLite e segmentos por thread, quando
+    precisa: apagá-lo faria falhar a próxima ligação nova desses workers.
+    """
+    current = current_build(base)
+    builds = list_builds(base)
+    kept = set(builds[-max(keep, 1):]) | {current}
+    if previous is not None:
+        kept |= {name for name in builds if name >= previous}
+    removed = [name for name in builds if name not in kept]
+    for name in removed:
+        shutil.rmtree(build_path(base, name), ignore_errors=True)
+    return removed
+
+
+class BuildWatcher:
+    """
+    Thread que verifica periodicamente o ponteiro CURRENT e chama
+    `on_change(build)` quando aponta para outro build. Também chama
+    `on_touch()` se um ficheiro do build ativo (ex.: a tabela de perguntas
+    frequentes, gerada depois de publicar) mudar.
+    """
+
+    def __init__(
+        self,
+        base: str,
+        interval: float,
+        on_change: Callable[[Optional[str]], None],
+        touch_files: Tuple[str, ...] = (),
+        on_touch: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.base = base
+        self.interval = interval
+        self.on_change = on_change
+        self.touch_files = touch_files
+        self.on_touch = on_touch
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.checks = 0
+        self.errors = 0
+
+    def _touched(self) -> Tuple[Optional[int], ...]:
+        root = active_dir(self.base)
+        stamps = []
+        for name in self.touch_files:
+            try:
+                stamps.append(os.stat(os.path.join(root, name)).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        build = current_build(self.base)
+        touched = self._touched()
+        while not self._stop.wait(self.interval):
+            self.checks += 1
+            try:
+                latest = current_build(self.base)
+                if latest != build:
+                    self.on_change(latest)
+                    build = latest
+                    touched = self._touched()
+                    continue
+                stamps = self._touched()
+                if stamps != touched and self.on_touch is not None:
+                    self.on_touch()
+                touched = stamps
+            except Exception as e:
+                # Tenta de novo na próxima verificação; o build atual continua em uso
+                self.errors += 1
+                print(f"⚠️ [index] Falha ao trocar de índice: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "interval_s": self.interval,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "checks": self.checks,
+            "errors": self.errors,
+        }
@@ -0,0 +1,78 @@
+import os
+import time
+from typing import Optional
+
+from .config_agent import agent_settings
+from .faq import faq_table
+from .index_builds import BuildWatcher, current_build
+from .metrics import registry
+from .retrieval import retrieval_engine
+
+INDEX_RELOADS = registry.counter(
+    "rag_index_reloads_total",
+    "Trocas para o build ativo do índice (ok, unchanged, error).",
+    ["result"],
+)
+
+
+def reload_index() -> dict:
+    """
+    Passa o processo para o build ativo do índice: motor de recuperação e
+    tabela de perguntas frequentes. O build novo é carregado enquanto os
+    pedidos continuam a ser servidos pelo anterior.
+    """
+    start = time.perf_counter()
+    try:
+        changed = retrieval_engine.reload()
+        if faq_table is not None:
+            faq_table.reload()
+    except Exception:
+        INDEX_RELOADS.inc(result="error")
+        raise
+    INDEX_RELOADS.inc(result="ok" if changed else "unchanged")
+    state = retrieval_engine.state
+    if changed:
+        print(f"🔁 [index] Build ativo: {state.build or state.path} (versão {state.version}).")
+    return {
+        "changed": changed,
+        "build": state.build,
+        "version": state.version,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def _reload_faq() -> None:
+    if faq_table is not None:
+        faq_table.reload()
+
+
+def _build_index_watcher() -> Optional[BuildWatcher]:
+    if not agent_settings.INDEX_WATCH_ENABLED:
+        return None
+    return BuildWatcher(
+        agent_settings.CHROMA_DB_DIR,
+        agent_settings.INDEX_WATCH_INTERVAL_S,
+        on_change=lambda build: reload_index(),
+        # A tabela de perguntas frequentes pode ser gerada depois de publicar o build
+        touch_files=(os.path.join(agent_settings.FAQ_DIR, "meta.json"),),
+        on_touch=_reload_faq,
+    )
+
+
+def index_status() -> dict:
+    """Build ativo no disco vs. build carregado neste processo (para o /health)."""
+    state = retrieval_engine.loaded_state
+    return {
+        "current": current_build(agent_settings.CHROMA_DB_DIR),
+        "loaded": state.build if state is not None else None,
+        "version": state.version if state is not None else None,
+        "reloads": {
+            result: INDEX_RELOADS.value(result=result)
+            for result in ("ok", "unchanged", "error")
+        },
+        "watcher": index_watcher.stats() if index_watcher is not None else None,
+    }
+
+
+# Instância única por processo
+index_watcher = _build_index_watcher()
@@ -1,72 +1,752 @@
+import argparse
+import hashlib
+import json
 import os
-from langchain_community.document_loaders import PyPDFLoader
+import queue
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import chromadb
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
 
 from .config import settings
+from .embeddings import build_embeddings
+from .index_builds import (
+    BUILDS_DIR,
+    CURRENT_FILE,
+    active_dir,
+    build_path,
+    current_build,
+    new_build_name,
+    prune_builds,
+    publish_build,
+    staging_path,
+)
+from .language import tag_chunks
+from .lexical import LexicalIndexBuilder
+from .parse_cache import ParseCache, parse_pdf
+from .vector_index import VectorIndexBuilder
+
+DATA_DIR = settings.DATA_DIR
+MANIFEST_VERSION = 1
+# Progresso da ingestão em curso, dentro do build em construção
+CHECKPOINT_FILE = "ingest_checkpoint.jsonl"
+# Versão dos metadados dos chunks (2: language / standard / rel_pos / translation_group;
+# 3: file / page_label / total_pages)
+METADATA_VERSION = 3
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 do conteúdo do ficheiro (lido em blocos)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def list_pdfs(data_dir: str = DATA_DIR) -> Dict[str, str]:
+    """Devolve {nome do ficheiro: caminho} para todos os PDFs da pasta."""
+    return {
+        file: os.path.join(data_dir, file)
+        for file in sorted(os.listdir(data_dir))
+        if file.lower().endswith(".pdf")
+    }
+
+
+def _parse_pdf(path: str) -> Tuple[List[dict], float]:
+    """Lê um PDF (corre num processo do pool, por isso tem de ser top-level)."""
+    start = time.perf_counter()
+    pages = parse_pdf(path)
+    return pages, time.perf_counter() - start
+
+
+def _worker_count(n_files: int) -> int:
+    workers = settings.INGEST_WORKERS or os.cpu_count() or 1
+    return max(1, min(workers, n_files))
+
+
+def pages_to_documents(path: str, pages: List[dict]) -> List[Document]:
+    """
+    Uma Document por página, com a proveniência que segue para os chunks:
+    source (caminho), file (nome), page (0-based), page_label (n.º impresso)
+    e total_pages. O `start_index` de cada chunk é o deslocamento na página.
+    """
+    name = os.path.basename(path)
+    return [
+        Document(
+            page_content=p["text"],
+            metadata={
+                "source": path,
+                "file": name,
+                "page": p["page"],
+                "page_label": p["label"],
+                "total_pages": len(pages),
+            },
+        )
+        for p in pages
+    ]
+
+
+def iter_pages(
+    paths: List[str],
+    hashes: List[str] = None,
+    use_cache: bool = True,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[Tuple[str, List[dict]]]:
+    """
+    Gera (caminho, páginas) para cada PDF, pela ordem de `paths`.
+
+    As páginas extraídas ficam na cache de parsing (PARSE_CACHE_PATH), pela
+    hash do ficheiro: um PDF que não mudou não volta a ser lido. Os restantes
+    são lidos em paralelo num pool de processos, no máximo INGEST_QUEUE_SIZE
+    ficheiros à frente do consumidor (a memória não cresce com o corpus).
+    Sem `pool`, cria (e fecha no fim) um pool próprio.
+    """
+    if not paths:
+        return
+    cache = None
+    if use_cache and settings.PARSE_CACHE_PATH:
+        cache = ParseCache(settings.PARSE_CACHE_PATH)
+        if hashes is None:
+            hashes = [file_hash(path) for path in paths]
+
+    workers = _worker_count(len(paths))
+    ahead = max(workers, settings.INGEST_QUEUE_SIZE)
+    own_pool = pool is None and workers > 1
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    pending: "deque[Tuple[int, Future, bool]]" = deque()
 
-DATA_DIR = "data/normas"
+    def submit(i: int) -> None:
+        pages = cache.get(hashes[i]) if cache is not None else None
+        future: Future = Future()
+        if pages is not None:
+            future.set_result((pages, 0.0))
+        elif pool is not None:
+            future = pool.submit(_parse_pdf, paths[i])
+        else:
+            future.set_result(_parse_pdf(paths[i]))
+        pending.append((i, future, pages is not None))
 
+    try:
+        next_i = 0
+        while pending or next_i < len(paths):
+            while next_i < len(paths) and len(pending) < ahead:
+                submit(next_i)
+                next_i += 1
+            i, future, cached = pending.popleft()
+            pages, seconds = future.result()
+            print(f"Carregando PDF: {paths[i]}{' (cache)' if cached else ''}")
+            if cache is not None and not cached:
+                cache.put(hashes[i], os.path.basename(paths[i]), pages, seconds)
+            yield paths[i], pages
+    finally:
+        if own_pool:
+            pool.shutdown(wait=True, cancel_futures=True)
 
-def load_documents():
-    """Carrega todos os PDFs da pasta data/normas como Document objects do LangChain."""
+
+def load_documents(
+    paths: List[str] = None, hashes: List[str] = None, use_cache: bool = True
+) -> List[Document]:
+    """
+    Carrega os PDFs indicados (por omissão, todos os da pasta data/normas)
+    como Document objects do LangChain, uma por página, todos em memória.
+    A ingestão usa `iter_pages`, um ficheiro de cada vez.
+    """
+    if paths is None:
+        paths = list(list_pdfs().values())
     docs = []
-    for file in os.listdir(DATA_DIR):
-        if file.lower().endswith(".pdf"):
-            path = os.path.join(DATA_DIR, file)
-            print(f"Carregando PDF: {path}")
-            loader = PyPDFLoader(path)
-            pdf_docs = loader.load()
-            docs.extend(pdf_docs)
+    for path, pages in iter_pages(paths, hashes, use_cache):
+        docs.extend(pages_to_documents(path, pages))
     return docs
 
 
+def _splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        separators=["\n\n", "\n", ".", " ", ""],
+        add_start_index=True,
+    )
+
+
 def split_documents(docs):
     """
     Divide os documentos em chunks menores.
     chunk_size: tamanho do pedaço em caracteres
     chunk_overlap: sobreposição entre chunks para não perder contexto.
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", ".", " ", ""],
-    )
-    chunks = splitter.split_documents(docs)
+    chunks = _splitter().split_documents(docs)
     print(f"Total de chunks gerados: {len(chunks)}")
     return chunks
 
 
-def build_vector_store(chunks):
+def chunk_ids_for(chunks: List[Document], name: str, digest: str) -> List[str]:
     """
-    Cria embeddings locais (HuggingFace) e persiste tudo num ChromaDB local.
-    NÃO usa OpenAI, logo não consome quota de API.
+    Ids determinísticos: nome + hash do PDF + posição do chunk no ficheiro.
+    Se o PDF não mudar, os ids também não mudam.
     """
+    prefix = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+    return [f"{prefix}-{digest[:16]}-{i:05d}" for i in range(len(chunks))]
+
+
+# ----------------------------------------------------------------------
+# Manifesto
+# ----------------------------------------------------------------------
+def manifest_path(index_dir: str) -> str:
+    return os.path.join(index_dir, settings.MANIFEST_FILE)
+
+
+def index_params() -> dict:
+    """Parâmetros que, se mudarem, obrigam a reconstruir o índice todo."""
+    return {
+        "embedding_model": settings.EMBEDDING_MODEL,
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "metadata_version": METADATA_VERSION,
+    }
+
+
+def load_manifest(index_dir: str) -> dict:
+    path = manifest_path(index_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, index_dir: str) -> None:
+    """Escrita atómica (ficheiro temporário + rename)."""
+    path = manifest_path(index_dir)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def plan_changes(
+    hashes: Dict[str, str], manifest: dict
+) -> Tuple[List[str], List[str], List[str]]:
+    """Compara os hashes atuais com o manifesto: (novos, alterados, removidos)."""
+    known = manifest.get("files", {})
+    added = [name for name in hashes if name not in known]
+    changed = [
+        name for name in hashes if name in known and known[name]["sha256"] != hashes[name]
+    ]
+    deleted = [name for name in known if name not in hashes]
+    return added, changed, deleted
+
+
+class Checkpoint:
+    """
+    Progresso de uma ingestão no build em construção, num ficheiro JSON lines
+    só de acréscimo: um cabeçalho (build de origem e parâmetros) e uma linha
+    por PDF já indexado por completo. Depois de uma falha, a ingestão seguinte
+    retoma no mesmo build, sem voltar a ler nem a embeber esses PDFs.
+    """
+
+    def __init__(self, index_dir: str, header: dict) -> None:
+        self.path = os.path.join(index_dir, CHECKPOINT_FILE)
+        self.header = header
+        self.files: Dict[str, dict] = {}
+        self.stale_removed = False
+
+    @classmethod
+    def resume(cls, index_dir: str, header: dict) -> Optional["Checkpoint"]:
+        """Checkpoint da ingestão interrompida, se for para os mesmos build e parâmetros."""
+        checkpoint = cls(index_dir, header)
+        try:
+            with open(checkpoint.path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        if not lines or lines[0] != json.dumps(header, sort_keys=True):
+            return None
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Última linha escrita a meio (a falha foi durante a escrita)
+                break
+            if record.get("stale_removed"):
+                checkpoint.stale_removed = True
+            elif record.get("removed"):
+                checkpoint.files.pop(record["file"], None)
+            else:
+                checkpoint.files[record["file"]] = {
+                    "sha256": record["sha256"],
+                    "chunk_ids": record["chunk_ids"],
+                }
+        return checkpoint
+
+    def start(self) -> None:
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header, sort_keys=True) + "\n")
+
+    def _append(self, record: dict) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def mark_stale_removed(self) -> None:
+        self.stale_removed = True
+        self._append({"stale_removed": True})
+
+    def file_done(self, name: str, sha256: str, chunk_ids: List[str]) -> None:
+        self.files[name] = {"sha256": sha256, "chunk_ids": chunk_ids}
+        self._append({"file": name, "sha256": sha256, "chunk_ids": chunk_ids})
+
+    def forget(self, name: str) -> None:
+        self.files.pop(name, None)
+        self._append({"file": name, "removed": True})
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ----------------------------------------------------------------------
+# Base vetorial
+# ----------------------------------------------------------------------
+def get_collection(reset: bool = False, path: str = None):
+    client = chromadb.PersistentClient(path=path or settings.CHROMA_DB_DIR)
+    if reset:
+        try:
+            client.delete_collection(settings.COLLECTION_NAME)
+        except Exception:
+            pass
+    return client.get_or_create_collection(settings.COLLECTION_NAME)
+
+
+def get_embeddings():
+    """Embeddings locais (Hugging Face): NÃO usa OpenAI, logo não consome quota de API."""
     print("A inicializar modelo de embeddings (Hugging Face)...")
+    return build_embeddings(settings.EMBEDDING_MODEL, batch_size=64)
+
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
+def delete_chunks(collection, ids: List[str]) -> None:
+    batch = settings.EMBED_BATCH_SIZE
+    for start in range(0, len(ids), batch):
+        collection.delete(ids=ids[start:start + batch])
+
+
+def _clean_metadata(metadata: dict) -> dict:
+    """O Chroma só aceita valores escalares (sem None) nos metadados."""
+    return {
+        k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))
+    }
+
+
+def _upsert_batch(
+    collection, chunks: List[Document], ids: List[str], texts: List[str], vectors
+) -> None:
+    collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        documents=texts,
+        metadatas=[_clean_metadata(c.metadata) for c in chunks],
     )
 
-    vectordb = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=settings.CHROMA_DB_DIR,
-        collection_name=settings.COLLECTION_NAME,
+
+def upsert_chunks(collection, embeddings, chunks: List[Document], ids: List[str]) -> None:
+    """Calcula embeddings em lotes grandes e faz upsert no Chroma."""
+    batch = settings.EMBED_BATCH_SIZE
+    for start in range(0, len(chunks), batch):
+        part = chunks[start:start + batch]
+        texts = [c.page_content for c in part]
+        _upsert_batch(
+            collection, part, ids[start:start + batch], texts, embeddings.embed_documents(texts)
+        )
+        print(f"  {min(start + batch, len(chunks))}/{len(chunks)} chunks indexados")
+
+
+def lexical_index_path(index_dir: str) -> str:
+    return os.path.join(index_dir, settings.LEXICAL_INDEX_DIR)
+
+
+def build_lexical(collection, index_dir: str) -> dict:
+    """
+    Reconstrói o índice BM25 a partir de todos os trechos guardados no Chroma,
+    página a página (as postings de cada página vão para disco).
+    """
+    builder = LexicalIndexBuilder(lexical_index_path(index_dir))
+    batch = settings.EMBED_BATCH_SIZE
+    total = collection.count()
+    for offset in range(0, total, batch):
+        page = collection.get(limit=batch, offset=offset, include=["documents", "metadatas"])
+        builder.add(
+            page["ids"],
+            page["documents"],
+            languages=[(m or {}).get("language", "und") for m in page["metadatas"]],
+        )
+    meta = builder.finish()
+    print(
+        f"Índice lexical: {meta['documents']} chunks, {meta['terms']} termos, "
+        f"línguas {', '.join(meta['languages'])}."
+    )
+    return meta
+
+
+def vector_index_path(index_dir: str) -> str:
+    return os.path.join(index_dir, settings.VECTOR_INDEX_DIR)
+
+
+def build_vectors(collection, index_dir: str) -> dict:
+    """
+    Reconstrói o índice vetorial compacto com os mesmos trechos e embeddings
+    guardados no Chroma (VECTOR_STORE=compact no agente), página a página: os
+    vetores vão para uma matriz em disco, não para a memória.
+    """
+    total = collection.count()
+    builder = VectorIndexBuilder(
+        vector_index_path(index_dir),
+        total,
+        dtype=settings.VECTOR_INDEX_DTYPE,
+        n_lists=settings.VECTOR_INDEX_LISTS,
+    )
+    batch = settings.EMBED_BATCH_SIZE
+    for offset in range(0, total, batch):
+        page = collection.get(
+            limit=batch, offset=offset, include=["embeddings", "documents", "metadatas"]
+        )
+        builder.add(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+    meta = builder.finish()
+    print(
+        f"Índice vetorial compacto: {meta['documents']} chunks, {meta['dtype']}, "
+        f"{meta['lists'] or 'sem'} listas IVF."
+    )
+    return meta
+
+
+# ----------------------------------------------------------------------
+# Pipeline: ficheiro -> páginas -> chunks -> lotes de embeddings -> upsert
+# ----------------------------------------------------------------------
+_END = object()
+
+
+def prefetch(items: Iterable, size: int) -> Iterator:
+    """
+    Consome `items` numa thread própria e entrega-os por uma fila limitada a
+    `size` elementos: a etapa anterior trabalha em paralelo com a seguinte,
+    mas nunca se adianta mais do que `size` elementos (memória limitada).
+    Um erro na etapa anterior é relançado no consumidor.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(size, 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_END, e))
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name="ingest-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = q.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        # Consumidor terminou (ou falhou): a thread produtora desiste
+        stop.set()
+
+
+def iter_file_chunks(
+    pdfs: Dict[str, str],
+    hashes: Dict[str, str],
+    names: List[str],
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[Tuple[str, List[Document], List[str]]]:
+    """(nome, chunks, ids) de cada PDF, um ficheiro de cada vez."""
+    splitter = _splitter()
+    pages_by_file = iter_pages(
+        [pdfs[name] for name in names], [hashes[name] for name in names], pool=pool
+    )
+    for name, (path, pages) in zip(names, pages_by_file):
+        chunks = splitter.split_documents(pages_to_documents(path, pages))
+        tag_chunks(chunks, name)
+        print(f"A indexar {name} ({len(pages)} páginas, {len(chunks)} chunks)...")
+        yield name, chunks, chunk_ids_for(chunks, name, hashes[name])
+
+
+def iter_batches(
+    files: Iterable[Tuple[str, List[Document], List[str]]], batch_size: int
+) -> Iterator[Tuple[str, List[Document], List[str], bool]]:
+    """Lotes de até `batch_size` chunks; o último lote de cada PDF leva last=True."""
+    for name, chunks, ids in files:
+        if not chunks:
+            yield name, [], [], True
+        for start in range(0, len(chunks), batch_size):
+            end = start + batch_size
+            yield name, chunks[start:end], ids[start:end], end >= len(chunks)
+
+
+def iter_embedded(batches: Iterable, embeddings) -> Iterator:
+    """Acrescenta a cada lote os textos e os respetivos embeddings."""
+    for name, chunks, ids, last in batches:
+        texts = [c.page_content for c in chunks]
+        vectors = embeddings.embed_documents(texts) if texts else []
+        yield name, chunks, ids, texts, vectors, last
+
+
+def index_files(
+    collection,
+    pdfs: Dict[str, str],
+    hashes: Dict[str, str],
+    names: List[str],
+    on_file_done: Callable[[str, List[str]], None],
+) -> int:
+    """
+    Indexa os PDFs `names` em fluxo, com três etapas em paralelo ligadas por
+    filas limitadas (INGEST_QUEUE_SIZE): leitura + divisão em chunks,
+    embeddings e upsert no Chroma. Em memória ficam só alguns ficheiros e
+    lotes de cada vez, por isso o pico não cresce com o tamanho do corpus.
+
+    `on_file_done(nome, ids)` é chamado quando todos os chunks de um PDF já
+    estão no Chroma. Devolve o número de chunks indexados.
+    """
+    if not names:
+        return 0
+    workers = _worker_count(len(names))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if pool is not None:
+            # Os processos do pool nascem (fork) antes de o modelo criar as suas threads
+            pool.submit(os.getpid).result()
+        embeddings = get_embeddings()
+        size = settings.INGEST_QUEUE_SIZE
+        files = iter_file_chunks(pdfs, hashes, names, pool)
+        batches = prefetch(iter_batches(files, settings.EMBED_BATCH_SIZE), size)
+        file_ids: Dict[str, List[str]] = {}
+        total = 0
+        for name, chunks, ids, texts, vectors, last in prefetch(
+            iter_embedded(batches, embeddings), size
+        ):
+            if texts:
+                _upsert_batch(collection, chunks, ids, texts, vectors)
+            file_ids.setdefault(name, []).extend(ids)
+            total += len(ids)
+            if last:
+                ids = file_ids.pop(name)
+                on_file_done(name, ids)
+                print(f"  {name}: {len(ids)} chunks indexados ({total} no total)")
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    return total
+
+
+def _copy_index(source: str, target: str) -> None:
+    """
+    Copia o Chroma e o manifesto do build ativo para um build novo (o ativo
+    nunca é alterado). Os índices derivados são reconstruídos no build novo.
+    """
+    shutil.copytree(
+        source,
+        target,
+        ignore=shutil.ignore_patterns(
+            BUILDS_DIR,
+            CURRENT_FILE,
+            settings.LEXICAL_INDEX_DIR,
+            settings.VECTOR_INDEX_DIR,
+            settings.FAQ_DIR,
+            "*.tmp",
+            "*.old",
+        ),
     )
 
-    vectordb.persist()
-    print(f"Base vetorial criada em {settings.CHROMA_DB_DIR}")
-    return vectordb
+
+def _has_index(index_dir: str, name: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, name, "meta.json"))
+
+
+def ingest(full: bool = False, resume: bool = True) -> dict:
+    """
+    Ingestão incremental: só os PDFs novos ou alterados são lidos e
+    re-embedded; os chunks de PDFs alterados ou removidos são apagados.
+    Os PDFs passam em fluxo pelo pipeline (`index_files`), com memória limitada.
+
+    O build ativo (o que a API está a ler) nunca é alterado: as mudanças são
+    feitas numa cópia em CHROMA_DB_DIR/builds/, que só é publicada (ponteiro
+    CURRENT, trocado de forma atómica) depois de completa. Ficam os últimos
+    INDEX_KEEP_BUILDS builds. Se a ingestão falhar a meio, a cópia fica com o
+    checkpoint e a próxima execução retoma-a (exceto com resume=False).
+    Devolve o manifesto do novo build.
+    """
+    start = time.perf_counter()
+    base = settings.CHROMA_DB_DIR
+    pdfs = list_pdfs()
+    hashes = {name: file_hash(path) for name, path in pdfs.items()}
+
+    previous = active_dir(base)
+    manifest = load_manifest(previous)
+    if manifest.get("params") != index_params():
+        full = True
+    if not manifest:
+        # Sem índice, ou índice antigo sem manifesto (ids desconhecidos): reconstruir tudo
+        full = True
+    if full:
+        manifest = {}
+
+    added, changed, deleted = plan_changes(hashes, manifest)
+    print(f"PDFs novos: {len(added)}, alterados: {len(changed)}, removidos: {len(deleted)}")
+    work = staging_path(base)
+    if (
+        not (full or added or changed or deleted)
+        and previous != base
+        and _has_index(previous, settings.LEXICAL_INDEX_DIR)
+        and _has_index(previous, settings.VECTOR_INDEX_DIR)
+    ):
+        shutil.rmtree(work, ignore_errors=True)
+        print(f"Índice já atualizado ({previous}).")
+        return manifest
+
+    header = {"base_build": current_build(base), "params": index_params(), "full": full}
+    checkpoint = Checkpoint.resume(work, header) if resume else None
+    resumed = checkpoint is not None
+    if resumed:
+        print(f"A retomar a ingestão interrompida ({len(checkpoint.files)} PDFs já indexados).")
+    else:
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(os.path.dirname(work), exist_ok=True)
+        if full:
+            print("Reconstrução completa do índice.")
+            os.makedirs(work)
+        else:
+            _copy_index(previous, work)
+        checkpoint = Checkpoint(work, header)
+        checkpoint.start()
+
+    try:
+        collection = get_collection(path=work)
+
+        files = dict(manifest.get("files", {}))
+        stale = []
+        for name in changed + deleted:
+            stale.extend(files.pop(name)["chunk_ids"])
+        if stale and not checkpoint.stale_removed:
+            delete_chunks(collection, stale)
+            checkpoint.mark_stale_removed()
+            print(f"{len(stale)} chunks antigos removidos.")
+
+        # PDFs já indexados antes da interrupção, se não mudaram entretanto
+        for name, entry in list(checkpoint.files.items()):
+            if hashes.get(name) == entry["sha256"]:
+                files[name] = entry
+            else:
+                delete_chunks(collection, entry["chunk_ids"])
+                checkpoint.forget(name)
+        todo = [name for name in added + changed if name not in checkpoint.files]
+        if resumed:
+            for name in todo:
+                # Lotes de um PDF que ficou a meio (os ids dependem da hash do PDF)
+                collection.delete(where={"file": name})
+
+        def file_done(name: str, ids: List[str]) -> None:
+            checkpoint.file_done(name, hashes[name], ids)
+            files[name] = checkpoint.files[name]
+
+        index_files(collection, pdfs, hashes, todo, file_done)
+
+        build_lexical(collection, work)
+        build_vectors(collection, work)
+        chunks_total = collection.count()
+
+        # Identifica o conteúdo do índice: muda sempre que um PDF muda
+        version = hashlib.sha256(
+            json.dumps(
+                {
+                    "params": index_params(),
+                    "files": {name: files[name]["sha256"] for name in sorted(files)},
+                },
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()[:16]
+        build = new_build_name(version)
+        manifest = {
+            "manifest_version": MANIFEST_VERSION,
+            "params": index_params(),
+            "version": version,
+            "build": build,
+            "built_at": time.time(),
+            "files": files,
+        }
+        save_manifest(manifest, work)
+        checkpoint.remove()
+        os.rename(work, build_path(base, build))
+    except BaseException:
+        print(f"⚠️ Ingestão interrompida; a próxima execução retoma a partir de {work}.")
+        raise
+
+    previous = current_build(base)
+    publish_build(base, build)
+    # O build anterior fica até à próxima publicação: há workers que ainda o servem
+    removed = prune_builds(base, settings.INDEX_KEEP_BUILDS, previous)
+    print(
+        f"Base vetorial publicada: {build_path(base, build)} "
+        f"({chunks_total} chunks, {time.perf_counter() - start:.1f}s)"
+        + (f"; builds antigos apagados: {', '.join(removed)}" if removed else "")
+    )
+    return manifest
 
 
 if __name__ == "__main__":
-    print("=== Início da ingestão de normas de auditoria (Hugging Face) ===")
-    docs = load_documents()
-    print(f"{len(docs)} documentos (páginas) carregados dos PDFs.")
+    parser = argparse.ArgumentParser(description="Ingestão de normas de auditoria.")
+    parser.add_argument(
+        "--full", action="store_true", help="Ignora o manifesto e reconstrói o índice."
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Descarta uma ingestão interrompida em vez de a retomar.",
+    )
+    parser.add_argument(
+        "--faq",
+        action="store_true",
+        help="No fim, pré-calcula as perguntas frequentes para a nova versão do índice.",
+    )
+    parser.add_argument(
+        "--faq-answers",
+        action="store_true",
+        help="Com --faq, gera também as respostas (chama o LLM).",
+    )
+    args = parser.parse_args()
 
-    chunks = split_documents(docs)
-    vectordb = build_vector_store(chunks)
+    print("=== Início da ingestão de normas de auditoria (Hugging Face) ===")
+    ingest(full=args.full, resume=not args.no_resume)
+    if args.faq:
+        from .config_agent import agent_settings
+        from .faq import build_faq, load_questions
 
+        build_faq(
+            load_questions(agent_settings.FAQ_QUESTIONS_PATH), with_answers=args.faq_answers
+        )
     print("=== Ingestão concluída com sucesso. ===")
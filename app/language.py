@@ -0,0 +1,138 @@
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Palavras muito frequentes (e pouco ambíguas) de cada língua do corpus
+_STOPWORDS = {
+    "pt": frozenset(
+        "é são não da do das dos na no nas nos em um uma ao aos à às também qual quais "
+        "como seu sua seus suas ou pelo pela pelos pelas entre sobre deve devem isso".split()
+    ),
+    "es": frozenset(
+        "el la los las del y es son una un al también cuál cuáles su sus se lo por "
+        "entre sobre debe deben esto como".split()
+    ),
+    "en": frozenset(
+        "the and of to is are in for that with on by be an as which this should "
+        "from or it its their".split()
+    ),
+    "fr": frozenset(
+        "le la les des du et est sont une un dans pour qui sur au aux ce cette pas "
+        "doit doivent par ou leur".split()
+    ),
+    "de": frozenset(
+        "der die das und ist den dem des ein eine nicht mit von zu für auf sind im "
+        "sollte werden oder bei".split()
+    ),
+}
+# Sufixos que distinguem o português do espanhol
+_SUFFIXES = {"pt": ("ção", "ções", "ão", "ões"), "es": ("ción", "ciones")}
+
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+_ARABIC_RE = re.compile("[\u0600-\u06ff\u0750-\u077f]")
+_STANDARD_RE = re.compile(r"(ISSAI|GUID)[\s_-]*(\d{3,4})", re.IGNORECASE)
+
+
+def detect_language(text: str, min_score: int = 2) -> Optional[str]:
+    """
+    Língua de um texto (pt, es, en, fr, de, ar) por escrita e palavras frequentes.
+    Devolve None se o texto for curto ou ambíguo demais para decidir.
+    """
+    letters = sum(1 for ch in text if ch.isalpha())
+    if letters and len(_ARABIC_RE.findall(text)) / letters > 0.3:
+        return "ar"
+
+    scores: Counter = Counter()
+    for word in _WORD_RE.findall(text.lower()):
+        for lang, stopwords in _STOPWORDS.items():
+            if word in stopwords:
+                scores[lang] += 1
+        for lang, suffixes in _SUFFIXES.items():
+            if word.endswith(suffixes):
+                scores[lang] += 2
+    if not scores:
+        return None
+    (best, score), *rest = scores.most_common(2) + [(None, 0)]
+    if score < min_score or score == rest[0][1]:
+        return None
+    return best
+
+
+def detect_standard(name: str) -> str:
+    """Norma a que um ficheiro pertence (ex.: "ISSAI-300"), pelo nome; "" se não se souber."""
+    match = _STANDARD_RE.search(name)
+    return f"{match.group(1).upper()}-{match.group(2)}" if match else ""
+
+
+def tag_chunks(chunks: Sequence, name: str) -> None:
+    """
+    Acrescenta aos metadados dos chunks de UM ficheiro:
+
+    - language: língua do chunk (a do ficheiro quando o chunk é curto/ambíguo);
+    - standard: norma (ISSAI-300, GUID-2900, ...), a partir do nome do ficheiro;
+    - rel_pos: posição relativa do chunk no documento (0 = início, 1 = fim);
+    - translation_group: norma + posição relativa arredondada a 1%.
+
+    Traduções do mesmo parágrafo ficam com a mesma norma e posições relativas
+    próximas, o que permite eliminar duplicados entre línguas na pesquisa.
+    """
+    if not chunks:
+        return
+    detected = [detect_language(c.page_content, min_score=5) for c in chunks]
+    votes = Counter(lang for lang in detected if lang)
+    file_language = votes.most_common(1)[0][0] if votes else "und"
+
+    pages = [int(c.metadata.get("page") or 0) for c in chunks]
+    n_pages = max(pages) + 1
+    page_len: dict = {}
+    for chunk, page in zip(chunks, pages):
+        end = int(chunk.metadata.get("start_index") or 0) + len(chunk.page_content)
+        page_len[page] = max(page_len.get(page, 1), end)
+
+    standard = detect_standard(name)
+    for chunk, page, language in zip(chunks, pages, detected):
+        start = int(chunk.metadata.get("start_index") or 0)
+        rel_pos = (page + start / page_len[page]) / n_pages
+        chunk.metadata["language"] = language or file_language
+        chunk.metadata["standard"] = standard
+        chunk.metadata["rel_pos"] = round(rel_pos, 5)
+        chunk.metadata["translation_group"] = f"{standard or name}:{int(rel_pos * 100):02d}"
+
+
+def route_languages(
+    question: str, fallback: Iterable[str], available: Optional[Iterable[str]] = None
+) -> Optional[List[str]]:
+    """
+    Línguas onde pesquisar: a da pergunta seguida das línguas de recurso,
+    restritas às existentes no índice. None = sem filtro (inclui perguntas
+    em que não se reconhece a língua, como "GUID 2900 A.3").
+    """
+    language = detect_language(question, min_score=1)
+    if language is None:
+        return None
+    languages = list(dict.fromkeys([language] + list(fallback)))
+    if available is not None:
+        available = set(available)
+        languages = [lang for lang in languages if lang in available]
+    return languages or None
+
+
+def dedupe_translations(hits: Sequence[Tuple], window: float) -> List[Tuple]:
+    """
+    Remove traduções do mesmo trecho: mantém o mais relevante de cada grupo de
+    chunks da mesma norma, em línguas diferentes e com posição relativa a
+    menos de `window`. `hits` são pares (Document, score) por relevância.
+    """
+    kept: List[Tuple] = []
+    for doc, score in hits:
+        meta = doc.metadata
+        standard, rel_pos = meta.get("standard"), meta.get("rel_pos")
+        if standard and rel_pos is not None and any(
+            other.metadata.get("standard") == standard
+            and other.metadata.get("language") != meta.get("language")
+            and abs(other.metadata.get("rel_pos", -1.0) - rel_pos) <= window
+            for other, _ in kept
+        ):
+            continue
+        kept.append((doc, score))
+    return kept
@@ -0,0 +1,296 @@
+import json
+import math
+import os
+import re
+import shutil
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Palavras, números e referências compostas como "2200.a8", "a.3" ou "3000-3899"
+_TOKEN_RE = re.compile(r"\w+(?:[.\-/]\w+)*", re.UNICODE)
+
+INDEX_FORMAT = 1
+# Postings por bloco ao escrever os arrays finais (ordenados por termo)
+_BLOCK_POSTINGS = 1 << 20
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokens para o BM25: minúsculas, NFKC. Referências compostas ("a.3",
+    "2200.a8") geram o token inteiro e também as partes, para que
+    "GUID 2900 A.3" encontre tanto "a.3" como "2900".
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[.\-/]", token) if part)
+    return tokens
+
+
+class LexicalIndexBuilder:
+    """
+    Constrói o índice BM25 lote a lote (ex.: as páginas de `collection.get`):
+    as postings de cada lote (termo, documento, frequência) são acrescentadas
+    a ficheiros em disco, e no fim ordenadas por termo e escritas por blocos.
+    Em memória ficam só o vocabulário, os ids e o comprimento de cada
+    documento. Os ficheiros gravados estão descritos em `build_lexical_index`.
+    """
+
+    def __init__(self, out_dir: str, k1: float = 1.2, b: float = 0.75) -> None:
+        self.out_dir = out_dir
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.postings = 0
+        self._tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        os.makedirs(self._tmp_dir)
+        self._vocabulary: Dict[str, int] = {}
+        self._doc_len: List[np.ndarray] = []
+        self._language_codes: List[np.ndarray] = []
+        self._languages: Dict[str, int] = {}
+        self._files = {
+            name: open(self._path(f"{name}.bin"), "wb") for name in ("terms", "docs", "tfs")
+        }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._tmp_dir, name)
+
+    def add(
+        self, ids: List[str], texts: Iterable[str], languages: Optional[List[str]] = None
+    ) -> None:
+        """Acrescenta um lote de documentos ao índice."""
+        base = len(self.ids)
+        doc_len = np.zeros(len(ids), dtype=np.uint32)
+        terms: List[int] = []
+        docs: List[int] = []
+        tfs: List[int] = []
+        for doc_idx, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len[doc_idx] = sum(counts.values())
+            for term, tf in counts.items():
+                terms.append(self._vocabulary.setdefault(term, len(self._vocabulary)))
+                docs.append(base + doc_idx)
+                tfs.append(min(tf, 65535))
+        np.array(terms, dtype=np.uint32).tofile(self._files["terms"])
+        np.array(docs, dtype=np.uint32).tofile(self._files["docs"])
+        np.array(tfs, dtype=np.uint16).tofile(self._files["tfs"])
+        self.postings += len(terms)
+        self.ids.extend(ids)
+        self._doc_len.append(doc_len)
+        if languages is not None:
+            self._language_codes.append(
+                np.array(
+                    [self._languages.setdefault(lang, len(self._languages)) for lang in languages],
+                    dtype=np.uint8,
+                )
+            )
+
+    def _spilled(self, name: str, dtype) -> np.ndarray:
+        if not self.postings:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._path(f"{name}.bin"), dtype=dtype, mode="r")
+
+    def finish(self) -> dict:
+        """Ordena as postings por termo, grava o índice e troca a pasta (atómico para leitores)."""
+        for f in self._files.values():
+            f.close()
+        n = len(self.ids)
+        by_id = list(self._vocabulary)
+        sorted_ids = sorted(range(len(by_id)), key=by_id.__getitem__)
+        terms = [by_id[i] for i in sorted_ids]
+        rank = np.empty(len(by_id), dtype=np.uint32)
+        rank[sorted_ids] = np.arange(len(by_id), dtype=np.uint32)
+
+        # Ordenação estável: dentro de cada termo, os documentos ficam por ordem
+        term_ranks = rank[self._spilled("terms", np.uint32)]
+        order = np.argsort(term_ranks, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+        offsets[1:] = np.cumsum(np.bincount(term_ranks, minlength=len(terms)))
+        del term_ranks
+        for name, dtype in (("docs", np.uint32), ("tfs", np.uint16)):
+            spilled = self._spilled(name, dtype)
+            out_name = "postings.npy" if name == "docs" else "tfs.npy"
+            if self.postings:
+                out = np.lib.format.open_memmap(
+                    self._path(out_name), mode="w+", dtype=dtype, shape=(self.postings,)
+                )
+                for start in range(0, self.postings, _BLOCK_POSTINGS):
+                    block = order[start:start + _BLOCK_POSTINGS]
+                    out[start:start + len(block)] = spilled[block]
+                out.flush()
+                del out
+            else:
+                np.save(self._path(out_name), spilled)
+            del spilled
+            os.remove(self._path(f"{name}.bin"))
+        os.remove(self._path("terms.bin"))
+
+        doc_len = np.concatenate(self._doc_len) if self._doc_len else np.zeros(0, np.uint32)
+        language_names = sorted(self._languages)
+        remap = np.zeros(max(len(self._languages), 1), dtype=np.uint8)
+        for name, code in self._languages.items():
+            remap[code] = language_names.index(name)
+        language_codes = (
+            remap[np.concatenate(self._language_codes)]
+            if self._language_codes
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+        meta = {
+            "format": INDEX_FORMAT,
+            "documents": n,
+            "terms": len(terms),
+            "postings": int(self.postings),
+            "avg_doc_len": float(doc_len.mean()) if n else 0.0,
+            "k1": self.k1,
+            "b": self.b,
+            "languages": language_names,
+        }
+
+        np.save(self._path("offsets.npy"), offsets)
+        np.save(self._path("doc_len.npy"), doc_len)
+        np.save(self._path("languages.npy"), language_codes)
+        with open(self._path("terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(self._path("ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
+        with open(self._path("meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        old_dir = self.out_dir.rstrip("/\\") + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.out_dir):
+            os.replace(self.out_dir, old_dir)
+        os.replace(self._tmp_dir, self.out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return meta
+
+
+def build_lexical_index(
+    ids: List[str],
+    texts: Iterable[str],
+    out_dir: str,
+    k1: float = 1.2,
+    b: float = 0.75,
+    languages: Optional[List[str]] = None,
+) -> dict:
+    """
+    Constrói um índice invertido compacto (arrays NumPy) e grava-o em `out_dir`
+    (num só lote; para corpora grandes, usar `LexicalIndexBuilder` lote a lote):
+
+    - terms.json      lista ordenada de termos (o índice do termo é a posição)
+    - offsets.npy     uint64 [V+1]: início das postings de cada termo
+    - postings.npy    uint32: índices dos documentos
+    - tfs.npy         uint16: frequência do termo em cada documento
+    - doc_len.npy     uint32: número de tokens de cada documento
+    - ids.json        id do chunk (no Chroma) de cada documento
+    - languages.npy   uint8: língua de cada documento (índice em meta["languages"])
+
+    A escrita é feita numa pasta temporária e trocada no fim (atómica para leitores).
+    """
+    builder = LexicalIndexBuilder(out_dir, k1=k1, b=b)
+    builder.add(ids, texts, languages=languages)
+    return builder.finish()
+
+
+class LexicalIndex:
+    """Índice BM25 carregado do disco; os arrays grandes ficam memory-mapped."""
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self._term_index = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "ids.json"), encoding="utf-8") as f:
+            self.ids: List[str] = json.load(f)
+        self._offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self._postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self._tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self._doc_len = np.asarray(
+            np.load(os.path.join(path, "doc_len.npy"), mmap_mode="r"), dtype=np.float32
+        )
+        languages_path = os.path.join(path, "languages.npy")
+        self.languages: List[str] = self.meta.get("languages", [])
+        self._languages = (
+            np.load(languages_path) if os.path.exists(languages_path) else np.empty(0, np.uint8)
+        )
+        self.path = path
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LexicalIndex"]:
+        """Carrega o índice, ou devolve None se ainda não foi construído."""
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Pontuação BM25 de todos os documentos para a pergunta."""
+        n = len(self.ids)
+        scores = np.zeros(n, dtype=np.float32)
+        if n == 0:
+            return scores
+        k1, b = self.meta["k1"], self.meta["b"]
+        avgdl = self.meta["avg_doc_len"] or 1.0
+        for term in set(tokenize(query)):
+            t = self._term_index.get(term)
+            if t is None:
+                continue
+            start, end = int(self._offsets[t]), int(self._offsets[t + 1])
+            docs = self._postings[start:end]
+            tf = self._tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            norm = k1 * (1.0 - b + b * self._doc_len[docs] / avgdl)
+            scores[docs] += idf * tf * (k1 + 1.0) / (tf + norm)
+        return scores
+
+    def language_mask(self, languages: Optional[List[str]]) -> Optional[np.ndarray]:
+        """Máscara booleana dos documentos nas línguas pedidas (None = todos)."""
+        if not languages or len(self._languages) != len(self.ids):
+            return None
+        codes = [self.languages.index(lang) for lang in languages if lang in self.languages]
+        return np.isin(self._languages, codes)
+
+    def search(
+        self, query: str, k: int, languages: Optional[List[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """Top-k (chunk id, pontuação BM25), opcionalmente só nas línguas indicadas."""
+        scores = self.scores(query)
+        mask = self.language_mask(languages)
+        if mask is not None:
+            scores[~mask] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return []
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        order = candidates[np.argsort(-scores[candidates])]
+        return [(self.ids[i], float(scores[i])) for i in order]
+
+    def status(self) -> dict:
+        return {
+            "documents": self.meta["documents"],
+            "terms": self.meta["terms"],
+            "postings": self.meta["postings"],
+            "languages": self.languages,
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Combina várias listas ordenadas de ids: score(id) = soma de 1 / (k + posição)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            fused[id_] = fused.get(id_, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,393 @@
+import asyncio
+import email.utils
+import hashlib
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import httpx
+
+from .config_agent import agent_settings
+from .metrics import record_llm_tokens, registry, stage
+
+LLM_RETRIES = registry.counter(
+    "llm_retries_total", "Repetições de chamadas ao LLM (429 / 5xx / timeouts)."
+)
+
+
+class LLMResponse:
+    """Resposta do LLM: texto + contagem de tokens (quando o backend a devolve)."""
+
+    __slots__ = ("content", "input_tokens", "output_tokens")
+
+    def __init__(self, content: str, input_tokens: int = 0, output_tokens: int = 0) -> None:
+        self.content = content
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class LLMBackend:
+    """Interface de um backend de LLM (OpenAI, servidor local compatível, etc.)."""
+
+    def invoke(self, prompt: str) -> LLMResponse:
+        raise NotImplementedError
+
+    async def ainvoke(self, prompt: str) -> LLMResponse:
+        raise NotImplementedError
+
+    def astream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        """Pedaços da resposta; a contagem de tokens pode vir só no último."""
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+def _usage(message) -> tuple:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    ChatOpenAI com clientes HTTP partilhados (pool de ligações com keep-alive).
+    Com LLM_BASE_URL pode apontar para qualquer servidor compatível com a API
+    da OpenAI (ex.: um servidor local para testes de carga sem rede).
+    """
+
+    def __init__(self) -> None:
+        from langchain_openai import ChatOpenAI
+
+        limits = httpx.Limits(
+            max_connections=agent_settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=agent_settings.LLM_MAX_KEEPALIVE,
+            keepalive_expiry=agent_settings.LLM_KEEPALIVE_SECONDS,
+        )
+        timeout = httpx.Timeout(agent_settings.LLM_TIMEOUT_SECONDS, connect=10.0)
+        self._http_client = httpx.Client(limits=limits, timeout=timeout)
+        self._http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        self._llm = ChatOpenAI(
+            api_key=agent_settings.OPENAI_API_KEY or "local",
+            model=agent_settings.OPENAI_MODEL,
+            temperature=agent_settings.LLM_TEMPERATURE,
+            base_url=agent_settings.LLM_BASE_URL or None,
+            timeout=agent_settings.LLM_TIMEOUT_SECONDS,
+            # As repetições são feitas pelo LLMClient, que respeita o Retry-After
+            max_retries=0,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+            # Pede a contagem de tokens também nas respostas em streaming
+            stream_usage=True,
+        )
+
+    def invoke(self, prompt: str) -> LLMResponse:
+        message = self._llm.invoke(prompt)
+        return LLMResponse(message.content, *_usage(message))
+
+    async def ainvoke(self, prompt: str) -> LLMResponse:
+        message = await self._llm.ainvoke(prompt)
+        return LLMResponse(message.content, *_usage(message))
+
+    async def astream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        async for chunk in self._llm.astream(prompt):
+            yield LLMResponse(chunk.content, *_usage(chunk))
+
+    async def aclose(self) -> None:
+        await self._http_async_client.aclose()
+        self._http_client.close()
+
+
+class FakeLLMBackend(LLMBackend):
+    """
+    Backend determinístico e sem rede, para benchmarks e testes de carga.
+    A resposta depende só do prompt; a latência é simulada (LLM_FAKE_LATENCY_MS).
+    """
+
+    def __init__(self) -> None:
+        self.latency = agent_settings.LLM_FAKE_LATENCY_MS / 1000.0
+
+    def _answer(self, prompt: str) -> LLMResponse:
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        content = (
+            f"Resposta simulada {digest[:12]}. A ISSAI 300 define os princípios "
+            "de economia, eficiência e eficácia da auditoria de desempenho."
+        )
+        return LLMResponse(content, len(prompt) // 4, len(content) // 4)
+
+    def invoke(self, prompt: str) -> LLMResponse:
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def ainvoke(self, prompt: str) -> LLMResponse:
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def astream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        response = self._answer(prompt)
+        words = response.content.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            last = i == len(words) - 1
+            yield LLMResponse(
+                word + ("" if last else " "),
+                response.input_tokens if last else 0,
+                response.output_tokens if last else 0,
+            )
+
+
+# Backends disponíveis (LLM_BACKEND); outros podem ser registados em runtime
+_BACKENDS: Dict[str, Callable[[], LLMBackend]] = {
+    "openai": OpenAIBackend,
+    "fake": FakeLLMBackend,
+}
+
+
+def register_backend(name: str, factory: Callable[[], LLMBackend]) -> None:
+    _BACKENDS[name] = factory
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    """Retry-After em segundos ou como data HTTP; None se não for válido."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return when.timestamp() - time.time()
+
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """
+    Segundos a esperar antes de repetir a chamada ao LLM, ou None se o erro
+    não for temporário. Repete em 429 (rate limit), 5xx, timeouts e erros de ligação.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        retryable = isinstance(error, (httpx.TimeoutException, httpx.TransportError)) or (
+            type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+        )
+    else:
+        retryable = status == 429 or status >= 500
+    if not retryable:
+        return None
+
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        seconds = _parse_retry_after(retry_after)
+        if seconds is not None:
+            # Limitado: o pedido ocupa uma vaga do semáforo enquanto espera
+            return min(max(seconds, 0.0), agent_settings.LLM_RETRY_AFTER_MAX_SECONDS)
+    delay = agent_settings.LLM_BACKOFF_SECONDS * (2 ** attempt)
+    return delay * (0.5 + random.random() / 2)
+
+
+class LLMClient:
+    """
+    Cliente de LLM de longa duração, partilhado por todo o processo.
+
+    - um único backend (e pool de ligações HTTP) reutilizado entre pedidos;
+    - no máximo LLM_MAX_CONCURRENCY chamadas em curso no processo;
+    - no máximo LLM_MAX_CONCURRENCY_PER_SESSION por sessão, para que uma
+      sessão não ocupe todas as vagas;
+    - backoff exponencial em 429 / 5xx / timeouts.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._backend: Optional[LLMBackend] = None
+        self._sync_slots = threading.BoundedSemaphore(agent_settings.LLM_MAX_CONCURRENCY)
+        self._async_slots: Optional[asyncio.Semaphore] = None
+        # session_id -> [semáforo, utilizadores]; removido quando fica sem uso
+        self._sync_sessions: Dict[str, list] = {}
+        self._async_sessions: Dict[str, list] = {}
+        self.retries = 0
+
+    @property
+    def backend(self) -> LLMBackend:
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = _BACKENDS[agent_settings.LLM_BACKEND]()
+        return self._backend
+
+    def set_backend(self, backend: LLMBackend) -> None:
+        """Troca o backend (ex.: para testes de carga)."""
+        with self._lock:
+            self._backend = backend
+
+    async def aclose(self) -> None:
+        """Fecha o pool de ligações do backend atual (no shutdown da API)."""
+        with self._lock:
+            old, self._backend = self._backend, None
+        if old is not None:
+            await old.aclose()
+
+    def reset(self) -> None:
+        """
+        Esquece o backend sem o fechar (ex.: depois de restaurar um snapshot da
+        Lambda, as ligações do pool já não existem). É recriado no próximo uso.
+        """
+        with self._lock:
+            self._backend = None
+            self._async_slots = None
+
+    def configured(self) -> bool:
+        """A OpenAI exige chave; backends locais / outros não."""
+        if agent_settings.LLM_BACKEND != "openai" or agent_settings.LLM_BASE_URL:
+            return True
+        return bool(agent_settings.OPENAI_API_KEY)
+
+    # ------------------------------------------------------------------
+    # Controlo de concorrência
+    # ------------------------------------------------------------------
+    def _session_semaphore(self, table: Dict[str, list], session_id: str, factory):
+        with self._lock:
+            entry = table.get(session_id)
+            if entry is None:
+                entry = table[session_id] = [
+                    factory(agent_settings.LLM_MAX_CONCURRENCY_PER_SESSION),
+                    0,
+                ]
+            entry[1] += 1
+            return entry[0]
+
+    def _release_session(self, table: Dict[str, list], session_id: str) -> None:
+        with self._lock:
+            entry = table.get(session_id)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del table[session_id]
+
+    @contextmanager
+    def _sync_slot(self, session_id: Optional[str]):
+        session_sem = None
+        if session_id:
+            session_sem = self._session_semaphore(
+                self._sync_sessions, session_id, threading.BoundedSemaphore
+            )
+            session_sem.acquire()
+        try:
+            with self._sync_slots:
+                yield
+        finally:
+            if session_sem is not None:
+                session_sem.release()
+                self._release_session(self._sync_sessions, session_id)
+
+    @asynccontextmanager
+    async def _async_slot(self, session_id: Optional[str]):
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(agent_settings.LLM_MAX_CONCURRENCY)
+        session_sem = None
+        if session_id:
+            session_sem = self._session_semaphore(
+                self._async_sessions, session_id, asyncio.Semaphore
+            )
+        try:
+            if session_sem is not None:
+                await session_sem.acquire()
+            try:
+                async with self._async_slots:
+                    yield
+            finally:
+                if session_sem is not None:
+                    session_sem.release()
+        finally:
+            if session_id:
+                self._release_session(self._async_sessions, session_id)
+
+    # ------------------------------------------------------------------
+    # Chamadas
+    # ------------------------------------------------------------------
+    def invoke(
+        self, prompt: str, session_id: Optional[str] = None, background: bool = False
+    ) -> LLMResponse:
+        """
+        Chamada síncrona, com repetições. `background=True` é para trabalho fora
+        do caminho do pedido (ex.: resumos do histórico): não entra no estágio
+        "llm" nem nos contadores de tokens dos pedidos, que o chamador regista à parte.
+        """
+        attempt = 0
+        with nullcontext() if background else stage("llm"):
+            while True:
+                try:
+                    with self._sync_slot(session_id):
+                        response = self.backend.invoke(prompt)
+                    if not background:
+                        record_llm_tokens(response.input_tokens, response.output_tokens)
+                    return response
+                except Exception as e:
+                    delay = retry_delay(e, attempt)
+                    if delay is None or attempt >= agent_settings.LLM_MAX_RETRIES:
+                        raise
+                    attempt += 1
+                    self.retries += 1
+                    LLM_RETRIES.inc()
+                    time.sleep(delay)
+
+    async def ainvoke(self, prompt: str, session_id: Optional[str] = None) -> LLMResponse:
+        attempt = 0
+        with stage("llm"):
+            while True:
+                try:
+                    async with self._async_slot(session_id):
+                        response = await self.backend.ainvoke(prompt)
+                    record_llm_tokens(response.input_tokens, response.output_tokens)
+                    return response
+                except Exception as e:
+                    delay = retry_delay(e, attempt)
+                    if delay is None or attempt >= agent_settings.LLM_MAX_RETRIES:
+                        raise
+                    attempt += 1
+                    self.retries += 1
+                    LLM_RETRIES.inc()
+                    await asyncio.sleep(delay)
+
+    async def astream(
+        self, prompt: str, session_id: Optional[str] = None
+    ) -> AsyncIterator[LLMResponse]:
+        """
+        Streaming da resposta. Só se repete a chamada se o erro ocorrer antes
+        do primeiro pedaço (depois disso o cliente já recebeu parte da resposta).
+        """
+        attempt = 0
+        with stage("llm"):
+            while True:
+                started = False
+                try:
+                    async with self._async_slot(session_id):
+                        async for piece in self.backend.astream(prompt):
+                            started = True
+                            record_llm_tokens(piece.input_tokens, piece.output_tokens)
+                            yield piece
+                    return
+                except Exception as e:
+                    delay = None if started else retry_delay(e, attempt)
+                    if delay is None or attempt >= agent_settings.LLM_MAX_RETRIES:
+                        raise
+                    attempt += 1
+                    self.retries += 1
+                    LLM_RETRIES.inc()
+                    await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "backend": agent_settings.LLM_BACKEND,
+            "base_url": agent_settings.LLM_BASE_URL or None,
+            "max_concurrency": agent_settings.LLM_MAX_CONCURRENCY,
+            "active_sessions": len(self._async_sessions) + len(self._sync_sessions),
+            "retries": self.retries,
+        }
+
+
+# Instância única por processo
+llm_client = LLMClient()
@@ -0,0 +1,373 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Tuple
+
+from .config_agent import agent_settings
+
+# Uma interação: (pergunta do utilizador, resposta do assistente)
+Turn = Tuple[str, str]
+# Resumo da conversa: (texto, número de ordem da última interação resumida)
+Summary = Tuple[str, int]
+
+
+class SessionStore:
+    """Interface do armazenamento do histórico de conversa por sessão."""
+
+    def add_turn(self, session_id: str, question: str, answer: str) -> None:
+        raise NotImplementedError
+
+    def recent_turns(self, session_id: str, n: int) -> List[Turn]:
+        """Últimas `n` interações da sessão (da mais antiga para a mais recente)."""
+        raise NotImplementedError
+
+    def all_turns(self, session_id: str) -> List[Turn]:
+        raise NotImplementedError
+
+    def has_history(self, session_id: str) -> bool:
+        return bool(self.recent_turns(session_id, 1))
+
+    def turns_after(self, session_id: str, seq: int) -> List[Tuple[int, Turn]]:
+        """
+        Interações guardadas com número de ordem maior do que `seq`, como
+        (seq, interação). O número de ordem cresce sempre dentro da sessão,
+        mesmo quando as interações mais antigas saem.
+        """
+        raise NotImplementedError
+
+    def get_summary(self, session_id: str) -> Summary:
+        """Resumo das interações antigas, ou ("", 0) se ainda não houver."""
+        raise NotImplementedError
+
+    def set_summary(self, session_id: str, summary: str, covered: int) -> None:
+        """Guarda o resumo até à interação `covered` (ignorado se for mais antigo)."""
+        raise NotImplementedError
+
+    def clear(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class _Session:
+    __slots__ = ("turns", "last_seen", "bytes", "seq", "summary", "covered")
+
+    def __init__(self, max_turns: int) -> None:
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.last_seen = time.time()
+        self.bytes = 0
+        # Número de ordem da última interação; a de turns[i] é seq - len(turns) + 1 + i
+        self.seq = 0
+        self.summary = ""
+        self.covered = 0
+
+
+def _turn_size(turn: Turn) -> int:
+    return len(turn[0]) + len(turn[1]) + 64
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Histórico em memória, com limites:
+    - no máximo `max_turns` interações por sessão (as mais antigas saem);
+    - sessões inativas há mais de `ttl_seconds` são apagadas;
+    - o total de texto guardado não passa de `max_bytes` (sai a sessão
+      usada há mais tempo).
+    """
+
+    def __init__(self, max_turns: int, ttl_seconds: float, max_bytes: int) -> None:
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Ordenado por último acesso: a primeira é a usada há mais tempo
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self.evicted_sessions = 0
+
+    def add_turn(self, session_id: str, question: str, answer: str) -> None:
+        turn = (question, answer)
+        with self._lock:
+            session = self._touch(session_id, create=True)
+            if len(session.turns) == session.turns.maxlen:
+                dropped = session.turns[0]
+                session.bytes -= _turn_size(dropped)
+                self._bytes -= _turn_size(dropped)
+            session.turns.append(turn)
+            session.seq += 1
+            session.bytes += _turn_size(turn)
+            self._bytes += _turn_size(turn)
+            self._evict()
+
+    def recent_turns(self, session_id: str, n: int) -> List[Turn]:
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None or n <= 0:
+                return []
+            start = max(0, len(session.turns) - n)
+            return [session.turns[i] for i in range(start, len(session.turns))]
+
+    def all_turns(self, session_id: str) -> List[Turn]:
+        with self._lock:
+            session = self._touch(session_id)
+            return list(session.turns) if session else []
+
+    def turns_after(self, session_id: str, seq: int) -> List[Tuple[int, Turn]]:
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None:
+                return []
+            first = session.seq - len(session.turns) + 1
+            start = max(0, seq + 1 - first)
+            return [(first + i, session.turns[i]) for i in range(start, len(session.turns))]
+
+    def get_summary(self, session_id: str) -> Summary:
+        with self._lock:
+            session = self._touch(session_id)
+            return (session.summary, session.covered) if session else ("", 0)
+
+    def set_summary(self, session_id: str, summary: str, covered: int) -> None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            # A sessão pode ter expirado ou sido apagada enquanto o resumo era gerado
+            if session is None or covered <= session.covered:
+                return
+            delta = len(summary) - len(session.summary)
+            session.summary, session.covered = summary, covered
+            session.bytes += delta
+            self._bytes += delta
+            self._evict()
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._drop(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "evicted_sessions": self.evicted_sessions,
+        }
+
+    # Internos (com o lock adquirido)
+    def _touch(self, session_id: str, create: bool = False):
+        session = self._sessions.get(session_id)
+        now = time.time()
+        if session is not None and now - session.last_seen > self.ttl_seconds:
+            self._drop(session_id)
+            session = None
+        if session is None:
+            if not create:
+                return None
+            session = _Session(self.max_turns)
+            self._sessions[session_id] = session
+        session.last_seen = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _drop(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._bytes -= session.bytes
+
+    def _evict(self) -> None:
+        now = time.time()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            expired = now - oldest.last_seen > self.ttl_seconds
+            if not expired and self._bytes <= self.max_bytes:
+                break
+            if len(self._sessions) == 1 and not expired:
+                break  # nunca apagar a sessão que acabou de ser usada
+            self._drop(oldest_id)
+            self.evicted_sessions += 1
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Histórico num ficheiro SQLite local (modo WAL), partilhável por vários
+    processos (workers do uvicorn) na mesma máquina. Como no store em
+    memória, o TTL conta a partir da última interação da sessão: uma sessão
+    ativa mantém todas as interações (até `max_turns`) e o resumo.
+    """
+
+    # A limpeza de sessões expiradas corre a cada N escritas
+    _CLEANUP_EVERY = 100
+    # A sessão teve atividade depois do instante indicado (parâmetros: session_id, limite)
+    _ACTIVE = "(SELECT MAX(ts) FROM turns WHERE session_id = ?) >= ?"
+    _EXPIRED = "(SELECT MAX(ts) FROM turns WHERE session_id = ?) < ?"
+
+    def __init__(self, path: str, max_turns: int, ttl_seconds: float) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS turns (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                ts REAL NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_ts ON turns (ts)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                covered INTEGER NOT NULL,
+                ts REAL NOT NULL
+            )
+            """
+        )
+
+    def _write(self, *statements) -> None:
+        """Executa vários (sql, params) numa única transação de escrita."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Uma ligação por thread (sqlite3 não partilha ligações entre threads),
+        # e por processo: uma ligação herdada de um fork (gunicorn --preload) não serve
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # Transações explícitas (BEGIN IMMEDIATE) para serializar escritores
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add_turn(self, session_id: str, question: str, answer: str) -> None:
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        # O seq é calculado dentro da própria transação (seguro entre processos).
+        # Uma sessão expirada (ainda não limpa) recomeça do zero, como no store em memória
+        self._write(
+            (
+                f"DELETE FROM summaries WHERE session_id = ? AND {self._EXPIRED}",
+                (session_id, session_id, cutoff),
+            ),
+            (
+                f"DELETE FROM turns WHERE session_id = ? AND {self._EXPIRED}",
+                (session_id, session_id, cutoff),
+            ),
+            (
+                "INSERT INTO turns "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM turns WHERE session_id = ?",
+                (session_id, question, answer, now, session_id),
+            ),
+            (
+                "DELETE FROM turns WHERE session_id = ? AND seq <= "
+                "(SELECT MAX(seq) FROM turns WHERE session_id = ?) - ?",
+                (session_id, session_id, self.max_turns),
+            ),
+        )
+        self._writes += 1
+        if self._writes % self._CLEANUP_EVERY == 0:
+            self._cleanup(now)
+
+    def recent_turns(self, session_id: str, n: int) -> List[Turn]:
+        if n <= 0:
+            return []
+        rows = self._conn().execute(
+            f"SELECT question, answer FROM turns WHERE session_id = ? AND {self._ACTIVE} "
+            "ORDER BY seq DESC LIMIT ?",
+            (session_id, session_id, time.time() - self.ttl_seconds, n),
+        ).fetchall()
+        return [(q, a) for q, a in reversed(rows)]
+
+    def all_turns(self, session_id: str) -> List[Turn]:
+        return self.recent_turns(session_id, self.max_turns)
+
+    def turns_after(self, session_id: str, seq: int) -> List[Tuple[int, Turn]]:
+        rows = self._conn().execute(
+            "SELECT seq, question, answer FROM turns WHERE session_id = ? AND seq > ? "
+            f"AND {self._ACTIVE} ORDER BY seq",
+            (session_id, seq, session_id, time.time() - self.ttl_seconds),
+        ).fetchall()
+        return [(s, (q, a)) for s, q, a in rows]
+
+    def get_summary(self, session_id: str) -> Summary:
+        row = self._conn().execute(
+            f"SELECT summary, covered FROM summaries WHERE session_id = ? AND {self._ACTIVE}",
+            (session_id, session_id, time.time() - self.ttl_seconds),
+        ).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+
+    def set_summary(self, session_id: str, summary: str, covered: int) -> None:
+        # Só substitui um resumo mais antigo (outro worker pode ter resumido primeiro)
+        self._write(
+            (
+                "INSERT INTO summaries VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET "
+                "summary = excluded.summary, covered = excluded.covered, ts = excluded.ts "
+                "WHERE excluded.covered > summaries.covered",
+                (session_id, summary, covered, time.time()),
+            )
+        )
+
+    def clear(self, session_id: str) -> None:
+        self._write(
+            ("DELETE FROM turns WHERE session_id = ?", (session_id,)),
+            ("DELETE FROM summaries WHERE session_id = ?", (session_id,)),
+        )
+
+    def _cleanup(self, now: float) -> None:
+        """Apaga as sessões cuja última interação é mais antiga do que o TTL."""
+        self._write(
+            (
+                "DELETE FROM turns WHERE session_id IN ("
+                "  SELECT session_id FROM turns GROUP BY session_id HAVING MAX(ts) < ?"
+                ")",
+                (now - self.ttl_seconds,),
+            ),
+            # Resumos de sessões que já não têm interações (o seq recomeça em 1)
+            ("DELETE FROM summaries WHERE session_id NOT IN (SELECT session_id FROM turns)", ()),
+        )
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        row = conn.execute("SELECT COUNT(DISTINCT session_id), COUNT(*) FROM turns").fetchone()
+        summaries = conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        return {"backend": "sqlite", "sessions": row[0], "turns": row[1], "summaries": summaries}
+
+
+def _build_session_store() -> SessionStore:
+    if agent_settings.SESSION_STORE == "sqlite":
+        return SQLiteSessionStore(
+            path=agent_settings.SESSION_DB_PATH,
+            max_turns=agent_settings.SESSION_MAX_TURNS,
+            ttl_seconds=agent_settings.SESSION_TTL_SECONDS,
+        )
+    return InMemorySessionStore(
+        max_turns=agent_settings.SESSION_MAX_TURNS,
+        ttl_seconds=agent_settings.SESSION_TTL_SECONDS,
+        max_bytes=agent_settings.SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+    )
+
+
+# Instância única por processo
+session_store = _build_session_store()
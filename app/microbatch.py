@@ -0,0 +1,129 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+from .metrics import registry
+
+BATCH_SIZES = registry.histogram(
+    "rag_embed_batch_size",
+    "Perguntas por lote do micro-batcher de embeddings.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+BATCH_WAIT_SECONDS = registry.histogram(
+    "rag_embed_batch_wait_seconds",
+    "Espera de cada pergunta no micro-batcher até o lote começar.",
+)
+
+# (texto, futuro, instante de chegada)
+_Item = Tuple[str, Future, float]
+
+
+class MicroBatchEmbedder:
+    """
+    Junta perguntas de pedidos concorrentes num só forward pass do modelo.
+
+    Uma thread dedicada espera pela 1.ª pergunta, junta as que chegarem nos
+    `max_wait_ms` seguintes (até `max_batch_size`), calcula os embeddings em
+    lote e entrega cada resultado ao respetivo futuro. Enquanto o modelo
+    corre, as novas perguntas acumulam-se para o lote seguinte.
+
+    Os chamadores síncronos esperam no futuro (`embed`); os assíncronos
+    esperam sem ocupar uma thread (`aembed`).
+    """
+
+    def __init__(
+        self,
+        embed_many: Callable[[List[str]], List[List[float]]],
+        max_wait_ms: float = 2.0,
+        max_batch_size: int = 32,
+    ) -> None:
+        self.embed_many = embed_many
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue: "queue.Queue[_Item]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.batches = 0
+        self.queries = 0
+
+    def _ensure_thread(self) -> None:
+        # A thread não sobrevive a um fork (gunicorn --preload): nova thread por processo
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="embed-microbatch", daemon=True
+                )
+                self._thread.start()
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def submit(self, text: str) -> Future:
+        self._ensure_thread()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def stats(self) -> dict:
+        return {
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    # ------------------------------------------------------------------
+    # Thread do batcher
+    # ------------------------------------------------------------------
+    def _collect(self, q: "queue.Queue[_Item]") -> List[_Item]:
+        batch = [q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            # Futuros cancelados (cliente desistiu) saem do lote
+            batch = [item for item in self._collect(q) if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            for _, _, queued_at in batch:
+                BATCH_WAIT_SECONDS.observe(start - queued_at)
+
+            # Perguntas repetidas no mesmo lote são calculadas uma vez
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            BATCH_SIZES.observe(len(texts))
+            self.batches += 1
+            self.queries += len(batch)
+            try:
+                vectors = dict(zip(texts, self.embed_many(texts)))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for text, future, _ in batch:
+                future.set_result(vectors[text])
@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+# Muda sempre que a extração (texto ou metadados das páginas) mudar
+PARSER_VERSION = 1
+
+
+def parser_id() -> str:
+    """Extrator usado (versão do pypdf + desta extração): outra versão obriga a reler os PDFs."""
+    import pypdf
+
+    return f"pypdf-{pypdf.__version__}/{PARSER_VERSION}"
+
+
+def parse_pdf(path: str) -> List[dict]:
+    """
+    Texto e layout de cada página do PDF: número (0-based), rótulo impresso
+    (ex.: "iv", "12"), dimensões em pontos e rotação.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    try:
+        labels = list(reader.page_labels)
+    except Exception:
+        labels = []
+    pages = []
+    for number, page in enumerate(reader.pages):
+        box = page.mediabox
+        pages.append(
+            {
+                "page": number,
+                "label": labels[number] if number < len(labels) else str(number + 1),
+                "width": float(box.width),
+                "height": float(box.height),
+                "rotation": int(page.rotation or 0),
+                "text": page.extract_text() or "",
+            }
+        )
+    return pages
+
+
+class ParseCache:
+    """
+    Cache persistente (SQLite) das páginas extraídas dos PDFs, pela hash do
+    ficheiro. Um PDF que não mudou nunca volta a ser lido, mesmo que mudem o
+    tamanho ou a sobreposição dos chunks. O texto é guardado comprimido (zlib).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.parser = parser_id()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    sha256 TEXT NOT NULL,
+                    parser TEXT NOT NULL,
+                    name TEXT,
+                    pages INTEGER,
+                    parse_seconds REAL,
+                    created_at REAL,
+                    PRIMARY KEY (sha256, parser)
+                );
+                CREATE TABLE IF NOT EXISTS pages (
+                    sha256 TEXT NOT NULL,
+                    parser TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    label TEXT,
+                    width REAL,
+                    height REAL,
+                    rotation INTEGER,
+                    chars INTEGER,
+                    text BLOB,
+                    PRIMARY KEY (sha256, parser, page)
+                );
+                """
+            )
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, sha256: str) -> Optional[List[dict]]:
+        """Páginas do ficheiro com esta hash, ou None se ainda não foi lido."""
+        with self._lock:
+            known = self._conn.execute(
+                "SELECT pages FROM files WHERE sha256 = ? AND parser = ?",
+                (sha256, self.parser),
+            ).fetchone()
+            if known is None:
+                self.misses += 1
+                return None
+            rows = self._conn.execute(
+                "SELECT page, label, width, height, rotation, text FROM pages "
+                "WHERE sha256 = ? AND parser = ? ORDER BY page",
+                (sha256, self.parser),
+            ).fetchall()
+        if len(rows) != known[0]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [
+            {
+                "page": page,
+                "label": label,
+                "width": width,
+                "height": height,
+                "rotation": rotation,
+                "text": zlib.decompress(text).decode("utf-8"),
+            }
+            for page, label, width, height, rotation, text in rows
+        ]
+
+    def put(self, sha256: str, name: str, pages: List[dict], parse_seconds: float = 0.0) -> None:
+        with self._lock:
+            conn = self._conn
+            conn.execute(
+                "DELETE FROM pages WHERE sha256 = ? AND parser = ?", (sha256, self.parser)
+            )
+            conn.executemany(
+                "INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        sha256,
+                        self.parser,
+                        p["page"],
+                        p["label"],
+                        p["width"],
+                        p["height"],
+                        p["rotation"],
+                        len(p["text"]),
+                        zlib.compress(p["text"].encode("utf-8"), 6),
+                    )
+                    for p in pages
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, self.parser, name, len(pages), parse_seconds, time.time()),
+            )
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, pages = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM files WHERE parser = ?",
+                (self.parser,),
+            ).fetchone()
+        return {
+            "path": self.path,
+            "parser": self.parser,
+            "files": files,
+            "pages": pages,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,181 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import List, Optional, Sequence, Tuple
+
+from .answer_cache import normalize_question
+from .config_agent import agent_settings
+from .metrics import registry, stage
+from .retrieval import chunk_id
+
+RERANK_RESULTS = registry.counter(
+    "rag_rerank_total",
+    "Reordenações por resultado (ok, timeout, skipped = fila cheia, error).",
+    ["result"],
+)
+
+
+class Reranker:
+    """
+    Reordenação dos trechos candidatos com um cross-encoder local (CPU).
+
+    - um único lote (pergunta, trecho) por pedido, num pool de threads pequeno
+      (RERANK_WORKERS), para limitar o CPU gasto;
+    - orçamento de latência: se a reordenação não acabar em RERANK_TIMEOUT_MS,
+      fica a ordem da pesquisa vetorial (o cálculo termina em segundo plano e
+      as pontuações ficam em cache);
+    - se a fila já tiver 2 x RERANK_WORKERS pedidos, não se reordena (ordem vetorial);
+    - cache LRU das pontuações por (pergunta normalizada, id do trecho).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        timeout_ms: float = 300,
+        max_length: int = 256,
+        cache_size: int = 20000,
+        workers: int = 1,
+    ) -> None:
+        self.model_name = model_name
+        self.timeout = timeout_ms / 1000.0
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._model = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+        self._pending = 0
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # ------------------------------------------------------------------
+    # Modelo
+    # ------------------------------------------------------------------
+    def warm_up(self) -> None:
+        """Carrega o cross-encoder (no arranque, para o 1.º pedido não esgotar o tempo)."""
+        if self._model is not None:
+            return
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                self._model = CrossEncoder(
+                    self.model_name, max_length=self.max_length, device="cpu"
+                )
+
+    def _predict(self, question: str, docs: Sequence) -> List[float]:
+        self.warm_up()
+        pairs = [(question, doc.page_content) for doc in docs]
+        return [float(s) for s in self._model.predict(pairs, batch_size=len(pairs))]
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+    def _cached(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is None:
+                self.cache_misses += 1
+                return None
+            self._scores.move_to_end(key)
+            self.cache_hits += 1
+            return score
+
+    def _store(self, keys: Sequence[Tuple[str, str]], scores: Sequence[float]) -> None:
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def _score_job(self, question: str, keys, docs) -> List[float]:
+        try:
+            scores = self._predict(question, docs)
+            self._store(keys, scores)
+            return scores
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def rerank(self, question: str, docs: Sequence, top_k: int) -> list:
+        """
+        Os `top_k` trechos mais relevantes segundo o cross-encoder. Em caso de
+        timeout, fila cheia ou erro, devolve os primeiros `top_k` pela ordem recebida.
+        """
+        if len(docs) <= 1:
+            return list(docs[:top_k])
+        qkey = hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()
+        keys = [(qkey, chunk_id(doc)) for doc in docs]
+        scores = [self._cached(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        with stage("rerank"):
+            if missing:
+                with self._lock:
+                    busy = self._pending >= 2 * self.workers
+                    if not busy:
+                        self._pending += 1
+                if busy:
+                    RERANK_RESULTS.inc(result="skipped")
+                    return list(docs[:top_k])
+                future = self._executor.submit(
+                    self._score_job,
+                    question,
+                    [keys[i] for i in missing],
+                    [docs[i] for i in missing],
+                )
+                try:
+                    computed = future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    RERANK_RESULTS.inc(result="timeout")
+                    return list(docs[:top_k])
+                except Exception as e:
+                    print(f"⚠️ [rerank] Falha ao reordenar: {e}")
+                    RERANK_RESULTS.inc(result="error")
+                    return list(docs[:top_k])
+                for i, score in zip(missing, computed):
+                    scores[i] = score
+
+            RERANK_RESULTS.inc(result="ok")
+            # Empates ficam pela ordem original (sorted é estável)
+            order = sorted(range(len(docs)), key=lambda i: -scores[i])
+            return [docs[i] for i in order[:top_k]]
+
+    def stats(self) -> dict:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "timeout_ms": round(self.timeout * 1000),
+            "pending": self._pending,
+            "cache_entries": len(self._scores),
+            "cache_hit_rate": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+            "results": {
+                result: RERANK_RESULTS.value(result=result)
+                for result in ("ok", "timeout", "skipped", "error")
+            },
+        }
+
+
+def _build_reranker() -> Optional[Reranker]:
+    if not agent_settings.RERANK_ENABLED:
+        return None
+    return Reranker(
+        agent_settings.RERANK_MODEL,
+        timeout_ms=agent_settings.RERANK_TIMEOUT_MS,
+        max_length=agent_settings.RERANK_MAX_LENGTH,
+        cache_size=agent_settings.RERANK_CACHE_SIZE,
+        workers=agent_settings.RERANK_WORKERS,
+    )
+
+
+# Instância única por processo (None se a reordenação estiver desligada)
+reranker = _build_reranker()
@@ -0,0 +1,643 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from .config_agent import agent_settings
+from .embedding_cache import query_embedding_cache
+from .embeddings import build_embeddings, resolve_model
+from .index_builds import active_dir, current_build
+from .language import dedupe_translations, route_languages
+from .lexical import LexicalIndex, reciprocal_rank_fusion
+from .microbatch import MicroBatchEmbedder
+from .startup import startup_report
+from .vector_index import VectorIndex
+
+# langchain / chromadb / torch só são importados quando o motor é carregado,
+# para que importar a API (ex.: no arranque a frio da Lambda) seja rápido.
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+    from langchain_core.documents import Document
+
+
+def chunk_id(doc: Document) -> str:
+    """
+    Identificador do trecho no índice. Usa o id do Chroma quando existe;
+    caso contrário, um hash do conteúdo e da origem.
+    """
+    if getattr(doc, "id", None):
+        return doc.id
+    raw = "|".join(
+        [str(doc.metadata.get("source")), str(doc.metadata.get("page")), doc.page_content]
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _document(id_: str, text: str, metadata: Optional[dict]) -> Document:
+    from langchain_core.documents import Document
+
+    return Document(page_content=text, metadata=metadata or {}, id=id_)
+
+
+def _read_version(path: str) -> Optional[str]:
+    """Campo "version" do manifesto da ingestão guardado no build."""
+    try:
+        with open(os.path.join(path, agent_settings.MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def _close_vectordb(vectordb: Chroma) -> None:
+    """
+    Fecha o cliente do Chroma de um build que deixou de ser usado. O chromadb
+    guarda um System (índice HNSW, ligações SQLite) por pasta; sem isto, cada
+    build antigo ficaria em memória até o processo terminar.
+    """
+    client = getattr(vectordb, "_client", None)
+    if client is None:
+        return
+    close = getattr(client, "close", None)
+    if close is not None:
+        close()
+        return
+    # chromadb sem Client.close(): tira o System da cache partilhada e para-o
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    system = SharedSystemClient._identifier_to_system.pop(client._identifier, None)
+    if system is not None:
+        system.stop()
+
+
+class IndexState:
+    """
+    Tudo o que depende de um build do índice: coleção Chroma, índice lexical
+    e índice compacto. Um pedido usa sempre o mesmo estado do princípio ao
+    fim; uma troca de índice só muda qual o estado que os pedidos novos veem.
+    Depois de trocado, o Chroma do estado antigo é fechado quando a última
+    pesquisa que o usa termina (`readers` chega a 0).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        build: Optional[str],
+        vectordb: Optional[Chroma],
+        lexical: Optional[LexicalIndex],
+        compact: Optional[VectorIndex],
+    ) -> None:
+        self.path = path
+        self.build = build
+        self.version = _read_version(path)
+        self.vectordb = vectordb
+        self.lexical = lexical
+        # Índice vetorial compacto (VECTOR_STORE=compact); None = Chroma
+        self.compact = compact
+        self.loaded_at = time.time()
+        self.readers = 0
+        self.retired = False
+        # O Chroma foi entregue para fora do motor (get_retriever): nunca é fechado
+        self.pinned = False
+
+
+class RetrievalEngine:
+    """
+    Motor de recuperação partilhado por todo o processo.
+
+    Carrega UMA vez o modelo de embeddings e a coleção Chroma e reutiliza-os
+    em todos os pedidos (incluindo threads diferentes do uvicorn).
+    O carregamento é protegido por um lock; depois de pronto, as leituras
+    não precisam de lock porque só trocamos referências de forma atómica.
+
+    Os índices vêm do build ativo (CHROMA_DB_DIR/CURRENT). `reload` carrega
+    o build novo ao lado do atual e só no fim troca o estado: os pedidos em
+    curso terminam no build antigo.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Serializa as trocas de build (watcher + /admin/reload-index)
+        self._reload_lock = threading.Lock()
+        # Protege os contadores de leitores dos estados
+        self._readers_lock = threading.Lock()
+        self._embeddings = None
+        self._state: Optional[IndexState] = None
+        self._loaded_at: Optional[float] = None
+        self._load_seconds: Optional[float] = None
+        self._error: Optional[str] = None
+        self.reloads = 0
+        # Perguntas de pedidos concorrentes embebidas em lote (None = uma a uma)
+        self._batcher: Optional[MicroBatchEmbedder] = None
+        if agent_settings.EMBED_MICROBATCH_ENABLED:
+            self._batcher = MicroBatchEmbedder(
+                self.embed_documents,
+                max_wait_ms=agent_settings.EMBED_MICROBATCH_MAX_WAIT_MS,
+                max_batch_size=agent_settings.EMBED_MICROBATCH_MAX_SIZE,
+            )
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def _load_embeddings(self):
+        return build_embeddings(agent_settings.EMBEDDING_MODEL)
+
+    def _open_vectordb(self, embeddings, path: str) -> Chroma:
+        from langchain_chroma import Chroma
+
+        return Chroma(
+            persist_directory=path,
+            embedding_function=embeddings,
+            collection_name=agent_settings.COLLECTION_NAME,
+        )
+
+    def _load_lexical(self, path: str) -> Optional[LexicalIndex]:
+        return LexicalIndex.load(os.path.join(path, agent_settings.LEXICAL_INDEX_DIR))
+
+    def _load_compact(self, path: str) -> Optional[VectorIndex]:
+        if agent_settings.VECTOR_STORE != "compact":
+            return None
+        index = VectorIndex.load(
+            os.path.join(path, agent_settings.VECTOR_INDEX_DIR),
+            n_probe=agent_settings.VECTOR_INDEX_NPROBE,
+        )
+        if index is None:
+            print("⚠️ [retrieval] Índice vetorial compacto não encontrado; a usar o Chroma.")
+        return index
+
+    def warm_up(self) -> None:
+        """Carrega o modelo e a coleção se ainda não estiverem em memória."""
+        if self.ready:
+            return
+        with self._lock:
+            if self.ready:
+                return
+            self._load()
+
+    def preload(self) -> None:
+        """
+        Carrega só o modelo de embeddings. Usado pelo processo mestre do gunicorn
+        (preload_app) antes do fork: os workers partilham os pesos copy-on-write.
+        A coleção Chroma (SQLite + threads) é aberta depois do fork, em cada worker.
+        """
+        with self._lock:
+            if self._embeddings is None:
+                start = time.perf_counter()
+                self._embeddings = self._load_embeddings()
+                startup_report.detail("load_embeddings", time.perf_counter() - start)
+
+    def reload(self) -> bool:
+        """
+        Passa para o build ativo (por exemplo, depois de correr a ingestão).
+        O modelo de embeddings é mantido, porque não muda entre índices.
+        O build novo é carregado sem o lock do motor: os pedidos continuam a
+        ser servidos pelo build atual, e o lock só é usado para a troca.
+        Devolve False se o build ativo já estava carregado.
+        """
+        with self._reload_lock:
+            if self._state is None:
+                self.warm_up()
+                self.reloads += 1
+                return True
+            if self._state.path == active_dir(agent_settings.CHROMA_DB_DIR):
+                return False
+            start = time.perf_counter()
+            state = self._open_state(self._embeddings)
+            with self._lock:
+                old = self._swap(state, start)
+            self._retire(old)
+            self.reloads += 1
+            return True
+
+    def _open_state(self, embeddings) -> IndexState:
+        base = agent_settings.CHROMA_DB_DIR
+        try:
+            build = current_build(base)
+            path = active_dir(base)
+            step = time.perf_counter()
+            compact = self._load_compact(path)
+            vectordb = None
+            if compact is None:
+                vectordb = self._open_vectordb(embeddings, path)
+            startup_report.detail("open_vectordb", time.perf_counter() - step)
+            step = time.perf_counter()
+            lexical = self._load_lexical(path)
+            startup_report.detail("load_lexical", time.perf_counter() - step)
+        except Exception as e:
+            self._error = str(e)
+            raise
+        return IndexState(path, build, vectordb, lexical, compact)
+
+    def _load(self) -> None:
+        start = time.perf_counter()
+        embeddings = self._embeddings
+        if embeddings is None:
+            try:
+                embeddings = self._load_embeddings()
+            except Exception as e:
+                self._error = str(e)
+                raise
+            startup_report.detail("load_embeddings", time.perf_counter() - start)
+        state = self._open_state(embeddings)
+        self._embeddings = embeddings
+        self._retire(self._swap(state, start))
+        startup_report.mark("retrieval_ready")
+
+    def _swap(self, state: IndexState, start: float) -> Optional[IndexState]:
+        """Troca atómica: os pedidos novos passam a ver o build novo. Devolve o anterior."""
+        old, self._state = self._state, state
+        self._error = None
+        self._loaded_at = state.loaded_at
+        self._load_seconds = time.perf_counter() - start
+        return old
+
+    def _retire(self, state: Optional[IndexState]) -> None:
+        """Marca o estado antigo para fechar; fecha já se ninguém o estiver a usar."""
+        if state is None:
+            return
+        with self._readers_lock:
+            state.retired = True
+            idle = state.readers == 0
+        if idle:
+            self._close_state(state)
+
+    @staticmethod
+    def _close_state(state: IndexState) -> None:
+        if state.vectordb is None or state.pinned:
+            return
+        try:
+            _close_vectordb(state.vectordb)
+        except Exception as e:
+            print(f"⚠️ [retrieval] Falha ao fechar o Chroma de {state.path}: {e}")
+        state.vectordb = None
+
+    @contextmanager
+    def _reading(self, state: Optional[IndexState] = None) -> Iterator[IndexState]:
+        """
+        Estado a usar numa pesquisa. Se o chamador já tem um (`state`), é esse;
+        senão usa o atual e conta-o como leitor até ao fim do bloco, para que
+        uma troca de build não feche o Chroma a meio da pesquisa.
+        """
+        if state is not None:
+            yield state
+            return
+        self.warm_up()
+        with self._readers_lock:
+            state = self._state
+            state.readers += 1
+        try:
+            yield state
+        finally:
+            with self._readers_lock:
+                state.readers -= 1
+                idle = state.retired and state.readers == 0
+            if idle:
+                self._close_state(state)
+
+    # ------------------------------------------------------------------
+    # Acesso
+    # ------------------------------------------------------------------
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    @property
+    def loaded_state(self) -> Optional[IndexState]:
+        """Estado atual sem carregar nada (None se o motor ainda não arrancou)."""
+        return self._state
+
+    @property
+    def state(self) -> IndexState:
+        """Estado do build atual; quem o guarda continua nesse build até ao fim."""
+        self.warm_up()
+        return self._state
+
+    @property
+    def embeddings(self):
+        self.warm_up()
+        return self._embeddings
+
+    def _vectordb(self, state: IndexState) -> Chroma:
+        if state.vectordb is None:
+            # Com o índice compacto, o Chroma só é aberto se alguém o pedir (get_retriever)
+            with self._lock:
+                if state.vectordb is None:
+                    state.vectordb = self._open_vectordb(self._embeddings, state.path)
+        return state.vectordb
+
+    @property
+    def vectordb(self) -> Chroma:
+        """Chroma do build atual, para uso fora do motor (não é fechado numa troca)."""
+        with self._reading() as state:
+            state.pinned = True
+            return self._vectordb(state)
+
+    def _embed_one(self, text: str) -> List[float]:
+        if self._batcher is not None:
+            return self._batcher.embed(text)
+        return self.embeddings.embed_query(text)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embedding de uma pergunta (cache de embeddings + micro-batcher + modelo partilhado)."""
+        if query_embedding_cache is None:
+            return self._embed_one(text)
+        return query_embedding_cache.embed_query(text, self._embed_one)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Como `embed_query`, para chamadores assíncronos: a espera pelo lote não
+        ocupa uma thread do threadpool (que limitaria o tamanho dos lotes).
+        """
+        if self._batcher is None:
+            return await asyncio.to_thread(self.embed_query, text)
+        if query_embedding_cache is not None:
+            vector = query_embedding_cache.get(text)
+            if vector is not None:
+                return vector.tolist()
+        vector = await self._batcher.aembed(text)
+        if query_embedding_cache is not None:
+            query_embedding_cache.put(text, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de várias perguntas; as que não estão em cache vão num só lote."""
+        if query_embedding_cache is None:
+            return self.embed_documents(texts)
+        return query_embedding_cache.embed_queries(texts, self.embed_documents)
+
+    @staticmethod
+    def _where(languages: Optional[List[str]]) -> Optional[dict]:
+        """Filtro de metadados do Chroma para as línguas pedidas."""
+        if not languages:
+            return None
+        if len(languages) == 1:
+            return {"language": languages[0]}
+        return {"language": {"$in": list(languages)}}
+
+    def search_by_vector(
+        self,
+        embedding: List[float],
+        k: Optional[int] = None,
+        languages: Optional[List[str]] = None,
+        state: Optional[IndexState] = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Pesquisa os `k` trechos mais próximos de um embedding, opcionalmente só
+        nas línguas indicadas. Devolve pares (Document, score) com score =
+        similaridade de cosseno (os vetores do MiniLM estão normalizados, logo
+        cos = 1 - d²/2).
+        """
+        k = k or agent_settings.RETRIEVER_K
+        with self._reading(state) as state:
+            if state.compact is not None:
+                return self._compact_search(state.compact, embedding, k, languages)
+            vectordb = self._vectordb(state)
+            where = self._where(languages)
+            results = vectordb.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=k, filter=where
+            )
+            if not results and where is not None:
+                # Índice sem metadados de língua (ingestão antiga): pesquisa sem filtro
+                results = vectordb.similarity_search_by_vector_with_relevance_scores(
+                    embedding, k=k
+                )
+            return [(doc, 1.0 - distance / 2.0) for doc, distance in results]
+
+    @staticmethod
+    def _compact_search(
+        compact: VectorIndex, embedding: List[float], k: int, languages: Optional[List[str]]
+    ) -> List[Tuple[Document, float]]:
+        """Pesquisa no índice compacto; o score já é a similaridade de cosseno."""
+        hits = compact.search(embedding, k, languages)
+        if not hits and languages:
+            hits = compact.search(embedding, k)
+        return [(_document(*compact.record(row)), score) for row, score in hits]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de vários textos numa única passagem (em lote) pelo modelo."""
+        return self.embeddings.embed_documents(texts)
+
+    def _query(
+        self, state: IndexState, embeddings: List[List[float]], k: int, where: Optional[dict]
+    ) -> List[List[Tuple[Document, float]]]:
+        results = self._vectordb(state)._collection.query(
+            query_embeddings=embeddings,
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        out = []
+        for ids, texts, metadatas, distances in zip(
+            results["ids"], results["documents"], results["metadatas"], results["distances"]
+        ):
+            out.append(
+                [
+                    (_document(id_, text, metadata), 1.0 - d / 2.0)
+                    for id_, text, metadata, d in zip(ids, texts, metadatas, distances)
+                ]
+            )
+        return out
+
+    def search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: Optional[int] = None,
+        languages: Optional[List[Optional[List[str]]]] = None,
+        state: Optional[IndexState] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Várias pesquisas vetoriais: uma única chamada ao Chroma por conjunto
+        de línguas (`languages[i]` são as línguas da pergunta i; None = todas).
+        """
+        if not embeddings:
+            return []
+        k = k or agent_settings.RETRIEVER_K
+        languages = languages or [None] * len(embeddings)
+        with self._reading(state) as state:
+            if state.compact is not None:
+                return [
+                    self._compact_search(state.compact, embedding, k, langs)
+                    for embedding, langs in zip(embeddings, languages)
+                ]
+
+            groups: Dict[tuple, List[int]] = {}
+            for i, langs in enumerate(languages):
+                groups.setdefault(tuple(langs or ()), []).append(i)
+
+            out: List[List[Tuple[Document, float]]] = [[] for _ in embeddings]
+            for langs, idx in groups.items():
+                where = self._where(list(langs))
+                hits = self._query(state, [embeddings[i] for i in idx], k, where)
+                if where is not None and any(not h for h in hits):
+                    # Índice sem metadados de língua (ingestão antiga): pesquisa sem filtro
+                    empty = [j for j, h in enumerate(hits) if not h]
+                    retry = self._query(state, [embeddings[idx[j]] for j in empty], k, None)
+                    for j, h in zip(empty, retry):
+                        hits[j] = h
+                for i, h in zip(idx, hits):
+                    out[i] = h
+            return out
+
+    def get_documents(
+        self, ids: List[str], state: Optional[IndexState] = None
+    ) -> Dict[str, Document]:
+        """Lê trechos do Chroma pelos ids."""
+        if not ids:
+            return {}
+        with self._reading(state) as state:
+            if state.compact is not None:
+                return {
+                    id_: _document(id_, text, metadata)
+                    for id_, text, metadata in state.compact.records(ids)
+                }
+            result = self._vectordb(state)._collection.get(
+                ids=ids, include=["documents", "metadatas"]
+            )
+            return {
+                id_: _document(id_, text, metadata)
+                for id_, text, metadata in zip(
+                    result["ids"], result["documents"], result["metadatas"]
+                )
+            }
+
+    @staticmethod
+    def _is_hybrid(state: Optional[IndexState]) -> bool:
+        return (
+            agent_settings.RETRIEVAL_MODE == "hybrid"
+            and state is not None
+            and state.lexical is not None
+        )
+
+    @property
+    def hybrid(self) -> bool:
+        return self._is_hybrid(self._state)
+
+    def route(self, question: str, state: Optional[IndexState] = None) -> Optional[List[str]]:
+        """Línguas onde pesquisar a pergunta (None = todas)."""
+        if not agent_settings.LANGUAGE_ROUTING:
+            return None
+        with self._reading(state) as state:
+            # Línguas presentes no índice (guardadas com o índice lexical)
+            available = state.lexical.languages if state.lexical is not None else None
+            return route_languages(question, agent_settings.FALLBACK_LANGUAGES, available)
+
+    def _candidates(self, k: int, state: IndexState) -> int:
+        """Quantos trechos pedir antes da fusão / remoção de traduções."""
+        if self._is_hybrid(state) or agent_settings.TRANSLATION_DEDUP:
+            return max(k, agent_settings.HYBRID_CANDIDATES)
+        return k
+
+    def _fuse(
+        self,
+        state: IndexState,
+        question: str,
+        vector_hits: List[Tuple[Document, float]],
+        languages: Optional[List[str]],
+        limit: int,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Junta o ranking vetorial e o BM25 com reciprocal rank fusion.
+        O score devolvido é o score RRF (só serve para ordenar).
+        """
+        lexical_hits = state.lexical.search(
+            question, agent_settings.HYBRID_CANDIDATES, languages
+        )
+        by_id = {chunk_id(doc): doc for doc, _ in vector_hits}
+        fused = reciprocal_rank_fusion(
+            [list(by_id), [id_ for id_, _ in lexical_hits]], k=agent_settings.RRF_K
+        )[:limit]
+
+        missing = [id_ for id_, _ in fused if id_ not in by_id]
+        by_id.update(self.get_documents(missing, state))
+        return [(by_id[id_], score) for id_, score in fused if id_ in by_id]
+
+    def _finalize(
+        self, hits: List[Tuple[Document, float]], k: int
+    ) -> List[Tuple[Document, float]]:
+        """Remove traduções do mesmo trecho (se ativo) e fica com os k melhores."""
+        if agent_settings.TRANSLATION_DEDUP:
+            hits = dedupe_translations(hits, agent_settings.TRANSLATION_DEDUP_WINDOW)
+        return hits[:k]
+
+    def search(
+        self, question: str, embedding: List[float], k: Optional[int] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Pesquisa de trechos para uma pergunta:
+        - só nas línguas da pergunta + de recurso (LANGUAGE_ROUTING);
+        - no modo híbrido (RETRIEVAL_MODE=hybrid e índice lexical construído)
+          combina a pesquisa vetorial com BM25;
+        - traduções do mesmo parágrafo ocupam uma só posição (TRANSLATION_DEDUP).
+        Todas as etapas usam o mesmo build, mesmo que o índice troque entretanto.
+        """
+        k = k or agent_settings.RETRIEVER_K
+        with self._reading() as state:
+            candidates = self._candidates(k, state)
+            languages = self.route(question, state)
+            hits = self.search_by_vector(embedding, candidates, languages, state)
+            if self._is_hybrid(state):
+                hits = self._fuse(state, question, hits, languages, candidates)
+            return self._finalize(hits, k)
+
+    def search_many(
+        self, questions: List[str], embeddings: List[List[float]], k: Optional[int] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Como `search`, para várias perguntas (pesquisas vetoriais agrupadas)."""
+        k = k or agent_settings.RETRIEVER_K
+        with self._reading() as state:
+            candidates = self._candidates(k, state)
+            languages = [self.route(question, state) for question in questions]
+            results = self.search_by_vectors(embeddings, candidates, languages, state)
+            if self._is_hybrid(state):
+                results = [
+                    self._fuse(state, question, hits, langs, candidates)
+                    for question, hits, langs in zip(questions, results, languages)
+                ]
+            return [self._finalize(hits, k) for hits in results]
+
+    def retrieve(self, question: str, k: Optional[int] = None) -> List[Document]:
+        """Embedding da pergunta + pesquisa (vetorial ou híbrida)."""
+        embedding = self.embed_query(question)
+        return [doc for doc, _ in self.search(question, embedding, k)]
+
+    def get_retriever(self):
+        """Retriever LangChain sobre a coleção partilhada."""
+        return self.vectordb.as_retriever(
+            search_kwargs={"k": agent_settings.RETRIEVER_K}
+        )
+
+    def status(self) -> dict:
+        """Estado do motor, para o endpoint /health."""
+        state = self._state
+        compact = state.compact if state is not None else None
+        return {
+            "ready": self.ready,
+            "embedding_model": agent_settings.EMBEDDING_MODEL,
+            "embedding_backend": agent_settings.EMBEDDING_BACKEND,
+            "embedding_path": resolve_model(agent_settings.EMBEDDING_MODEL),
+            "mode": "hybrid" if self._is_hybrid(state) else "vector",
+            "index_build": state.build if state is not None else None,
+            "index_version": state.version if state is not None else None,
+            "index_path": state.path if state is not None else None,
+            "index_reloads": self.reloads,
+            "vector_store": "compact" if compact is not None else "chroma",
+            "compact_index": compact.status() if compact is not None else None,
+            "microbatch": self._batcher.stats() if self._batcher is not None else None,
+            "lexical_index": (
+                state.lexical.status() if state is not None and state.lexical else None
+            ),
+            "loaded_at": self._loaded_at,
+            "load_seconds": (
+                round(self._load_seconds, 3) if self._load_seconds is not None else None
+            ),
+            "error": self._error,
+        }
+
+
+# Instância única por processo
+retrieval_engine = RetrievalEngine()
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -35,3 +37,23 @@ class ChatResponse(BaseModel):
         description="Modelo LLM utilizado para gerar a resposta.",
         example="gpt-4o-mini",
     )
+
+
+class BatchQuestion(BaseModel):
+    """Uma linha do JSONL enviado para /chat/batch (ou para batch_cli.py)."""
+
+    id: Optional[str] = Field(
+        None,
+        description="Identificador da pergunta no lote (por omissão, a posição).",
+        example="q-001",
+    )
+    session_id: Optional[str] = Field(
+        None,
+        description="Sessão a usar/atualizar. Sem sessão, a pergunta é respondida sem histórico.",
+        example=None,
+    )
+    question: str = Field(
+        ...,
+        description="Pergunta do auditor.",
+        example="Quais são os princípios da auditoria de desempenho na ISSAI 300?",
+    )
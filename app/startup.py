@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+# Referência para os tempos de arranque: o momento em que este módulo é importado
+# (deve ser o primeiro módulo da app a ser importado; ver lambda_handler.py).
+_T0 = time.perf_counter()
+
+
+def _process_age() -> Optional[float]:
+    """
+    Segundos entre o arranque do processo e a importação deste módulo
+    (arranque do interpretador + imports anteriores). Só em Linux (/proc).
+    """
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            # O nome do processo pode ter espaços: os campos começam depois do ")"
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime = float(f.read().split()[0])
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return max(uptime - started, 0.0)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupReport:
+    """
+    Marcos do arranque a frio (imports, modelo carregado, 1.ª resposta),
+    em segundos desde a importação da app. Cada marco só é registado uma vez.
+    """
+
+    def __init__(self) -> None:
+        self.before_import = _process_age()
+        self.marks: List[Tuple[str, float]] = []
+        self.details: dict = {}
+
+    def mark(self, name: str) -> None:
+        if any(existing == name for existing, _ in self.marks):
+            return
+        self.marks.append((name, time.perf_counter() - _T0))
+        if name == "first_answer":
+            self.log()
+
+    def detail(self, name: str, seconds: float) -> None:
+        """Duração de um passo do arranque (ex.: carregar o modelo de embeddings)."""
+        self.details[name] = round(seconds, 4)
+
+    def report(self) -> dict:
+        return {
+            "process_to_import_s": (
+                round(self.before_import, 4) if self.before_import is not None else None
+            ),
+            "marks_s": {name: round(seconds, 4) for name, seconds in self.marks},
+            "steps_s": dict(self.details),
+        }
+
+    def log(self) -> None:
+        parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.marks]
+        if self.before_import is not None:
+            parts.insert(0, f"process_to_import={self.before_import * 1000:.0f}ms")
+        print(f"[startup] {' '.join(parts)}", file=sys.stderr, flush=True)
+
+
+# Instância única por processo
+startup_report = StartupReport()
@@ -0,0 +1,155 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from .config_agent import agent_settings
+from .context import trim_to_tokens
+from .llm import llm_client
+from .memory import SessionStore, Turn, session_store
+from .metrics import registry
+
+SUMMARY_REFRESHES = registry.counter(
+    "rag_history_summaries_total",
+    "Atualizações do resumo do histórico (ok, skipped = poucas interações novas, error).",
+    ["result"],
+)
+SUMMARY_SECONDS = registry.histogram(
+    "rag_history_summary_seconds", "Duração de cada atualização do resumo do histórico."
+)
+SUMMARY_TOKENS = registry.counter(
+    "rag_history_summary_tokens_total",
+    "Tokens das chamadas ao LLM para resumir o histórico (fora das métricas dos pedidos).",
+    ["direction"],
+)
+
+_SUMMARY_PROMPT = """
+Resume a conversa entre um utilizador e um assistente de auditoria (normas ISSAI).
+
+Resumo anterior:
+{summary}
+
+Novas interações:
+{turns}
+
+Instruções:
+- Escreve um único resumo atualizado, em português, com no máximo {words} palavras.
+- Mantém os temas perguntados, as normas referidas e as conclusões ou decisões.
+- Omite cumprimentos, repetições e citações longas.
+"""
+
+
+class HistorySummarizer:
+    """
+    Resumo incremental ("rolling") do histórico de cada sessão.
+
+    As interações mais antigas do que as últimas `keep_turns` são juntadas ao
+    resumo guardado com a sessão, `refresh_turns` de cada vez, por uma chamada
+    ao LLM com o resumo anterior + as interações novas. A atualização corre num
+    pool de threads depois de a resposta ser gerada (nunca no caminho do
+    pedido), no máximo uma de cada vez por sessão. Enquanto não acaba, o
+    prompt usa o resumo anterior e mais algumas interações na íntegra.
+    """
+
+    def __init__(
+        self,
+        store: SessionStore,
+        keep_turns: int = 2,
+        refresh_turns: int = 2,
+        token_budget: int = 250,
+        workers: int = 2,
+    ) -> None:
+        self.store = store
+        self.keep_turns = max(keep_turns, 0)
+        self.refresh_turns = max(refresh_turns, 1)
+        self.token_budget = token_budget
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary")
+        self._lock = threading.Lock()
+        self._running = set()
+
+    def prompt_history(self, session_id: str) -> Tuple[str, List[Turn]]:
+        """(resumo, interações ainda por resumir) para o prompt."""
+        summary, covered = self.store.get_summary(session_id)
+        return summary, [turn for _, turn in self.store.turns_after(session_id, covered)]
+
+    def schedule(self, session_id: str) -> None:
+        """Agenda a atualização do resumo da sessão (ignorado se já houver uma em curso)."""
+        with self._lock:
+            if session_id in self._running:
+                return
+            self._running.add(session_id)
+        self._executor.submit(self._run, session_id)
+
+    def _run(self, session_id: str) -> None:
+        try:
+            self.refresh(session_id)
+        except Exception as e:
+            # O resumo anterior continua válido; tenta-se de novo na próxima interação
+            SUMMARY_REFRESHES.inc(result="error")
+            print(f"⚠️ [memory] Falha ao resumir o histórico: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(session_id)
+
+    def refresh(self, session_id: str) -> bool:
+        """Junta ao resumo as interações antigas ainda por resumir (se forem suficientes)."""
+        summary, covered = self.store.get_summary(session_id)
+        pending = self.store.turns_after(session_id, covered)
+        if self.keep_turns:
+            pending = pending[: -self.keep_turns]
+        if len(pending) < self.refresh_turns:
+            SUMMARY_REFRESHES.inc(result="skipped")
+            return False
+
+        start = time.perf_counter()
+        lines = []
+        for _, (question, answer) in pending:
+            lines.append(f"Utilizador: {question}")
+            lines.append(f"Assistente: {answer}")
+        prompt = _SUMMARY_PROMPT.format(
+            summary=summary or "(sem resumo)",
+            turns="\n".join(lines),
+            # ~0,75 palavras por token; o corte abaixo garante o orçamento
+            words=max(int(self.token_budget * 0.75), 20),
+        )
+        # Fora do caminho do pedido: não conta no estágio "llm" nem nos tokens dos pedidos
+        response = llm_client.invoke(prompt, background=True)
+        SUMMARY_TOKENS.inc(response.input_tokens, direction="input")
+        SUMMARY_TOKENS.inc(response.output_tokens, direction="output")
+        content = response.content.strip()
+        updated = trim_to_tokens(content, self.token_budget) or summary
+        self.store.set_summary(session_id, updated, pending[-1][0])
+        SUMMARY_SECONDS.observe(time.perf_counter() - start)
+        SUMMARY_REFRESHES.inc(result="ok")
+        return True
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            "keep_turns": self.keep_turns,
+            "refresh_turns": self.refresh_turns,
+            "token_budget": self.token_budget,
+            "running": len(self._running),
+            "refreshes": {
+                result: SUMMARY_REFRESHES.value(result=result)
+                for result in ("ok", "skipped", "error")
+            },
+        }
+
+
+def _build_history_summarizer() -> Optional[HistorySummarizer]:
+    if agent_settings.HISTORY_MODE != "summary":
+        return None
+    return HistorySummarizer(
+        session_store,
+        keep_turns=agent_settings.HISTORY_SUMMARY_KEEP_TURNS,
+        refresh_turns=agent_settings.HISTORY_SUMMARY_REFRESH_TURNS,
+        token_budget=agent_settings.HISTORY_SUMMARY_TOKEN_BUDGET,
+        workers=agent_settings.HISTORY_SUMMARY_WORKERS,
+    )
+
+
+# Instância única por processo
+history_summarizer = _build_history_summarizer()
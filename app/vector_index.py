@@ -0,0 +1,383 @@
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+INDEX_FORMAT = 1
+# Linhas por bloco na pesquisa (o bloco é convertido para float32 num buffer pequeno)
+_BLOCK_ROWS = 2048
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    k-means esférico (vetores normalizados, afinidade = produto interno),
+    treinado numa amostra de até 256 pontos por centróide.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > 256 * n_clusters:
+        sample = vectors[rng.choice(len(vectors), 256 * n_clusters, replace=False)]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(n_clusters):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Centróide vazio: recomeça num ponto aleatório
+                centroids[c] = sample[rng.integers(len(sample))]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+def quantize_int8(
+    vectors: np.ndarray, scales: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantização escalar simétrica por dimensão: vectors ~= codes * scales.
+    As escalas podem vir já calculadas (ex.: do máximo de todas as páginas).
+    """
+    if scales is None:
+        scales = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.ones(0)
+        scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+class VectorIndexBuilder:
+    """
+    Constrói o índice vetorial compacto página a página (ex.: os lotes de
+    `collection.get`), sem juntar os embeddings nem os textos em memória:
+
+    - cada página é normalizada e escrita numa matriz float32 em disco
+      (`open_memmap`), e os registos são acrescentados a records.bin;
+    - no fim, o k-means (IVF) é treinado numa amostra de linhas, as linhas são
+      atribuídas às listas por blocos e a matriz final (float16, float32 ou
+      int8) é escrita por blocos, já pela ordem das listas.
+
+    Em memória ficam só os ids, os comprimentos dos registos e a língua de
+    cada linha. Os ficheiros gravados estão descritos em `build_vector_index`.
+    """
+
+    def __init__(self, out_dir: str, rows: int, dtype: str = "float16", n_lists: int = 0) -> None:
+        self.out_dir = out_dir
+        self.rows = rows
+        self.dtype = dtype
+        self.n_lists = n_lists
+        self.ids: List[str] = []
+        self._tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        os.makedirs(self._tmp_dir)
+        self._staging: Optional[np.ndarray] = None
+        self._absmax: Optional[np.ndarray] = None
+        self._lengths: List[np.ndarray] = []
+        self._language_codes: List[np.ndarray] = []
+        self._languages: Dict[str, int] = {}
+        self._records = open(self._path("records.bin"), "wb")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._tmp_dir, name)
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        texts: Sequence[str],
+        metadatas: Sequence[Optional[dict]],
+    ) -> None:
+        """Acrescenta uma página de linhas ao índice."""
+        if not len(ids):
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        start = len(self.ids)
+        if start + len(ids) > self.rows:
+            raise ValueError(f"O índice vetorial foi reservado para {self.rows} linhas.")
+        if self._staging is None:
+            self._staging = np.lib.format.open_memmap(
+                self._path("staging.npy"),
+                mode="w+",
+                dtype=np.float32,
+                shape=(self.rows, vectors.shape[1]),
+            )
+            self._absmax = np.zeros(vectors.shape[1], dtype=np.float32)
+        self._staging[start:start + len(ids)] = vectors
+        np.maximum(self._absmax, np.abs(vectors).max(axis=0), out=self._absmax)
+        self.ids.extend(ids)
+
+        blobs = [
+            json.dumps({"text": text, "metadata": metadata or {}}, ensure_ascii=False)
+            .encode("utf-8")
+            for text, metadata in zip(texts, metadatas)
+        ]
+        self._records.writelines(blobs)
+        self._lengths.append(np.array([len(b) for b in blobs], dtype=np.int64))
+        self._language_codes.append(
+            np.array(
+                [
+                    self._languages.setdefault(
+                        (metadata or {}).get("language", "und"), len(self._languages)
+                    )
+                    for metadata in metadatas
+                ],
+                dtype=np.uint8,
+            )
+        )
+
+    def _reorder_records(self, lengths: np.ndarray, order: np.ndarray) -> None:
+        """Reescreve records.bin pela ordem das listas IVF."""
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        records = np.memmap(self._path("records.bin"), dtype=np.uint8, mode="r")
+        with open(self._path("records.sorted"), "wb") as f:
+            for row in order:
+                f.write(records[offsets[row]:offsets[row + 1]].tobytes())
+        del records
+        os.replace(self._path("records.sorted"), self._path("records.bin"))
+
+    def finish(self) -> dict:
+        """Escreve os ficheiros finais e troca a pasta do índice (atómico para leitores)."""
+        self._records.close()
+        n = len(self.ids)
+        dims = self._staging.shape[1] if self._staging is not None else 0
+        staging = self._staging
+
+        n_lists = min(self.n_lists, n)
+        order = np.arange(n)
+        centroids = lists = None
+        if n_lists > 0:
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(n, min(n, 256 * n_lists), replace=False))
+            centroids = kmeans(np.asarray(staging[sample]), n_lists)
+            assign = np.empty(n, dtype=np.int64)
+            for start in range(0, n, _BLOCK_ROWS):
+                block = staging[start:min(start + _BLOCK_ROWS, n)]
+                assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            lists = np.zeros(n_lists + 1, dtype=np.int64)
+            lists[1:] = np.cumsum(np.bincount(assign, minlength=n_lists))
+
+        language_names = sorted(self._languages)
+        remap = np.zeros(max(len(self._languages), 1), dtype=np.uint8)
+        for name, code in self._languages.items():
+            remap[code] = language_names.index(name)
+        languages = remap[np.concatenate(self._language_codes)] if n else np.zeros(0, np.uint8)
+        lengths = np.concatenate(self._lengths) if n else np.zeros(0, np.int64)
+        if n_lists > 0:
+            self._reorder_records(lengths, order)
+            languages, lengths = languages[order], lengths[order]
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+
+        scales = None
+        if self.dtype == "int8":
+            scales = np.ones(0, dtype=np.float32)
+            if n:
+                scales = np.maximum(self._absmax / 127.0, 1e-12).astype(np.float32)
+        if n:
+            vectors = np.lib.format.open_memmap(
+                self._path("vectors.npy"), mode="w+", dtype=self.dtype, shape=(n, dims)
+            )
+            for start in range(0, n, _BLOCK_ROWS):
+                block = staging[order[start:start + _BLOCK_ROWS]]
+                if self.dtype == "int8":
+                    block, _ = quantize_int8(block, scales)
+                vectors[start:start + len(block)] = block
+            vectors.flush()
+            del vectors
+        else:
+            np.save(self._path("vectors.npy"), np.zeros((0, dims), dtype=self.dtype))
+        # A matriz intermédia em float32 já não é precisa
+        self._staging = staging = None
+        if os.path.exists(self._path("staging.npy")):
+            os.remove(self._path("staging.npy"))
+
+        meta = {
+            "format": INDEX_FORMAT,
+            "documents": n,
+            "dimensions": int(dims),
+            "dtype": self.dtype,
+            "lists": n_lists,
+            "languages": language_names,
+        }
+        if self.dtype == "int8":
+            np.save(self._path("scales.npy"), scales)
+        np.save(self._path("languages.npy"), languages)
+        np.save(self._path("offsets.npy"), offsets)
+        if n_lists > 0:
+            np.save(self._path("centroids.npy"), centroids)
+            np.save(self._path("lists.npy"), lists)
+        with open(self._path("ids.json"), "w", encoding="utf-8") as f:
+            json.dump([self.ids[i] for i in order], f)
+        with open(self._path("meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        old_dir = self.out_dir.rstrip("/\\") + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.out_dir):
+            os.replace(self.out_dir, old_dir)
+        os.replace(self._tmp_dir, self.out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return meta
+
+
+def build_vector_index(
+    ids: List[str],
+    embeddings: np.ndarray,
+    texts: Sequence[str],
+    metadatas: Sequence[Optional[dict]],
+    out_dir: str,
+    dtype: str = "float16",
+    n_lists: int = 0,
+) -> dict:
+    """
+    Grava um índice vetorial compacto em `out_dir` (numa só página; para
+    corpora grandes, usar `VectorIndexBuilder` página a página):
+
+    - vectors.npy     [N, D] embeddings normalizados, em float16, float32 ou int8
+    - scales.npy      float32 [D]: escala de cada dimensão (só em int8)
+    - ids.json        id do chunk (no Chroma) de cada linha
+    - languages.npy   uint8: língua de cada linha (índice em meta["languages"])
+    - records.bin     texto + metadados de cada linha (JSON), para devolver Documents
+    - offsets.npy     int64 [N+1]: início de cada registo em records.bin
+    - centroids.npy   float32 [L, D] e lists.npy int64 [L+1], com `n_lists` > 0 (IVF):
+                      as linhas ficam agrupadas por lista, e lists.npy tem o início de cada uma
+
+    A escrita é feita numa pasta temporária e trocada no fim (atómica para leitores).
+    """
+    builder = VectorIndexBuilder(out_dir, len(ids), dtype=dtype, n_lists=n_lists)
+    builder.add(ids, embeddings, texts, metadatas)
+    return builder.finish()
+
+
+class VectorIndex:
+    """
+    Índice vetorial compacto carregado do disco: a matriz de embeddings
+    (float16 ou int8) e os textos ficam memory-mapped, por isso a memória
+    residente cresce só com as páginas realmente lidas, e é partilhada entre
+    processos. Em int8 a escala é aplicada à pergunta, não à matriz.
+
+    Pesquisa exata (produto interno por blocos em NumPy) ou, se o índice foi
+    construído com listas IVF, só nas `n_probe` listas mais próximas.
+    """
+
+    def __init__(self, path: str, n_probe: int = 8) -> None:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "ids.json"), encoding="utf-8") as f:
+            self.ids: List[str] = json.load(f)
+        self._rows: Dict[str, int] = {id_: i for i, id_ in enumerate(self.ids)}
+        self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        scales_path = os.path.join(path, "scales.npy")
+        self._scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        self._languages = np.load(os.path.join(path, "languages.npy"))
+        self._offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        # Índice vazio: records.bin tem 0 bytes e não pode ser mapeado em memória
+        self._records = (
+            np.memmap(os.path.join(path, "records.bin"), dtype=np.uint8, mode="r")
+            if self.meta["documents"]
+            else np.zeros(0, dtype=np.uint8)
+        )
+        self.languages: List[str] = self.meta.get("languages", [])
+        self._centroids = self._lists = None
+        if self.meta.get("lists"):
+            self._centroids = np.load(os.path.join(path, "centroids.npy"))
+            self._lists = np.load(os.path.join(path, "lists.npy"))
+        self.n_probe = n_probe
+        self.path = path
+
+    @classmethod
+    def load(cls, path: str, n_probe: int = 8) -> Optional["VectorIndex"]:
+        """Carrega o índice, ou devolve None se ainda não foi construído."""
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return cls(path, n_probe=n_probe)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------------------------------------------------------
+    # Pesquisa
+    # ------------------------------------------------------------------
+    def _candidate_rows(self, query: np.ndarray) -> Optional[List[Tuple[int, int]]]:
+        """Intervalos de linhas das listas IVF mais próximas (None = todas)."""
+        if self._centroids is None:
+            return None
+        n_probe = min(self.n_probe, len(self._centroids))
+        closest = np.argpartition(-(self._centroids @ query), n_probe - 1)[:n_probe]
+        return [(int(self._lists[c]), int(self._lists[c + 1])) for c in sorted(closest)]
+
+    def _scores(self, query: np.ndarray, start: int, end: int) -> np.ndarray:
+        if self._vectors.dtype == np.float32:
+            return np.asarray(self._vectors[start:end] @ query, dtype=np.float32)
+        if self._scales is not None:
+            query = query * self._scales
+        out = np.empty(end - start, dtype=np.float32)
+        buffer = np.empty((min(_BLOCK_ROWS, end - start), query.shape[0]), dtype=np.float32)
+        for block in range(start, end, _BLOCK_ROWS):
+            stop = min(block + _BLOCK_ROWS, end)
+            rows = buffer[: stop - block]
+            np.copyto(rows, self._vectors[block:stop])
+            out[block - start:stop - start] = rows @ query
+        return out
+
+    def language_mask(self, languages: Optional[List[str]]) -> Optional[np.ndarray]:
+        if not languages:
+            return None
+        codes = [self.languages.index(lang) for lang in languages if lang in self.languages]
+        return np.isin(self._languages, codes)
+
+    def search(
+        self, embedding: Sequence[float], k: int, languages: Optional[List[str]] = None
+    ) -> List[Tuple[int, float]]:
+        """Top-k (linha, similaridade de cosseno), opcionalmente só nas línguas indicadas."""
+        if not len(self.ids):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        ranges = self._candidate_rows(query) or [(0, len(self.ids))]
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([self._scores(query, start, end) for start, end in ranges])
+        mask = self.language_mask(languages)
+        if mask is not None:
+            keep = mask[rows]
+            rows, scores = rows[keep], scores[keep]
+        if len(rows) == 0:
+            return []
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    # ------------------------------------------------------------------
+    # Documentos
+    # ------------------------------------------------------------------
+    def record(self, row: int) -> Tuple[str, str, dict]:
+        """(id, texto, metadados) de uma linha."""
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        data = json.loads(self._records[start:end].tobytes().decode("utf-8"))
+        return self.ids[row], data["text"], data["metadata"]
+
+    def records(self, ids: Sequence[str]) -> List[Tuple[str, str, dict]]:
+        """Registos dos ids pedidos que existem no índice."""
+        return [self.record(self._rows[id_]) for id_ in ids if id_ in self._rows]
+
+    def status(self) -> dict:
+        return {
+            "documents": self.meta["documents"],
+            "dimensions": self.meta["dimensions"],
+            "dtype": self.meta["dtype"],
+            "lists": self.meta["lists"],
+            "n_probe": self.n_probe if self.meta["lists"] else None,
+            "languages": self.languages,
+        }
@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from app.batch import aask_batch, parse_jsonl
+
+
+async def run(args) -> None:
+    with open(args.input, encoding="utf-8") as f:
+        items = parse_jsonl(f, field=args.field)
+    print(f"{len(items)} perguntas carregadas de {args.input}", file=sys.stderr)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        done = 0
+        async for result in aask_batch(items, concurrency=args.concurrency):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            done += 1
+            print(f"\r{done}/{len(items)}", end="", file=sys.stderr)
+        print(file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Responde a um ficheiro JSONL de perguntas com o assistente de auditoria."
+    )
+    parser.add_argument("input", help="Ficheiro JSONL com uma pergunta por linha.")
+    parser.add_argument("-o", "--output", help="Ficheiro JSONL de saída (por omissão, stdout).")
+    parser.add_argument(
+        "--field", default="question", help="Campo com o texto da pergunta (default: question)."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=None, help="Chamadas ao LLM em paralelo."
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Teste de carga do /chat (ou /chat/stream) com um LLM falso e determinístico,
+para que nada chegue à rede. Por omissão a API corre no mesmo processo
+(transporte ASGI); com --url mede-se um servidor já a correr.
+
+    python -m benchmarks.bench_chat [--requests 200] [--concurrency 20] [--stream]
+
+As caches de respostas e de embeddings são desligadas, para medir o pipeline completo
+(recuperação + prompt + LLM + memória) em cada pedido.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# Tem de ser definido antes de importar a app (as settings leem o ambiente)
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+
+import httpx  # noqa: E402
+
+from .common import emit, load_questions, percentiles, run_info  # noqa: E402
+
+
+async def _one(client: httpx.AsyncClient, path: str, payload: dict) -> tuple:
+    start = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", path, json=payload) as response:
+        async for _ in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+        status = response.status_code
+    return status, time.perf_counter() - start, first_byte
+
+
+async def run(
+    n_requests: int = 200,
+    concurrency: int = 20,
+    stream: bool = False,
+    url: str = None,
+) -> dict:
+    questions = [q["question"] for q in load_questions()]
+    path = "/chat/stream" if stream else "/chat"
+
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=120)
+    else:
+        from app.api import app
+        from app.retrieval import retrieval_engine
+
+        # O transporte ASGI não corre os eventos de startup
+        retrieval_engine.warm_up()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120
+        )
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ttfb, errors = [], [], 0
+
+    async def worker(i: int):
+        nonlocal errors
+        payload = {"session_id": f"bench-{i % concurrency}", "question": questions[i % len(questions)]}
+        async with semaphore:
+            try:
+                status, elapsed, first = await _one(client, path, payload)
+            except Exception:
+                errors += 1
+                return
+        if status != 200:
+            errors += 1
+            return
+        latencies.append(elapsed)
+        if first is not None:
+            ttfb.append(first)
+
+    async with client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(n_requests)))
+        wall = time.perf_counter() - start
+
+    return {
+        "benchmark": "chat",
+        "run": run_info(),
+        "endpoint": path,
+        "target": url or "in-process",
+        "llm_backend": os.environ.get("LLM_BACKEND"),
+        "fake_latency_ms": os.environ.get("LLM_FAKE_LATENCY_MS", "200"),
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": percentiles(latencies),
+        "ttfb_ms": percentiles(ttfb),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stream", action="store_true", help="Usar /chat/stream.")
+    parser.add_argument("--url", help="Servidor já a correr (ex.: http://localhost:8000).")
+    parser.add_argument("--output", help="Ficheiro JSON de saída (por omissão, stdout).")
+    args = parser.parse_args()
+    result = asyncio.run(run(args.requests, args.concurrency, args.stream, args.url))
+    emit(result, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Arranque a frio: tempo desde o início de um processo Python novo até à
+primeira resposta do /chat, pelo handler da Lambda (Mangum), com LLM falso.
+Cada repetição corre num processo separado.
+
+    python -m benchmarks.bench_coldstart [--runs 5] [--output coldstart.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from .common import emit, percentiles, run_info
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Corre num processo novo: importa o handler e faz um pedido ao /chat
+_CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import lambda_handler
+t1 = time.perf_counter()
+event = {
+    "version": "2.0",
+    "routeKey": "POST /chat",
+    "rawPath": "/chat",
+    "rawQueryString": "",
+    "headers": {"content-type": "application/json", "host": "bench"},
+    "requestContext": {
+        "http": {"method": "POST", "path": "/chat", "sourceIp": "127.0.0.1", "protocol": "HTTP/1.1"},
+        "stage": "$default",
+    },
+    "body": json.dumps({"session_id": "coldstart", "question": QUESTION}),
+    "isBase64Encoded": False,
+}
+response = lambda_handler.handler(event, None)
+t2 = time.perf_counter()
+from app.startup import startup_report
+print(json.dumps({
+    "status": response["statusCode"],
+    "import_s": t1 - t0,
+    "first_answer_s": t2 - t1,
+    "startup": startup_report.report(),
+}))
+"""
+
+
+def _one(question: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("LLM_BACKEND", "fake")
+    env.setdefault("LLM_FAKE_LATENCY_MS", "0")
+    env.setdefault("ANSWER_CACHE_ENABLED", "false")
+    code = _CHILD.replace("QUESTION", json.dumps(question))
+
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT_DIR, env=env, text=True)
+    wall = time.perf_counter() - start
+    # A última linha é o JSON (as anteriores são logs da app)
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_s"] = wall
+    return result
+
+
+def run(runs: int = 5, question: str = "Quais são os princípios da ISSAI 300?") -> dict:
+    results = [_one(question) for _ in range(runs)]
+    return {
+        "benchmark": "coldstart",
+        "run": run_info(),
+        "runs": runs,
+        "errors": sum(1 for r in results if r["status"] != 200),
+        "latency_ms": {
+            "import": percentiles([r["import_s"] for r in results]),
+            "first_answer": percentiles([r["first_answer_s"] for r in results]),
+            "process_total": percentiles([r["process_s"] for r in results]),
+        },
+        "startup": results[-1]["startup"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Ficheiro JSON de saída (por omissão, stdout).")
+    args = parser.parse_args()
+    emit(run(args.runs), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark da ingestão: páginas/s na leitura dos PDFs, chunks/s na divisão
+e chunks/s no cálculo de embeddings + upsert (numa coleção temporária,
+sem tocar no `vectordb/` real).
+
+    python -m benchmarks.bench_ingest [--files N] [--output ingest.json]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app import ingest
+from app.config import settings
+
+from .common import emit, run_info
+
+
+def run(max_files: int = 0, parse_cache: bool = False) -> dict:
+    pdfs = ingest.list_pdfs()
+    names = sorted(pdfs)[:max_files] if max_files else sorted(pdfs)
+    paths = [pdfs[name] for name in names]
+
+    start = time.perf_counter()
+    hashes = {name: ingest.file_hash(pdfs[name]) for name in names}
+    hash_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    docs = ingest.load_documents(paths, use_cache=parse_cache)
+    parse_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = ingest.split_documents(docs)
+    split_s = time.perf_counter() - start
+
+    original_dir = settings.CHROMA_DB_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.CHROMA_DB_DIR = tmp
+        try:
+            start = time.perf_counter()
+            embeddings = ingest.get_embeddings()
+            model_s = time.perf_counter() - start
+
+            collection = ingest.get_collection(reset=True)
+            ids = [f"bench-{i}" for i in range(len(chunks))]
+            start = time.perf_counter()
+            ingest.upsert_chunks(collection, embeddings, chunks, ids)
+            embed_s = time.perf_counter() - start
+        finally:
+            settings.CHROMA_DB_DIR = original_dir
+
+    return {
+        "benchmark": "ingest",
+        "run": run_info(),
+        "files": len(names),
+        "parse_cache": parse_cache,
+        "bytes": sum(os.path.getsize(p) for p in paths),
+        "pages": len(docs),
+        "chunks": len(chunks),
+        "seconds": {
+            "hash": round(hash_s, 3),
+            "parse": round(parse_s, 3),
+            "split": round(split_s, 3),
+            "model_load": round(model_s, 3),
+            "embed_upsert": round(embed_s, 3),
+        },
+        "throughput": {
+            "parse_pages_per_s": round(len(docs) / parse_s, 2) if parse_s else None,
+            "split_chunks_per_s": round(len(chunks) / split_s, 2) if split_s else None,
+            "embed_chunks_per_s": round(len(chunks) / embed_s, 2) if embed_s else None,
+        },
+        "hashes": hashes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=0, help="Limitar a N PDFs (0 = todos).")
+    parser.add_argument(
+        "--parse-cache",
+        action="store_true",
+        help="Usar a cache de parsing (por omissão os PDFs são sempre lidos).",
+    )
+    parser.add_argument("--output", help="Ficheiro JSON de saída (por omissão, stdout).")
+    args = parser.parse_args()
+    emit(run(args.files, args.parse_cache), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark da recuperação: latência (embedding + pesquisa) em percentis e
+qualidade (recall@k e MRR) sobre o conjunto rotulado `questions.jsonl`.
+
+Um trecho é relevante se vier de um dos `expected_sources`; quando a pergunta
+tem `expected_pages`, mede-se também o recall ao nível da página.
+
+    python -m benchmarks.bench_retrieval [-k 4] [--repeat 3] [--output retrieval.json]
+"""
+import argparse
+import os
+import time
+
+# Mede sempre o modelo (com --repeat, a cache de embeddings esconderia o custo)
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+
+from app.retrieval import retrieval_engine  # noqa: E402
+
+from .common import emit, load_questions, percentiles, run_info  # noqa: E402
+
+
+def _source(doc) -> str:
+    return os.path.basename(str(doc.metadata.get("source", "")))
+
+
+def run(k: int = 4, repeat: int = 3) -> dict:
+    questions = load_questions()
+
+    start = time.perf_counter()
+    retrieval_engine.warm_up()
+    warm_up_s = time.perf_counter() - start
+
+    embed_times, search_times, total_times = [], [], []
+    source_hits, page_hits, page_total, reciprocal_ranks = 0, 0, 0, []
+    per_question = []
+
+    for q in questions:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            embedding = retrieval_engine.embed_query(q["question"])
+            t1 = time.perf_counter()
+            results = retrieval_engine.search(q["question"], embedding, k)
+            t2 = time.perf_counter()
+            embed_times.append(t1 - t0)
+            search_times.append(t2 - t1)
+            total_times.append(t2 - t0)
+
+        docs = [doc for doc, _ in results]
+        expected = set(q["expected_sources"])
+        ranks = [i for i, doc in enumerate(docs) if _source(doc) in expected]
+        hit = bool(ranks)
+        source_hits += hit
+        reciprocal_ranks.append(1.0 / (ranks[0] + 1) if hit else 0.0)
+
+        page_hit = None
+        if q.get("expected_pages"):
+            page_total += 1
+            page_hit = any(
+                doc.metadata.get("page") in q["expected_pages"].get(_source(doc), [])
+                for doc in docs
+            )
+            page_hits += page_hit
+
+        per_question.append(
+            {
+                "id": q["id"],
+                "source_hit": hit,
+                "page_hit": page_hit,
+                "retrieved": [[_source(d), d.metadata.get("page")] for d in docs],
+            }
+        )
+
+    n = len(questions)
+    return {
+        "benchmark": "retrieval",
+        "run": run_info(),
+        "k": k,
+        "mode": retrieval_engine.status()["mode"],
+        "questions": n,
+        "warm_up_s": round(warm_up_s, 3),
+        "latency_ms": {
+            "embed": percentiles(embed_times),
+            "search": percentiles(search_times),
+            "total": percentiles(total_times),
+        },
+        "quality": {
+            f"recall@{k}": round(source_hits / n, 4) if n else None,
+            f"page_recall@{k}": round(page_hits / page_total, 4) if page_total else None,
+            "mrr": round(sum(reciprocal_ranks) / n, 4) if n else None,
+        },
+        "per_question": per_question,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições por pergunta.")
+    parser.add_argument("--output", help="Ficheiro JSON de saída (por omissão, stdout).")
+    args = parser.parse_args()
+    emit(run(args.k, args.repeat), args.output)
+
+
+if __name__ == "__main__":
+    main()
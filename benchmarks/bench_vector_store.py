@@ -0,0 +1,141 @@
+"""
+Benchmark dos índices vetoriais: Chroma (HNSW) vs. índice compacto
+(float16 / int8, pesquisa exata ou IVF), com os mesmos trechos e embeddings.
+
+Para cada pergunta de `questions.jsonl` mede a latência da pesquisa e o
+recall@k face à pesquisa exata em float32 (força bruta). Os índices
+compactos são construídos numa pasta temporária a partir da coleção.
+
+    python -m benchmarks.bench_vector_store [-k 4] [--repeat 5] [--output vectors.json]
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+os.environ.setdefault("VECTOR_STORE", "chroma")
+
+from app.config_agent import agent_settings  # noqa: E402
+from app.retrieval import retrieval_engine  # noqa: E402
+from app.vector_index import VectorIndex, build_vector_index  # noqa: E402
+
+from .common import emit, load_questions, percentiles, run_info  # noqa: E402
+
+# Pastas do build do índice que não fazem parte do Chroma
+_OWN_DIRS = (
+    agent_settings.LEXICAL_INDEX_DIR,
+    agent_settings.VECTOR_INDEX_DIR,
+    agent_settings.FAQ_DIR,
+)
+
+
+def _dir_size(path: str, skip=()) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        if root == path:
+            dirs[:] = [d for d in dirs if d not in skip]
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def _collection_data(collection, batch: int = 1000):
+    ids, texts, metadatas, vectors = [], [], [], []
+    for offset in range(0, collection.count(), batch):
+        page = collection.get(
+            limit=batch, offset=offset, include=["embeddings", "documents", "metadatas"]
+        )
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+    return ids, texts, metadatas, np.concatenate(vectors)
+
+
+def _measure(search, queries, truth, k: int, repeat: int) -> dict:
+    times, recalls = [], []
+    for query, expected in zip(queries, truth):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = search(query)
+            times.append(time.perf_counter() - start)
+        recalls.append(len(set(found[:k]) & expected) / len(expected))
+    return {
+        "latency_ms": percentiles(times),
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+    }
+
+
+def run(k: int = 4, repeat: int = 5) -> dict:
+    questions = [q["question"] for q in load_questions()]
+    retrieval_engine.warm_up()
+    collection = retrieval_engine.vectordb._collection
+    ids, texts, metadatas, vectors = _collection_data(collection)
+    queries = retrieval_engine.embed_documents(questions)
+
+    # Verdade: pesquisa exata em float32
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    truth = [
+        {ids[i] for i in np.argsort(-(normalized @ np.asarray(q, dtype=np.float32)))[:k]}
+        for q in queries
+    ]
+
+    def chroma_search(query):
+        result = collection.query(query_embeddings=[query], n_results=k, include=[])
+        return result["ids"][0]
+
+    stores = {
+        "chroma_hnsw": dict(
+            _measure(chroma_search, queries, truth, k, repeat),
+            disk_bytes=_dir_size(retrieval_engine.state.path, skip=_OWN_DIRS),
+        )
+    }
+
+    n_lists = max(1, int(math.sqrt(len(ids))))
+    variants = [
+        ("float16", "float16", 0, None),
+        ("int8", "int8", 0, None),
+        (f"float16_ivf{n_lists}_probe8", "float16", n_lists, 8),
+        (f"int8_ivf{n_lists}_probe8", "int8", n_lists, 8),
+        (f"int8_ivf{n_lists}_probe16", "int8", n_lists, 16),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, dtype, lists, n_probe in variants:
+            path = os.path.join(tmp, f"{dtype}-{lists}")
+            if not os.path.exists(path):
+                build_vector_index(ids, vectors, texts, metadatas, path, dtype=dtype, n_lists=lists)
+            index = VectorIndex.load(path, n_probe=n_probe or 8)
+
+            def compact_search(query, index=index):
+                return [index.ids[row] for row, _ in index.search(query, k)]
+
+            stores[name] = dict(
+                _measure(compact_search, queries, truth, k, repeat),
+                disk_bytes=_dir_size(path),
+            )
+
+    return {
+        "benchmark": "vector_store",
+        "run": run_info(),
+        "k": k,
+        "chunks": len(ids),
+        "dimensions": int(vectors.shape[1]),
+        "questions": len(questions),
+        "stores": stores,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5, help="Repetições por pergunta.")
+    parser.add_argument("--output", help="Ficheiro JSON de saída (por omissão, stdout).")
+    args = parser.parse_args()
+    emit(run(args.k, args.repeat), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(__file__)
+QUESTIONS_FILE = os.path.join(BENCH_DIR, "questions.jsonl")
+
+
+def load_questions(path: str = QUESTIONS_FILE) -> List[dict]:
+    """Perguntas rotuladas: `expected_sources` e, opcionalmente, `expected_pages`."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentiles(values: List[float], scale: float = 1000.0) -> Dict[str, float]:
+    """p50 / p90 / p95 / p99 / média / máximo (por omissão em milissegundos)."""
+    if not values:
+        return {}
+    arr = np.asarray(values, dtype=np.float64) * scale
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p90": round(float(np.percentile(arr, 90)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "mean": round(float(arr.mean()), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def run_info() -> dict:
+    """Contexto da execução, para comparar resultados entre commits."""
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def emit(result: dict, output: Optional[str] = None) -> None:
+    """Escreve o resultado em JSON (ficheiro ou stdout)."""
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,93 @@
+"""
+Corre os benchmarks e junta os resultados num único JSON. Com --baseline,
+compara com uma execução anterior e termina com código 1 se alguma métrica
+piorar mais do que a tolerância (para apanhar regressões antes do deploy).
+
+    python -m benchmarks.run_all --output bench.json [--with-ingest] [--with-coldstart]
+    python -m benchmarks.run_all --output new.json --baseline bench.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from . import bench_chat, bench_retrieval
+from .common import emit, run_info
+
+# (caminho no JSON, True se "maior é melhor")
+TRACKED = [
+    (("retrieval", "latency_ms", "total", "p50"), False),
+    (("retrieval", "latency_ms", "total", "p95"), False),
+    (("retrieval", "quality", "recall@4"), True),
+    (("retrieval", "quality", "mrr"), True),
+    (("chat", "throughput_rps"), True),
+    (("chat", "latency_ms", "p50"), False),
+    (("chat", "latency_ms", "p95"), False),
+    (("ingest", "throughput", "parse_pages_per_s"), True),
+    (("ingest", "throughput", "embed_chunks_per_s"), True),
+    (("coldstart", "latency_ms", "import", "p50"), False),
+    (("coldstart", "latency_ms", "process_total", "p50"), False),
+]
+
+
+def _get(data: dict, path: tuple):
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Lista de regressões: métricas que pioraram mais do que `tolerance` (fração)."""
+    regressions = []
+    for path, higher_is_better in TRACKED:
+        new, old = _get(current, path), _get(baseline, path)
+        if new is None or old is None or old == 0:
+            continue
+        change = (new - old) / abs(old)
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressions.append(
+                {"metric": ".".join(path), "baseline": old, "current": new, "change": round(change, 4)}
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", help="Ficheiro JSON de saída (por omissão, stdout).")
+    parser.add_argument("--with-ingest", action="store_true", help="Incluir o benchmark de ingestão.")
+    parser.add_argument(
+        "--with-coldstart", action="store_true", help="Incluir o benchmark de arranque a frio."
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--baseline", help="JSON de uma execução anterior.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = {"run": run_info()}
+    if args.with_ingest:
+        from . import bench_ingest
+
+        result["ingest"] = bench_ingest.run()
+    if args.with_coldstart:
+        from . import bench_coldstart
+
+        result["coldstart"] = bench_coldstart.run()
+    result["retrieval"] = bench_retrieval.run()
+    result["chat"] = asyncio.run(bench_chat.run(args.requests, args.concurrency))
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["regressions"] = compare(result, json.load(f), args.tolerance)
+        exit_code = 1 if result["regressions"] else 0
+
+    emit(result, args.output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Modo multi-worker: gunicorn + workers uvicorn, com o modelo carregado UMA vez.
+
+    gunicorn app.api:app -c gunicorn.conf.py
+
+Com preload_app, a app é importada no processo mestre e o modelo de embeddings
+(e o cross-encoder, se ativo) é carregado antes do fork: os workers partilham
+os pesos copy-on-write em vez de cada um ter a sua cópia. O índice lexical e a
+cache de embeddings estão em memory-map (partilhados pela page cache). A coleção
+Chroma é aberta em cada worker depois do fork (SQLite e threads não sobrevivem
+a um fork).
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    """No mestre, depois de importar a app e antes de criar os workers."""
+    from app.config_agent import agent_settings
+    from app.rerank import reranker
+    from app.retrieval import retrieval_engine
+
+    # O ONNX Runtime cria threads ao abrir a sessão: não pode ser carregado antes do fork
+    if agent_settings.EMBEDDING_BACKEND == "torch":
+        retrieval_engine.preload()
+    if reranker is not None:
+        reranker.warm_up()
+
+    # Objetos já criados deixam de ser visitados pelo GC (que, ao marcá-los,
+    # copiaria as páginas partilhadas para cada worker)
+    gc.collect()
+    gc.freeze()
+    server.log.info("Modelos carregados no mestre; a criar %s workers.", workers)
+
+
+def post_fork(server, worker):
+    """Cada worker usa só a sua parte dos CPUs (evita threads a mais no PyTorch)."""
+    threads = max(1, multiprocessing.cpu_count() // workers)
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
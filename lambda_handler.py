@@ -1,5 +1,34 @@
+# Primeiro import: marca o início dos tempos de arranque (ver /health -> startup)
+from app.startup import startup_report
+
 from mangum import Mangum
 from app.api import app
+from app.config_agent import agent_settings
+from app.llm import llm_client
+from app.rerank import reranker
+from app.retrieval import retrieval_engine
+
+# Carregar modelo + índice durante a fase de init da Lambda (e não no 1.º pedido).
+# Com SnapStart, o snapshot já inclui o modelo em memória.
+if agent_settings.WARM_UP_ON_STARTUP:
+    try:
+        retrieval_engine.warm_up()
+        if reranker is not None:
+            reranker.warm_up()
+    except Exception as e:
+        print(f"⚠️ [lambda] Falha ao carregar o motor de recuperação: {e}")
+
+try:
+    from snapshot_restore_py import register_after_restore
+
+    # As ligações HTTP guardadas no snapshot já não existem depois do restore
+    register_after_restore(llm_client.reset)
+except ImportError:
+    pass
+
+startup_report.mark("handler_ready")
 
-# Este é o handler que a AWS Lambda vai chamar
-handler = Mangum(app)
+# Este é o handler que a AWS Lambda vai chamar.
+# lifespan="off": o warm-up já foi feito acima e o shutdown da API (que fecha
+# o pool de ligações do LLM) não deve correr no fim de cada invocação.
+handler = Mangum(app, lifespan="off")
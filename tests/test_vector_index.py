@@ -0,0 +1,108 @@
+"""
+Índice vetorial compacto (app.vector_index): recall face à pesquisa exata em
+float32, para as partes mais fáceis de partir sem dar por isso (a escala do
+int8 aplicada à pergunta e os intervalos das listas IVF). Só precisa de NumPy.
+
+    python -m pytest tests
+"""
+import numpy as np
+import pytest
+
+from app.vector_index import VectorIndex, VectorIndexBuilder, build_vector_index
+
+K = 10
+
+
+def _corpus(n: int = 2000, dims: int = 64, clusters: int = 20, seed: int = 0):
+    """Vetores agrupados (como embeddings reais), com escalas diferentes por dimensão."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dims))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dims))
+    vectors *= rng.uniform(0.2, 3.0, size=dims)
+    queries = centers[rng.integers(clusters, size=50)] + 0.3 * rng.normal(size=(50, dims))
+    ids = [f"c{i}" for i in range(n)]
+    metadatas = [{"language": "pt" if i % 2 else "en", "i": i} for i in range(n)]
+    return ids, vectors.astype(np.float32), queries.astype(np.float32), metadatas
+
+
+def _recall(index: VectorIndex, ids, vectors, queries) -> float:
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    found = 0
+    for query in queries:
+        truth = {ids[i] for i in np.argsort(-(normalized @ query))[:K]}
+        found += len(truth & {index.ids[row] for row, _ in index.search(query, K)})
+    return found / (K * len(queries))
+
+
+@pytest.mark.parametrize(
+    "dtype, n_lists, n_probe, minimum",
+    [
+        ("float32", 0, 8, 1.0),
+        ("float16", 0, 8, 0.99),
+        ("int8", 0, 8, 0.9),
+        ("float16", 40, 40, 0.99),  # todas as listas: tem de igualar a pesquisa exata
+        ("int8", 40, 10, 0.85),
+    ],
+)
+def test_recall_vs_exact_search(tmp_path, dtype, n_lists, n_probe, minimum):
+    ids, vectors, queries, metadatas = _corpus()
+    path = str(tmp_path / "index")
+    build_vector_index(
+        ids, vectors, [""] * len(ids), metadatas, path, dtype=dtype, n_lists=n_lists
+    )
+    index = VectorIndex.load(path, n_probe=n_probe)
+    assert _recall(index, ids, vectors, queries) >= minimum
+
+
+def test_ivf_lists_cover_every_row_once(tmp_path):
+    ids, vectors, _, metadatas = _corpus()
+    path = str(tmp_path / "index")
+    build_vector_index(ids, vectors, [""] * len(ids), metadatas, path, n_lists=40)
+    index = VectorIndex.load(path, n_probe=40)
+    lists = index._lists
+    assert lists[0] == 0 and lists[-1] == len(ids)
+    assert np.all(np.diff(lists) >= 0)
+    # Cada linha está na lista do centróide mais próximo
+    rows = np.asarray(index._vectors, dtype=np.float32)
+    assign = np.argmax(rows @ index._centroids.T, axis=1)
+    for c in range(len(lists) - 1):
+        assert np.all(assign[lists[c]:lists[c + 1]] == c)
+
+
+def test_records_and_language_filter(tmp_path):
+    ids, vectors, queries, metadatas = _corpus(n=300)
+    texts = [f"texto {i}" for i in range(len(ids))]
+    path = str(tmp_path / "index")
+    build_vector_index(ids, vectors, texts, metadatas, path, dtype="int8", n_lists=8)
+    index = VectorIndex.load(path)
+    for row, _ in index.search(queries[0], K, languages=["pt"]):
+        id_, text, metadata = index.record(row)
+        assert metadata["language"] == "pt"
+        assert text == f"texto {metadata['i']}" and id_ == f"c{metadata['i']}"
+
+
+def test_empty_index(tmp_path):
+    path = str(tmp_path / "index")
+    build_vector_index([], np.zeros((0, 8), dtype=np.float32), [], [], path)
+    index = VectorIndex.load(path)
+    assert len(index) == 0
+    assert index.search(np.ones(8), K) == []
+
+
+@pytest.mark.parametrize("dtype, n_lists", [("float16", 0), ("int8", 8)])
+def test_paged_build_matches_single_page(tmp_path, dtype, n_lists):
+    ids, vectors, queries, metadatas = _corpus(n=500)
+    texts = [f"texto {i}" for i in range(len(ids))]
+    single = str(tmp_path / "single")
+    build_vector_index(ids, vectors, texts, metadatas, single, dtype=dtype, n_lists=n_lists)
+    paged = str(tmp_path / "paged")
+    builder = VectorIndexBuilder(paged, len(ids), dtype=dtype, n_lists=n_lists)
+    for start in range(0, len(ids), 64):
+        end = start + 64
+        builder.add(ids[start:end], vectors[start:end], texts[start:end], metadatas[start:end])
+    builder.finish()
+    a, b = VectorIndex.load(single), VectorIndex.load(paged)
+    assert a.ids == b.ids and a.languages == b.languages
+    assert np.array_equal(a._vectors, b._vectors)
+    assert [a.record(row) for row in range(len(a))] == [b.record(row) for row in range(len(b))]
+    assert a.search(queries[0], K, languages=["pt"]) == b.search(queries[0], K, languages=["pt"])